@@ -0,0 +1,379 @@
+"""Benchmarks del sistema de archivos FAT.
+
+Cada benchmark trabaja sobre un directorio temporal y nunca toca data/.
+
+Uso:
+    python benchmark.py block-sizes [--size 1000000] [--mode json|segment]
+    python benchmark.py codecs [--size 1000000] [--block-size 4096] [--mode json|segment]
+    python benchmark.py backends [--files 500] [--size 2000]
+    python benchmark.py stress [--processes 4] [--operations 100] [--mode json|segment|extent|sqlite] [--no-lock]
+    python benchmark.py table-formats [--sizes 10000 100000 1000000]
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from block_manager import BlockManager
+from block_codecs import CODECS
+from fat_system import FATFileSystem
+from fat_table_manager import FATTableManager
+from fat_binary import encode_table
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _sample_text(size):
+    line = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Ñandú 123\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def bench_block_sizes(args):
+    """Throughput de escritura/lectura para distintos tamaños de bloque"""
+    content = _sample_text(args.size)
+    sizes = [20, 64, 256, 1024, 4096, 16384, 65536]
+    auto_size = BlockManager.choose_block_size(len(content))
+    if auto_size not in sizes:
+        sizes.append(auto_size)
+        sizes.sort()
+
+    mb = len(content.encode('utf-8')) / 1024 / 1024
+    print(f"Contenido: {len(content)} caracteres • modo: {args.mode} • auto: {auto_size}")
+    print(f"{'bloque':>8} {'bloques':>8} {'escritura MB/s':>15} {'lectura MB/s':>13}")
+
+    for block_size in sizes:
+        work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+        try:
+            block_manager = BlockManager(work_dir, args.mode)
+            chain, write_time = _timed(block_manager.create_blocks_bulk, content, block_size)
+            read_content, read_time = _timed(block_manager.read_blocks, chain[0])
+            assert read_content == content
+            block_manager.close()
+            marker = " *" if block_size == auto_size else ""
+            print(f"{block_size:>8} {len(chain):>8} {mb / write_time:>15.2f} {mb / read_time:>13.2f}{marker}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _disk_usage(directory):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(directory) for name in files)
+
+
+def _sample_base64(size):
+    """Base64 de un binario mitad aleatorio, mitad repetitivo (como una imagen BMP)"""
+    raw_size = size * 3 // 4
+    rng = random.Random(42)
+    raw = bytes(rng.getrandbits(8) for _ in range(raw_size // 2)) + bytes(range(256)) * (raw_size // 512 + 1)
+    return base64.b64encode(raw[:raw_size]).decode('ascii')[:size]
+
+
+def bench_codecs(args):
+    """Bytes en disco y latencia de escritura/lectura por códec"""
+    payloads = [("texto", _sample_text(args.size)), ("base64", _sample_base64(args.size))]
+    print(f"Tamaño de bloque: {args.block_size} • modo: {args.mode}")
+    print(f"{'contenido':>10} {'códec':>6} {'bytes en disco':>15} {'ratio':>6} {'escritura ms':>13} {'lectura ms':>11}")
+
+    for label, content in payloads:
+        raw_bytes = len(content.encode('utf-8'))
+        for codec in CODECS:
+            work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+            try:
+                block_manager = BlockManager(work_dir, args.mode)
+                auto_codec = block_manager.choose_codec(content, args.block_size)
+                chain, write_time = _timed(block_manager.create_blocks_bulk, content, args.block_size, codec)
+                read_content, read_time = _timed(block_manager.read_blocks, chain[0])
+                assert read_content == content
+                block_manager.close()
+                disk = _disk_usage(work_dir)
+                marker = " *" if codec == auto_codec else ""
+                print(f"{label:>10} {codec:>6} {disk:>15} {disk / raw_bytes:>6.2f} "
+                      f"{write_time * 1000:>13.1f} {read_time * 1000:>11.1f}{marker}")
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _backend_workload(files, size):
+    """Tiempos de crear, abrir, listar y modificar archivos en el volumen actual"""
+    system = FATFileSystem()
+    system.initialize_system()
+    names = [f"archivo_{i:06d}.txt" for i in range(files)]
+    content = _sample_text(size)
+    times = {}
+    _, times['crear'] = _timed(lambda: [system.create_file(name, content, "bench") for name in names])
+    _, times['abrir'] = _timed(lambda: [system.open_file(name, "bench") for name in names])
+    _, times['listar'] = _timed(lambda: [system.list_files() for _ in range(20)])
+    _, times['modificar'] = _timed(lambda: [system.modify_file(name, content[::-1], "bench") for name in names])
+    system.close()
+    return times
+
+
+def bench_backends(args):
+    """Compara los backends de metadatos y bloques en operaciones típicas"""
+    combinations = [('json', 'json'), ('json', 'segment'), ('sharded', 'segment'), ('sqlite', 'sqlite')]
+    print(f"Archivos: {args.files} • tamaño: {args.size} caracteres (listar: 20 veces)")
+    print(f"{'metadatos':>10} {'bloques':>8} {'crear s':>8} {'abrir s':>8} {'listar s':>9} {'modificar s':>12} {'disco KB':>9} {'compactado KB':>14}")
+
+    original_dir = os.getcwd()
+    for metadata_backend, storage_mode in combinations:
+        work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+        try:
+            # FATFileSystem trabaja sobre data/ relativo al directorio actual
+            os.chdir(work_dir)
+            config = FATFileSystem()
+            config.save_config(metadata_backend=metadata_backend, storage_mode=storage_mode)
+            times = _backend_workload(args.files, args.size)
+            disk = _disk_usage(os.path.join(work_dir, "data"))
+            # Los segmentos conservan las versiones viejas de los bloques hasta compactarlos
+            compacted = "-"
+            if storage_mode == 'segment':
+                system = FATFileSystem()
+                system.compact_segments()
+                system.close()
+                compacted = f"{_disk_usage(os.path.join(work_dir, 'data')) / 1024:.0f}"
+            print(f"{metadata_backend:>10} {storage_mode:>8} {times['crear']:>8.2f} {times['abrir']:>8.2f} "
+                  f"{times['listar']:>9.2f} {times['modificar']:>12.2f} {disk / 1024:>9.0f} {compacted:>14}")
+        finally:
+            os.chdir(original_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# Reintentos por operación antes de darla por perdida (evita ciclos sin bloqueo)
+STRESS_MAX_RETRIES = 1000
+
+
+def _stress_worker(work_dir, worker, operations, results):
+    """Proceso del stress test: crea sus archivos e incrementa un contador compartido"""
+    os.chdir(work_dir)
+    system = FATFileSystem()
+    retries = 0
+    try:
+        for i in range(operations):
+            system.create_file(f"p{worker}_{i:05d}.txt", f"proceso {worker} operación {i}", "bench")
+            system.append_file("registro.txt", f"{worker}:{i}\n", "bench")
+            # Lectura-modificación-escritura optimista: reintentar si otro proceso ganó
+            for _ in range(STRESS_MAX_RETRIES):
+                file_info, content = system.open_file("contador.txt", "bench")
+                if system.modify_file("contador.txt", str(int(content) + 1), "bench", file_info.get('version', 0)):
+                    break
+                retries += 1
+        system.close()
+    except Exception as e:
+        # Sin bloqueo el volumen puede quedar inconsistente; se informa en lugar de colgarse
+        print(f"Proceso {worker}: {type(e).__name__}: {e}")
+    results.put(retries)
+
+
+def bench_stress(args):
+    """Varios procesos modificando el mismo volumen a la vez"""
+    work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+    original_dir = os.getcwd()
+    try:
+        os.chdir(work_dir)
+        system = FATFileSystem()
+        system.save_config(storage_mode=args.mode, metadata_backend='sqlite' if args.mode == 'sqlite' else 'json',
+                           fat_locking=not args.no_lock)
+        system = FATFileSystem()
+        system.initialize_system()
+        system.create_file("contador.txt", "0", "bench")
+        system.create_file("registro.txt", "", "bench")
+        system.close()
+
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_stress_worker, args=(work_dir, worker, args.operations, results))
+                   for worker in range(args.processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        retries = sum(results.get() for _ in workers)
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        system = FATFileSystem()
+        total = args.processes * args.operations
+        try:
+            _, counter = system.open_file("contador.txt", "bench")
+            _, log = system.open_file("registro.txt", "bench")
+        except Exception as e:
+            print(f"No se pudo leer el volumen: {type(e).__name__}: {e}")
+            counter, log = None, ""
+        created = sum(1 for info in system.list_files() if info['filename'].startswith("p"))
+        system.close()
+
+        print(f"Procesos: {args.processes} • operaciones por proceso: {args.operations} • modo: {args.mode} "
+              f"• bloqueo: {'no' if args.no_lock else 'sí'}")
+        print(f"Tiempo: {elapsed:.2f} s • {3 * total / elapsed:.0f} operaciones/s • reintentos por conflicto: {retries}")
+        print(f"Archivos creados: {created}/{total} • contador: {counter}/{total} "
+              f"• líneas del registro: {len(log.splitlines())}/{total}")
+        ok = created == total and counter == str(total) and len(log.splitlines()) == total
+        print("Resultado: " + ("sin cambios perdidos" if ok else "SE PERDIERON CAMBIOS"))
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.mode != 'sqlite':
+        _stress_group_commit(args)
+
+
+# Hilos y archivos por hilo de la comprobación del commit en grupo
+STRESS_GROUP_THREADS = 8
+STRESS_GROUP_FILES = 20
+
+
+def _stress_group_commit(args):
+    """Varios hilos de un proceso creando archivos con la política group.
+
+    Cada hilo espera su commit sin el bloqueo del volumen, así que la tabla
+    FAT debe escribirse muchas menos veces que la cantidad de cambios.
+    """
+    work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+    original_dir = os.getcwd()
+    try:
+        os.chdir(work_dir)
+        FATFileSystem().save_config(storage_mode=args.mode, fat_write_policy='group', fat_locking=not args.no_lock)
+        system = FATFileSystem()
+        system.initialize_system()
+        writes_before = system.fat_table_manager.disk_writes
+
+        def create_files(thread):
+            for i in range(STRESS_GROUP_FILES):
+                system.create_file(f"h{thread}_{i:03d}.txt", f"hilo {thread} archivo {i}", "bench")
+
+        threads = [threading.Thread(target=create_files, args=(thread,)) for thread in range(STRESS_GROUP_THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        writes = system.fat_table_manager.disk_writes - writes_before
+        created = len(system.list_files())
+        system.close()
+
+        total = STRESS_GROUP_THREADS * STRESS_GROUP_FILES
+        print(f"Commit en grupo: {STRESS_GROUP_THREADS} hilos • {created}/{total} archivos • "
+              f"{writes} escrituras de la tabla FAT • {elapsed:.2f} s")
+        print("Resultado: " + ("la política group agrupa los cambios" if created == total and writes < total
+                               else "LA POLÍTICA GROUP NO AGRUPA LOS CAMBIOS"))
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _sample_fat_table(entries):
+    """Tabla FAT sintética con la forma de las entradas que crea create_file"""
+    rng = random.Random(42)
+    owners = [f"usuario{i}" for i in range(20)]
+    start = datetime(2024, 1, 1)
+    fat_table = {}
+    for i in range(entries):
+        filename = f"archivo_{i:07d}.txt"
+        owner = rng.choice(owners)
+        date = (start + timedelta(seconds=rng.randrange(10 ** 8), microseconds=rng.randrange(10 ** 6))).isoformat()
+        blocks = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(rng.randint(1, 3))]
+        permissions = {owner: ['read', 'write']}
+        if rng.random() < 0.2:
+            permissions[rng.choice(owners)] = ['read']
+        in_recycle_bin = rng.random() < 0.05
+        fat_table[filename] = {
+            'filename': filename,
+            'initial_block': blocks[0],
+            'block_size': 4096,
+            'codec': 'none',
+            'in_recycle_bin': in_recycle_bin,
+            'total_chars': rng.randrange(10 ** 6),
+            'creation_date': date,
+            'modification_date': date,
+            'deletion_date': date if in_recycle_bin else None,
+            'owner': owner,
+            'is_binary': False,
+            'is_large_file': False,
+            'permissions': permissions,
+            'block_list': blocks,
+            'version': rng.randint(1, 10)
+        }
+    return fat_table
+
+
+def bench_table_formats(args):
+    """Tamaño y tiempo de carga de la tabla FAT en JSON y en formato binario"""
+    print(f"{'entradas':>9} {'formato':>8} {'disco MB':>9} {'cargar s':>9} {'cargar+buscar s':>16} "
+          f"{'listar dueño s':>15} {'recorrer s':>11}")
+    for entries in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix="fat_bench_")
+        try:
+            fat_table = _sample_fat_table(entries)
+            target = f"archivo_{entries // 2:07d}.txt"
+            paths = {'json': os.path.join(work_dir, "fat_table.json"), 'binary': os.path.join(work_dir, "fat_table.bin")}
+            with open(paths['json'], 'w', encoding='utf-8') as f:
+                json.dump(fat_table, f, indent=2, ensure_ascii=False)
+            with open(paths['binary'], 'wb') as f:
+                f.write(encode_table(fat_table))
+            del fat_table
+
+            for table_format, path in paths.items():
+                def manager():
+                    return FATTableManager(path, use_journal=False, table_format=table_format)
+
+                _, load_time = _timed(lambda: manager().load())
+                _, lookup_time = _timed(lambda: manager().load()[target])
+                # La primera consulta por dueño arma los índices secundarios de toda la tabla
+                loaded = manager()
+                _, owner_time = _timed(lambda: (loaded.load(), loaded.index.owned_by("usuario0")))
+                _, scan_time = _timed(lambda: sum(len(entry) for entry in loaded.load().values()))
+                print(f"{entries:>9} {table_format:>8} {os.path.getsize(path) / 1024 / 1024:>9.1f} {load_time:>9.3f} "
+                      f"{lookup_time:>16.3f} {owner_time:>15.3f} {scan_time:>11.3f}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema de archivos FAT")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    block_sizes = subparsers.add_parser("block-sizes", help="Throughput según el tamaño de bloque")
+    block_sizes.add_argument("--size", type=int, default=1000000, help="Caracteres de contenido")
+    block_sizes.add_argument("--mode", choices=["json", "segment"], default="segment")
+    block_sizes.set_defaults(func=bench_block_sizes)
+
+    codecs = subparsers.add_parser("codecs", help="Compresión de bloques por códec")
+    codecs.add_argument("--size", type=int, default=1000000, help="Caracteres de contenido")
+    codecs.add_argument("--block-size", type=int, default=4096)
+    codecs.add_argument("--mode", choices=["json", "segment"], default="segment")
+    codecs.set_defaults(func=bench_codecs)
+
+    backends = subparsers.add_parser("backends", help="Backends JSON frente a SQLite")
+    backends.add_argument("--files", type=int, default=500, help="Cantidad de archivos")
+    backends.add_argument("--size", type=int, default=2000, help="Caracteres por archivo")
+    backends.set_defaults(func=bench_backends)
+
+    stress = subparsers.add_parser("stress", help="Varios procesos sobre el mismo volumen")
+    stress.add_argument("--processes", type=int, default=4)
+    stress.add_argument("--operations", type=int, default=100, help="Operaciones por proceso")
+    stress.add_argument("--mode", choices=["json", "segment", "extent", "sqlite"], default="json")
+    stress.add_argument("--no-lock", action="store_true", help="Desactivar el bloqueo entre procesos")
+    stress.set_defaults(func=bench_stress)
+
+    table_formats = subparsers.add_parser("table-formats", help="Tabla FAT en JSON frente al formato binario")
+    table_formats.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                               help="Cantidades de entradas")
+    table_formats.set_defaults(func=bench_table_formats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import bz2
+import lzma
+import zlib
+
+# Nombre del códec -> (id guardado en las banderas del bloque, compresor, descompresor)
+CODECS = {
+    'none': (0, None, None),
+    'zlib': (1, lambda raw: zlib.compress(raw, 6), zlib.decompress),
+    'bz2': (2, lambda raw: bz2.compress(raw, 9), bz2.decompress),
+    'lzma': (3, lambda raw: lzma.compress(raw, preset=6), lzma.decompress),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+# Parámetros del muestreo para elegir el códec automáticamente
+SAMPLE_BLOCKS = 4
+MIN_SAMPLE_CHARS = 256
+# Ahorro mínimo (fracción) para que valga la pena comprimir
+MIN_SAVINGS = 0.10
+# Ventaja extra que deben dar bz2/lzma sobre zlib para compensar su lentitud
+SLOW_CODEC_MARGIN = 0.10
+
+
+def encode_payload(text, codec):
+    """Convierte el texto de un bloque en bytes usando el códec indicado"""
+    raw = text.encode('utf-8')
+    compress = CODECS[codec][1]
+    return compress(raw) if compress else raw
+
+
+def decode_payload(payload, codec):
+    """Operación inversa de encode_payload"""
+    decompress = CODECS[codec][2]
+    raw = decompress(payload) if decompress else payload
+    return bytes(raw).decode('utf-8')
+
+
+def choose_codec(content, block_size, overhead=1.0):
+    """Elige un códec comprimiendo individualmente los primeros bloques del contenido.
+
+    overhead multiplica el tamaño comprimido para reflejar cómo se guarda
+    (por ejemplo 4/3 cuando el almacenamiento lo codifica en base64).
+    """
+    samples = [content[i:i + block_size]
+               for i in range(0, min(len(content), block_size * SAMPLE_BLOCKS), block_size)]
+    raw_size = sum(len(sample.encode('utf-8')) for sample in samples)
+    if raw_size < MIN_SAMPLE_CHARS:
+        return 'none'
+
+    sizes = {codec: overhead * sum(len(encode_payload(sample, codec)) for sample in samples)
+             for codec in ('zlib', 'bz2', 'lzma')}
+    if sizes['zlib'] > raw_size * (1 - MIN_SAVINGS):
+        best = min(sizes, key=sizes.get)
+        return best if sizes[best] <= raw_size * (1 - MIN_SAVINGS) else 'none'
+
+    slow_best = min(('bz2', 'lzma'), key=sizes.get)
+    if sizes[slow_best] <= sizes['zlib'] * (1 - SLOW_CODEC_MARGIN):
+        return slow_best
+    return 'zlib'
@@ -1,86 +1,383 @@
 import os
 import json
 import uuid
+import struct
+import hashlib
+import threading
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from segment_store import SegmentStore
+from sqlite_store import SQLiteBlockStore
+from extent_store import ExtentStore
+from cluster_table import ClusterTable
+from file_lock import file_signature
+from block_codecs import CODECS, CODEC_NAMES, encode_payload, decode_payload, choose_codec
+
+# Cabecera de un bloque binario (segmentos y SQLite): banderas, longitud de next_block
+_BLOCK_HEADER = struct.Struct('<BH')
+_FLAG_EOF = 0x01
+# El contenido del bloque es una referencia (hash) a un objeto deduplicado
+_FLAG_REF = 0x02
+# Bits 2-3: códec de compresión del contenido
+_CODEC_SHIFT = 2
+_CODEC_MASK = 0x03
+# next_block es un número de bloque (ids numéricos) y no un uuid
+_FLAG_NUMERIC_NEXT = 0x10
+
+# Tamaño histórico de bloque, usado por las entradas FAT que no lo registran
+DEFAULT_BLOCK_SIZE = 20
+MIN_AUTO_BLOCK_SIZE = 64
+MAX_AUTO_BLOCK_SIZE = 64 * 1024
+# Cantidad aproximada de bloques por archivo al elegir el tamaño automáticamente
+AUTO_BLOCKS_PER_FILE = 64
+# A partir de cuántos bloques vale la pena leer en paralelo
+PARALLEL_READ_THRESHOLD = 8
+# Máximo de extents por archivo antes de reubicarlo en un único tramo
+MAX_EXTENTS_PER_FILE = 8
+# Prefijo de los ids de blobs (binarios pequeños guardados como un único registro de bytes)
+BLOB_PREFIX = 'blob_'
 
 class BlockManager:
-    def __init__(self, blocks_dir):
+    def __init__(self, blocks_dir, storage_mode='json', dedup=False, id_mode='uuid'):
         self.blocks_dir = blocks_dir
+        self.storage_mode = storage_mode
+        self.dedup = dedup
+        self.id_mode = id_mode
+        self.objects_dir = os.path.join(blocks_dir, "objects")
+        self.refs_path = os.path.join(blocks_dir, "dedup_refs.json")
+        self.blobs_dir = os.path.join(blocks_dir, "blobs")
         os.makedirs(blocks_dir, exist_ok=True)
+        # Almacén de registros binarios (segmentos o SQLite); None en modo json
+        self.record_store = self._open_record_store(storage_mode)
+        self.extent_store = None
+        self._executor = None
+        if storage_mode == 'extent':
+            self.extent_store = ExtentStore(os.path.join(blocks_dir, "extents"))
+        # La tabla de clusters se carga también si quedan cadenas numéricas de antes
+        self.cluster_table = None
+        cluster_table_path = os.path.join(blocks_dir, "cluster_table.bin")
+        if id_mode == 'numeric' or os.path.exists(cluster_table_path):
+            self.cluster_table = ClusterTable(cluster_table_path)
+        self._refs_lock = threading.RLock()
+        self._refs_dirty = False
+        self._load_refs()
     
-    def create_blocks(self, content):
-        """Divide el contenido en bloques de 20 caracteres y los guarda"""
-        if content is None:
-            return None
+    def _open_record_store(self, storage_mode):
+        if storage_mode == 'segment':
+            return SegmentStore(os.path.join(self.blocks_dir, "segments"))
+        if storage_mode == 'sqlite':
+            return SQLiteBlockStore(os.path.join(self.blocks_dir, "blocks.db"))
+        return None
+    
+    def _block_path(self, block_id):
+        return os.path.join(self.blocks_dir, f"{block_id}.json")
+    
+    @staticmethod
+    def _encode_block(block_data):
+        """Serializa un bloque al formato binario (segmentos y SQLite)"""
+        next_block = block_data['next_block']
+        codec = block_data.get('codec', 'none')
+        flags = _FLAG_EOF if block_data['eof'] else 0
+        flags |= CODECS[codec][0] << _CODEC_SHIFT
+        if isinstance(next_block, int):
+            flags |= _FLAG_NUMERIC_NEXT
+        next_block = str(next_block).encode('ascii') if next_block is not None else b''
+        if 'data_ref' in block_data:
+            flags |= _FLAG_REF
+            payload = block_data['data_ref'].encode('ascii')
+        else:
+            payload = encode_payload(block_data['data'], codec)
+        return _BLOCK_HEADER.pack(flags, len(next_block)) + next_block + payload
+    
+    @staticmethod
+    def _decode_block(raw):
+        """Reconstruye un bloque desde el formato binario"""
+        flags, next_len = _BLOCK_HEADER.unpack_from(raw)
+        start = _BLOCK_HEADER.size
+        next_block = raw[start:start + next_len].decode('ascii') or None
+        if next_block and flags & _FLAG_NUMERIC_NEXT:
+            next_block = int(next_block)
+        codec = CODEC_NAMES[(flags >> _CODEC_SHIFT) & _CODEC_MASK]
+        block_data = {
+            'next_block': next_block,
+            'eof': bool(flags & _FLAG_EOF)
+        }
+        if codec != 'none':
+            block_data['codec'] = codec
+        if flags & _FLAG_REF:
+            block_data['data_ref'] = raw[start + next_len:].decode('ascii')
+        else:
+            block_data['data'] = decode_payload(raw[start + next_len:], codec)
+        return block_data
+    
+    @staticmethod
+    def _to_json_record(block_data):
+        """Forma JSON de un bloque: los datos comprimidos se guardan en base64"""
+        codec = block_data.get('codec', 'none')
+        if codec == 'none' or 'data_ref' in block_data:
+            return block_data
+        record = {key: value for key, value in block_data.items() if key != 'data'}
+        record['data_z'] = base64.b64encode(encode_payload(block_data['data'], codec)).decode('ascii')
+        return record
+    
+    @staticmethod
+    def _from_json_record(record):
+        if 'data_z' in record:
+            record['data'] = decode_payload(base64.b64decode(record.pop('data_z')), record['codec'])
+        return record
+    
+    # --- Deduplicación por contenido ---
+    
+    def _load_refs(self):
+        """Carga los contadores de referencias de los objetos deduplicados"""
+        try:
+            with open(self.refs_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        self._refs_signature = file_signature(self.refs_path)
+        self._refs = state.get('refs', {})
+        self._objects_written = state.get('objects_written', 0)
+        self._writes_skipped = state.get('writes_skipped', 0)
+    
+    def _flush_refs(self):
+        """Persiste los contadores si cambiaron durante la operación"""
+        with self._refs_lock:
+            if not self._refs_dirty:
+                return
+            state = {
+                'refs': self._refs,
+                'objects_written': self._objects_written,
+                'writes_skipped': self._writes_skipped
+            }
+            with open(self.refs_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            self._refs_dirty = False
+            self._refs_signature = file_signature(self.refs_path)
+    
+    def _object_path(self, object_hash):
+        return os.path.join(self.objects_dir, f"{object_hash}.json")
+    
+    def _store_object(self, data, codec='none'):
+        """Guarda el contenido una sola vez por hash y suma una referencia"""
+        raw = data.encode('utf-8')
+        # El códec forma parte de la identidad del objeto: así se sabe cómo decodificarlo
+        if codec != 'none':
+            raw = codec.encode('ascii') + b'\0' + raw
+        object_hash = hashlib.sha256(raw).hexdigest()
+        with self._refs_lock:
+            entry = self._refs.get(object_hash)
+            if entry:
+                entry[0] += 1
+                self._writes_skipped += 1
+            else:
+                if self.record_store is not None:
+                    self.record_store.put(object_hash, encode_payload(data, codec))
+                else:
+                    os.makedirs(self.objects_dir, exist_ok=True)
+                    record = self._to_json_record({'data': data, 'codec': codec}) if codec != 'none' else {'data': data}
+                    with open(self._object_path(object_hash), 'w', encoding='utf-8') as f:
+                        json.dump(record, f, ensure_ascii=False)
+                self._refs[object_hash] = [1, len(data)]
+                self._objects_written += 1
+            self._refs_dirty = True
+        return object_hash
+    
+    def _read_object(self, object_hash, codec='none'):
+        if self.record_store is not None:
+            raw = self.record_store.get(object_hash)
+            if raw is not None:
+                return decode_payload(raw, codec)
         
-        blocks = []
-        block_size = 20
+        with open(self._object_path(object_hash), 'r', encoding='utf-8') as f:
+            return self._from_json_record(json.load(f))['data']
+    
+    def _release_object(self, object_hash):
+        """Resta una referencia y elimina el objeto cuando llega a cero"""
+        with self._refs_lock:
+            entry = self._refs.get(object_hash)
+            if entry is None:
+                return
+            entry[0] -= 1
+            self._refs_dirty = True
+            if entry[0] > 0:
+                return
+            del self._refs[object_hash]
+            if self.record_store is not None and self.record_store.contains(object_hash):
+                self.record_store.delete(object_hash)
+            elif os.path.exists(self._object_path(object_hash)):
+                os.remove(self._object_path(object_hash))
+    
+    def _prepare_block(self, block_data):
+        """Adapta un bloque antes de guardarlo: en modo deduplicación los datos pasan a ser una referencia"""
+        old_ref = block_data.get('data_ref')
+        codec = block_data.get('codec', 'none')
+        if self.dedup:
+            stored = {
+                'data_ref': self._store_object(block_data['data'], codec),
+                'next_block': block_data['next_block'],
+                'eof': block_data['eof']
+            }
+        elif old_ref:
+            stored = {key: block_data[key] for key in ('data', 'next_block', 'eof')}
+        else:
+            return block_data
+        if codec != 'none':
+            stored['codec'] = codec
         
-        # Si el contenido está vacío, crear un bloque vacío
-        if not content:
-            block_id = str(uuid.uuid4())
-            block_path = os.path.join(self.blocks_dir, f"{block_id}.json")
-            
-            block_data = {
-                'data': '',
-                'next_block': None,
-                'eof': True
+        # La referencia anterior se libera después de guardar la nueva
+        if old_ref:
+            self._release_object(old_ref)
+        return stored
+    
+    def dedup_stats(self):
+        """Estadísticas de deduplicación: referencias lógicas frente a objetos guardados"""
+        with self._refs_lock:
+            unique = len(self._refs)
+            references = sum(count for count, _ in self._refs.values())
+            logical_chars = sum(count * size for count, size in self._refs.values())
+            stored_chars = sum(size for _, size in self._refs.values())
+            return {
+                'unique_blocks': unique,
+                'references': references,
+                'logical_chars': logical_chars,
+                'stored_chars': stored_chars,
+                'chars_saved': logical_chars - stored_chars,
+                'dedup_ratio': references / unique if unique else 1.0,
+                'objects_written': self._objects_written,
+                'writes_skipped': self._writes_skipped
             }
-            
-            with open(block_path, 'w', encoding='utf-8') as f:
-                json.dump(block_data, f, indent=2, ensure_ascii=False)
-            
-            blocks.append(block_id)
+    
+    def _write_block(self, block_id, block_data):
+        """Guarda un bloque en el almacenamiento configurado"""
+        block_data = self._prepare_block(block_data)
+        if self.record_store is not None:
+            self.record_store.put(block_id, self._encode_block(block_data))
+            return
+        
+        with open(self._block_path(block_id), 'w', encoding='utf-8') as f:
+            json.dump(self._to_json_record(block_data), f, indent=2, ensure_ascii=False)
+    
+    def _read_block(self, block_id, resolve=True):
+        """Lee un bloque; en modo segmento o SQLite también acepta bloques JSON heredados"""
+        block_data = None
+        if self.record_store is not None:
+            raw = self.record_store.get(block_id)
+            if raw is not None:
+                block_data = self._decode_block(raw)
+        
+        if block_data is None:
+            with open(self._block_path(block_id), 'r', encoding='utf-8') as f:
+                block_data = self._from_json_record(json.load(f))
+        
+        if resolve and 'data_ref' in block_data:
+            block_data['data'] = self._read_object(block_data['data_ref'], block_data.get('codec', 'none'))
+        return block_data
+    
+    def _remove_block(self, block_id, block_data=None):
+        """Elimina físicamente un bloque y libera su contenido deduplicado"""
+        if block_data and 'data_ref' in block_data:
+            self._release_object(block_data['data_ref'])
+        
+        if isinstance(block_id, int) and self.cluster_table is not None:
+            self.cluster_table.release([block_id])
+        
+        if self.record_store is not None and self.record_store.contains(block_id):
+            self.record_store.delete(block_id)
+            return
+        
+        block_path = self._block_path(block_id)
+        if os.path.exists(block_path):
+            os.remove(block_path)
+    
+    def _write_blocks(self, chain):
+        """Guarda una cadena completa; con registros binarios en una sola escritura"""
+        if self.record_store is not None:
+            self.record_store.put_many(
+                [(block_id, self._encode_block(self._prepare_block(block_data))) for block_id, block_data in chain])
+            return
+        
+        for block_id, block_data in chain:
+            self._write_block(block_id, block_data)
+    
+    def choose_codec(self, content, block_size):
+        """Elige el códec muestreando la compresibilidad de los primeros bloques"""
+        # En bloques JSON lo comprimido se guarda en base64 (un tercio más grande)
+        overhead = 1.0 if self.record_store is not None else 4 / 3
+        return choose_codec(content, block_size, overhead)
+    
+    @staticmethod
+    def choose_block_size(content_length):
+        """Elige un tamaño de bloque (potencia de 2) según la longitud del contenido"""
+        target = max(1, -(-content_length // AUTO_BLOCKS_PER_FILE))
+        block_size = MIN_AUTO_BLOCK_SIZE
+        while block_size < target and block_size < MAX_AUTO_BLOCK_SIZE:
+            block_size *= 2
+        return block_size
+    
+    def _build_chain(self, content, block_size, codec='none'):
+        """Calcula la cadena completa en memoria con los ids ya asignados"""
+        # Si el contenido está vacío, la cadena es un único bloque vacío
+        pieces = [content[i:i + block_size] for i in range(0, len(content), block_size)] or ['']
+        if self.id_mode == 'numeric':
+            block_ids = self.cluster_table.allocate_chain(len(pieces))
         else:
-            # Dividir contenido en bloques
-            for i in range(0, len(content), block_size):
-                block_content = content[i:i + block_size]
-                block_id = str(uuid.uuid4())
-                block_path = os.path.join(self.blocks_dir, f"{block_id}.json")
-                
-                block_data = {
-                    'data': block_content,
-                    'next_block': None,
-                    'eof': False
-                }
-                
-                # Guardar bloque
-                with open(block_path, 'w', encoding='utf-8') as f:
-                    json.dump(block_data, f, indent=2, ensure_ascii=False)
-                
-                blocks.append(block_id)
-        
-        # Enlazar bloques
-        for i, block_id in enumerate(blocks):
-            block_path = os.path.join(self.blocks_dir, f"{block_id}.json")
-            
-            with open(block_path, 'r', encoding='utf-8') as f:
-                block_data = json.load(f)
-            
-            if i < len(blocks) - 1:
-                block_data['next_block'] = blocks[i + 1]
-                block_data['eof'] = False
-            else:
-                block_data['next_block'] = None
-                block_data['eof'] = True
-            
-            with open(block_path, 'w', encoding='utf-8') as f:
-                json.dump(block_data, f, indent=2, ensure_ascii=False)
+            block_ids = [str(uuid.uuid4()) for _ in pieces]
         
-        return blocks
+        chain = []
+        for i, (block_id, piece) in enumerate(zip(block_ids, pieces)):
+            is_last = i == len(pieces) - 1
+            block_data = {
+                'data': piece,
+                'next_block': None if is_last else block_ids[i + 1],
+                'eof': is_last
+            }
+            if codec != 'none':
+                block_data['codec'] = codec
+            chain.append((block_id, block_data))
+        return chain
+    
+    def create_blocks(self, content, block_size=DEFAULT_BLOCK_SIZE, codec='none'):
+        """Divide el contenido en bloques de block_size caracteres y guarda cada uno una sola vez"""
+        if content is None:
+            return None
+        
+        chain = self._build_chain(content, block_size, codec)
+        for block_id, block_data in chain:
+            self._write_block(block_id, block_data)
+        self._flush_refs()
+        
+        return [block_id for block_id, _ in chain]
+    
+    def create_blocks_bulk(self, content, block_size=DEFAULT_BLOCK_SIZE, codec='none'):
+        """Como create_blocks, pero escribe toda la cadena de una vez"""
+        if content is None:
+            return None
+        
+        chain = self._build_chain(content, block_size, codec)
+        self._write_blocks(chain)
+        self._flush_refs()
+        
+        return [block_id for block_id, _ in chain]
+    
+    def read_block(self, block_id):
+        """Lee un único bloque (data, next_block, eof)"""
+        return self._read_block(block_id)
     
     def read_blocks(self, initial_block):
         """Lee todos los bloques encadenados y retorna el contenido completo"""
-        content = ""
+        # Con ids numéricos la cadena sale de la tabla de clusters sin leer bloques
+        if isinstance(initial_block, int) and self.cluster_table is not None:
+            return self.read_block_list(self.cluster_table.chain(initial_block))
+        
+        pieces = []
         current_block = initial_block
         
         while current_block:
-            block_path = os.path.join(self.blocks_dir, f"{current_block}.json")
-            
             try:
-                with open(block_path, 'r', encoding='utf-8') as f:
-                    block_data = json.load(f)
+                block_data = self._read_block(current_block)
                 
-                content += block_data['data']
+                pieces.append(block_data['data'])
                 current_block = block_data['next_block']
                 
                 if block_data['eof']:
@@ -89,26 +386,343 @@ class BlockManager:
             except (FileNotFoundError, json.JSONDecodeError):
                 break
         
-        return content
+        return "".join(pieces)
+    
+    def read_block_list(self, block_ids, max_workers=8):
+        """Lee una lista explícita de bloques, en paralelo si es larga"""
+        if len(block_ids) < PARALLEL_READ_THRESHOLD or max_workers <= 1:
+            return "".join(self._read_block(block_id)['data'] for block_id in block_ids)
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        return "".join(block_data['data'] for block_data in self._executor.map(self._read_block, block_ids))
+    
+    def read_block_range(self, block_ids, block_size, offset, length):
+        """Lee solo los bloques que cubren [offset, offset + length)"""
+        if length <= 0 or offset < 0:
+            return ""
+        first = offset // block_size
+        last = (offset + length - 1) // block_size
+        content = self.read_block_list(block_ids[first:last + 1])
+        start = offset - first * block_size
+        return content[start:start + length]
+    
+    def chain_ids(self, initial_block):
+        """Recorre la cadena y retorna la lista ordenada de ids"""
+        if isinstance(initial_block, int) and self.cluster_table is not None:
+            return self.cluster_table.chain(initial_block)
+        
+        block_ids = []
+        current_block = initial_block
+        
+        while current_block:
+            try:
+                block_data = self._read_block(current_block, resolve=False)
+            except (FileNotFoundError, json.JSONDecodeError):
+                break
+            block_ids.append(current_block)
+            if block_data['eof']:
+                break
+            current_block = block_data['next_block']
+        
+        return block_ids
+    
+    def append_to_chain(self, tail_block, data, block_size):
+        """Completa el último bloque y encadena bloques nuevos; retorna los ids nuevos"""
+        tail_data = self._read_block(tail_block)
+        fill = data[:max(block_size - len(tail_data['data']), 0)]
+        rest = data[len(fill):]
+        
+        # Los bloques nuevos heredan el códec del archivo
+        new_chain = self._build_chain(rest, block_size, tail_data.get('codec', 'none')) if rest else []
+        # Los bloques nuevos se escriben antes de enlazarlos desde el último
+        self._write_blocks(new_chain)
+        
+        tail_data['data'] += fill
+        if new_chain:
+            tail_data['next_block'] = new_chain[0][0]
+            tail_data['eof'] = False
+        self._write_block(tail_block, tail_data)
+        if new_chain and isinstance(tail_block, int) and self.cluster_table is not None:
+            self.cluster_table.set_next(tail_block, new_chain[0][0])
+        self._flush_refs()
+        
+        return [block_id for block_id, _ in new_chain]
+    
+    def overwrite_range(self, block_ids, block_size, offset, data):
+        """Sobrescribe en su lugar los bloques que cubren [offset, offset + len(data))"""
+        if not data:
+            return
+        first = offset // block_size
+        last = (offset + len(data) - 1) // block_size
+        
+        for index in range(first, min(last, len(block_ids) - 1) + 1):
+            block_id = block_ids[index]
+            block_data = self._read_block(block_id)
+            block_start = index * block_size
+            start = max(offset - block_start, 0)
+            piece = data[block_start + start - offset:block_start + block_size - offset]
+            block_data['data'] = block_data['data'][:start] + piece + block_data['data'][start + len(piece):]
+            self._write_block(block_id, block_data)
+        self._flush_refs()
     
     def delete_blocks(self, initial_block):
         """Elimina todos los bloques encadenados"""
         current_block = initial_block
         
         while current_block:
-            block_path = os.path.join(self.blocks_dir, f"{current_block}.json")
-            
             try:
-                with open(block_path, 'r', encoding='utf-8') as f:
-                    block_data = json.load(f)
+                block_data = self._read_block(current_block, resolve=False)
                 
                 next_block = block_data['next_block']
                 
-                # Eliminar archivo físico del bloque
-                if os.path.exists(block_path):
-                    os.remove(block_path)
+                # Eliminar el bloque físico
+                self._remove_block(current_block, block_data)
                 
                 current_block = next_block
                 
             except (FileNotFoundError, json.JSONDecodeError):
-                break
\ No newline at end of file
+                break
+        
+        self._flush_refs()
+    
+    # --- Blobs binarios ---
+    
+    def _blob_path(self, blob_id):
+        return os.path.join(self.blobs_dir, f"{blob_id}.bin")
+    
+    def create_blob(self, data):
+        """Guarda bytes tal cual en un único registro y retorna su referencia.
+        
+        La referencia es un id (segmentos, SQLite o un archivo .bin en modo
+        json) o la lista de extents en modo extent.
+        """
+        if self.extent_store is not None:
+            extents = self.extent_store.allocate(len(data))
+            self.extent_store.write(extents, data)
+            return extents
+        
+        blob_id = BLOB_PREFIX + uuid.uuid4().hex
+        if self.record_store is not None:
+            self.record_store.put(blob_id, bytes(data))
+        else:
+            os.makedirs(self.blobs_dir, exist_ok=True)
+            with open(self._blob_path(blob_id), 'wb') as f:
+                f.write(data)
+        return blob_id
+    
+    def read_blob(self, blob, offset=0, length=None):
+        """Lee los bytes de un blob, o solo [offset, offset + length)"""
+        if isinstance(blob, list):
+            total = sum(size for _, size in blob)
+            return self.extent_store.read(blob, offset, total - offset if length is None else min(length, total - offset))
+        
+        if self.record_store is not None:
+            data = self.record_store.get(blob)
+            if data is not None:
+                return data[offset:] if length is None else data[offset:offset + length]
+        
+        with open(self._blob_path(blob), 'rb') as f:
+            f.seek(offset)
+            return f.read() if length is None else f.read(length)
+    
+    def delete_blob(self, blob):
+        if isinstance(blob, list):
+            self.extent_store.free(blob)
+        elif self.record_store is not None and self.record_store.contains(blob):
+            self.record_store.delete(blob)
+        elif os.path.exists(self._blob_path(blob)):
+            os.remove(self._blob_path(blob))
+    
+    # --- Asignación por extents ---
+    
+    def create_extents(self, content):
+        """Guarda el contenido en un extent contiguo y retorna la lista de extents"""
+        data = content.encode('utf-8')
+        extents = self.extent_store.allocate(len(data))
+        self.extent_store.write(extents, data)
+        return extents
+    
+    def read_extents(self, extents):
+        """Lee el contenido completo de un archivo guardado en extents"""
+        return self.extent_store.read(extents).decode('utf-8')
+    
+    def read_extent_bytes(self, extents, offset, length):
+        return self.extent_store.read(extents, offset, length)
+    
+    def write_extents(self, extents, offset, data):
+        """Sobrescribe bytes dentro de los extents existentes"""
+        self.extent_store.write(extents, data, offset)
+    
+    def append_extents(self, extents, data):
+        """Agrega bytes al final; retorna la nueva lista de extents"""
+        if not data:
+            return extents
+        extents = [list(extent) for extent in extents]
+        if extents and self.extent_store.try_extend(extents[-1], len(data)):
+            self.extent_store.write(extents[-1:], data, extents[-1][1] - len(data))
+            return extents
+        
+        if len(extents) + 1 > MAX_EXTENTS_PER_FILE:
+            # Demasiado fragmentado: reubicar todo el archivo en un único tramo
+            content = self.extent_store.read(extents) + data
+            new_extents = self.extent_store.allocate(len(content))
+            self.extent_store.write(new_extents, content)
+            self.extent_store.free(extents)
+            return new_extents
+        
+        new_extents = self.extent_store.allocate(len(data))
+        self.extent_store.write(new_extents, data)
+        return extents + new_extents
+    
+    def delete_extents(self, extents):
+        """Devuelve el espacio de los extents al mapa de espacio libre"""
+        self.extent_store.free(extents)
+    
+    def migrate_to_segments(self):
+        """Convierte los bloques JSON sueltos del directorio en segmentos"""
+        if self.storage_mode == 'segment':
+            return self._migrate_json_records(self.record_store)
+        store = SegmentStore(os.path.join(self.blocks_dir, "segments"))
+        migrated = self._migrate_json_records(store)
+        store.close()
+        return migrated
+    
+    def migrate_storage(self, target_mode):
+        """Copia todos los bloques y objetos al almacenamiento target_mode y borra los originales.
+        
+        Soporta json, segment y sqlite; después hay que crear un BlockManager
+        nuevo con target_mode. Retorna la cantidad de registros migrados.
+        """
+        if 'extent' in (self.storage_mode, target_mode):
+            print("La migración no está disponible para el modo extent")
+            return None
+        if target_mode == self.storage_mode:
+            return 0
+        
+        self._flush_refs()
+        if target_mode == 'json':
+            return self._export_json_records()
+        
+        store = self._open_record_store(target_mode)
+        migrated = self._migrate_json_records(store)
+        if self.record_store is not None:
+            ids = self.record_store.ids()
+            for start in range(0, len(ids), 1000):
+                batch = ids[start:start + 1000]
+                store.put_many([(record_id, self.record_store.get(record_id)) for record_id in batch])
+                migrated += len(batch)
+            self.record_store.destroy()
+        store.close()
+        return migrated
+    
+    def _export_json_records(self):
+        """Escribe los registros binarios como archivos JSON sueltos"""
+        ids = self.record_store.ids()
+        objects = [record_id for record_id in ids if record_id in self._refs]
+        object_codecs = {}
+        
+        for record_id in ids:
+            if record_id in self._refs:
+                continue
+            if record_id.startswith(BLOB_PREFIX):
+                os.makedirs(self.blobs_dir, exist_ok=True)
+                with open(self._blob_path(record_id), 'wb') as f:
+                    f.write(self.record_store.get(record_id))
+                continue
+            block_data = self._decode_block(self.record_store.get(record_id))
+            if 'data_ref' in block_data:
+                # El códec de un objeto solo se conoce por los bloques que lo referencian
+                object_codecs[block_data['data_ref']] = block_data.get('codec', 'none')
+            with open(self._block_path(record_id), 'w', encoding='utf-8') as f:
+                json.dump(self._to_json_record(block_data), f, indent=2, ensure_ascii=False)
+        
+        if objects:
+            os.makedirs(self.objects_dir, exist_ok=True)
+        for object_hash in objects:
+            codec = object_codecs.get(object_hash, 'none')
+            raw = self.record_store.get(object_hash)
+            if codec == 'none':
+                record = {'data': raw.decode('utf-8')}
+            else:
+                record = {'data_z': base64.b64encode(raw).decode('ascii'), 'codec': codec}
+            with open(self._object_path(object_hash), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+        
+        self.record_store.destroy()
+        return len(ids)
+    
+    def _migrate_json_records(self, store):
+        """Pasa al almacén los bloques y objetos JSON y los blobs sueltos del directorio"""
+        migrated = 0
+        batch = []
+        
+        if os.path.isdir(self.blobs_dir):
+            for name in os.listdir(self.blobs_dir):
+                if name.endswith('.bin'):
+                    blob_path = os.path.join(self.blobs_dir, name)
+                    with open(blob_path, 'rb') as f:
+                        batch.append((name[:-4], f.read(), blob_path))
+        
+        # Los objetos deduplicados se migran con su hash como id
+        sources = [(self.blocks_dir, False)]
+        if os.path.isdir(self.objects_dir):
+            sources.append((self.objects_dir, True))
+        
+        for directory, is_object in sources:
+            for name in os.listdir(directory):
+                block_path = os.path.join(directory, name)
+                if not name.endswith('.json') or block_path == self.refs_path:
+                    continue
+                try:
+                    with open(block_path, 'r', encoding='utf-8') as f:
+                        block_data = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    print(f"Bloque omitido {name}: {e}")
+                    continue
+                
+                if is_object and 'data_z' in block_data:
+                    payload = base64.b64decode(block_data['data_z'])
+                elif is_object:
+                    payload = block_data['data'].encode('utf-8')
+                else:
+                    payload = self._encode_block(self._from_json_record(block_data))
+                batch.append((name[:-5], payload, block_path))
+                if len(batch) >= 1000:
+                    migrated += self._flush_migration(store, batch)
+                    batch = []
+        
+        migrated += self._flush_migration(store, batch)
+        return migrated
+    
+    @staticmethod
+    def _flush_migration(store, batch):
+        # Los JSON se borran solo después de que el índice registra los bloques
+        store.put_many([(block_id, payload) for block_id, payload, _ in batch])
+        for _, _, block_path in batch:
+            os.remove(block_path)
+        return len(batch)
+    
+    def refresh(self):
+        """Recarga el estado en memoria (índices, mapas, contadores) que otro proceso haya cambiado"""
+        if self.record_store is not None:
+            self.record_store.refresh()
+        if self.extent_store is not None:
+            self.extent_store.refresh()
+        if self.cluster_table is not None:
+            self.cluster_table.refresh()
+        with self._refs_lock:
+            if not self._refs_dirty and file_signature(self.refs_path) != self._refs_signature:
+                self._load_refs()
+    
+    def close(self):
+        """Cierra los manejadores abiertos del almacenamiento"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self.record_store is not None:
+            self.record_store.close()
+        if self.extent_store is not None:
+            self.extent_store.close()
+        if self.cluster_table is not None:
+            self.cluster_table.close()
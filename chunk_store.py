@@ -0,0 +1,232 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+from contextlib import contextmanager
+from file_lock import FileLock, file_signature
+
+# Límites de los trozos en que se cortan los archivos grandes
+CHUNK_MIN_SIZE = 16 * 1024
+CHUNK_MAX_SIZE = 256 * 1024
+# Hash rodante Gear de un bit por byte sobre una ventana de 16 bytes: se corta
+# donde la ventana vale _BOUNDARY (en promedio cada 64 KiB después del mínimo).
+# bytes.translate y bytes.find lo evalúan en C sin recorrer byte a byte en Python
+_GEAR_BITS = bytes(hashlib.sha256(bytes([value])).digest()[0] & 1 for value in range(256))
+_BOUNDARY = bytes((0xB38D >> bit) & 1 for bit in range(16))
+# Manifiesto de un archivo: SHA-256 y longitud de cada trozo, en orden
+_MANIFEST_RECORD = struct.Struct('<32sI')
+
+
+def split_chunks(data, final=True):
+    """Corta data en trozos definidos por su contenido; retorna (trozos, resto).
+
+    Cada corte depende solo de los 16 bytes anteriores, así que una edición
+    cambia los trozos que toca y los demás vuelven a salir iguales. Sin
+    final, los bytes después del último corte seguro se retornan como resto
+    para completarlos con los datos siguientes.
+    """
+    bits = data.translate(_GEAR_BITS)
+    window = len(_BOUNDARY)
+    view = memoryview(data)
+    chunks = []
+    start = 0
+    while start < len(data):
+        end = min(len(data), start + CHUNK_MAX_SIZE)
+        found = bits.find(_BOUNDARY, start + CHUNK_MIN_SIZE - window, end)
+        if found >= 0:
+            cut = found + window
+        elif end - start == CHUNK_MAX_SIZE or final:
+            cut = end
+        else:
+            break
+        chunks.append(view[start:cut])
+        start = cut
+    return chunks, view[start:]
+
+
+def write_manifest(manifest_path, chunks):
+    with open(manifest_path, 'wb') as f:
+        f.write(b''.join(_MANIFEST_RECORD.pack(bytes.fromhex(chunk_hash), size) for chunk_hash, size in chunks))
+
+
+def read_manifest(manifest_path):
+    """Lista ordenada de (hash, longitud) de los trozos de un archivo"""
+    with open(manifest_path, 'rb') as f:
+        raw = f.read()
+    return [(digest.hex(), size) for digest, size in _MANIFEST_RECORD.iter_unpack(raw)]
+
+
+class ChunkWriter:
+    """Corta y guarda los trozos a medida que llegan los datos (memoria acotada)"""
+
+    def __init__(self, store):
+        self.store = store
+        self.chunks = []
+        self._rest = b""
+
+    def write(self, data):
+        pieces, rest = split_chunks(self._rest + data, final=False)
+        self.chunks += self.store.put_many(pieces)
+        self._rest = bytes(rest)
+        return len(data)
+
+    def close(self):
+        """Guarda lo que quedaba sin cortar y retorna la lista de (hash, longitud)"""
+        pieces, _ = split_chunks(self._rest, final=True)
+        self.chunks += self.store.put_many(pieces)
+        self._rest = b""
+        return self.chunks
+
+    def abort(self):
+        """Libera los trozos ya guardados (importación cancelada o fallida)"""
+        self.store.release_many(self.chunks)
+        self.chunks = []
+
+
+class ChunkStore:
+    """Trozos de los archivos grandes guardados una sola vez por su SHA-256.
+
+    Cada trozo es un archivo <hash[:2]>/<hash>.bin que nunca cambia, y
+    chunk_refs.json lleva cuántos manifiestos lo usan junto con los
+    contadores de reutilización. import_file escribe fuera del bloqueo del
+    volumen, por eso los contadores tienen su propio bloqueo entre procesos.
+    """
+
+    def __init__(self, chunks_dir):
+        self.chunks_dir = chunks_dir
+        self.refs_path = os.path.join(chunks_dir, "chunk_refs.json")
+        self._lock = FileLock(os.path.join(chunks_dir, "chunks.lock"))
+        os.makedirs(chunks_dir, exist_ok=True)
+        self._load_refs()
+
+    def _chunk_path(self, chunk_hash):
+        return os.path.join(self.chunks_dir, chunk_hash[:2], f"{chunk_hash}.bin")
+
+    def _load_refs(self):
+        try:
+            with open(self.refs_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        self._signature = file_signature(self.refs_path)
+        self._refs = state.get('refs', {})
+        self._counters = {key: state.get(key, 0)
+                          for key in ('chunks_written', 'chunks_reused', 'bytes_written', 'bytes_reused')}
+
+    @contextmanager
+    def _locked(self):
+        """Cambia los contadores con el bloqueo tomado y los guarda al terminar"""
+        with self._lock.exclusive():
+            if file_signature(self.refs_path) != self._signature:
+                self._load_refs()
+            yield
+            temp_path = self.refs_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(self._counters, refs=self._refs), f, separators=(',', ':'))
+            os.replace(temp_path, self.refs_path)
+            self._signature = file_signature(self.refs_path)
+
+    def put_many(self, pieces):
+        """Guarda los trozos que aún no existen y suma una referencia a cada uno.
+
+        Retorna la lista de (hash, longitud) para el manifiesto.
+        """
+        chunks = [(hashlib.sha256(piece).hexdigest(), len(piece)) for piece in pieces]
+        with self._locked():
+            for (chunk_hash, size), piece in zip(chunks, pieces):
+                entry = self._refs.get(chunk_hash)
+                if entry:
+                    entry[0] += 1
+                    self._counters['chunks_reused'] += 1
+                    self._counters['bytes_reused'] += size
+                    continue
+                chunk_path = self._chunk_path(chunk_hash)
+                os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+                with open(chunk_path + '.tmp', 'wb') as f:
+                    f.write(piece)
+                os.replace(chunk_path + '.tmp', chunk_path)
+                self._refs[chunk_hash] = [1, size]
+                self._counters['chunks_written'] += 1
+                self._counters['bytes_written'] += size
+        return chunks
+
+    def retain_many(self, chunks):
+        """Suma una referencia a trozos ya guardados (un manifiesto nuevo que los conserva)"""
+        if not chunks:
+            return
+        with self._locked():
+            for chunk_hash, size in chunks:
+                self._refs[chunk_hash][0] += 1
+                self._counters['chunks_reused'] += 1
+                self._counters['bytes_reused'] += size
+
+    def release_many(self, chunks):
+        """Resta una referencia a cada trozo y borra los que ya nadie usa"""
+        if not chunks:
+            return
+        with self._locked():
+            for chunk_hash, _ in chunks:
+                entry = self._refs.get(chunk_hash)
+                if entry is None:
+                    continue
+                entry[0] -= 1
+                if entry[0] > 0:
+                    continue
+                del self._refs[chunk_hash]
+                try:
+                    os.remove(self._chunk_path(chunk_hash))
+                except OSError:
+                    pass
+
+    def read(self, chunk_hash):
+        with open(self._chunk_path(chunk_hash), 'rb') as f:
+            return f.read()
+
+    def view(self, chunk_hash, offset, length):
+        """memoryview sin copia de una parte de un trozo (los trozos nunca se modifican)"""
+        with open(self._chunk_path(chunk_hash), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)[offset:offset + length]
+
+    def read_range(self, chunks, offset, length):
+        """Bytes [offset, offset + length) de un archivo en trozos.
+
+        Si el rango cae dentro de un solo trozo retorna la vista sin copia.
+        """
+        if offset < 0 or length <= 0:
+            return memoryview(b"")
+        parts = []
+        start = 0
+        for chunk_hash, size in chunks:
+            if start + size > offset:
+                low = max(offset - start, 0)
+                high = min(offset + length - start, size)
+                parts.append(self.view(chunk_hash, low, high - low))
+            start += size
+            if start >= offset + length:
+                break
+        if len(parts) == 1:
+            return parts[0]
+        return memoryview(b''.join(parts))
+
+    def stats(self):
+        """Reutilización de trozos: referencias frente a trozos guardados y escrituras evitadas"""
+        with self._lock.shared():
+            if file_signature(self.refs_path) != self._signature:
+                self._load_refs()
+            unique = len(self._refs)
+            references = sum(count for count, _ in self._refs.values())
+            logical_bytes = sum(count * size for count, size in self._refs.values())
+            stored_bytes = sum(size for _, size in self._refs.values())
+            offered = self._counters['bytes_written'] + self._counters['bytes_reused']
+            return dict(self._counters,
+                        unique_chunks=unique,
+                        references=references,
+                        logical_bytes=logical_bytes,
+                        stored_bytes=stored_bytes,
+                        bytes_saved=logical_bytes - stored_bytes,
+                        write_reuse_ratio=self._counters['bytes_reused'] / offered if offered else 0.0)
+
+    def close(self):
+        self._lock.close()
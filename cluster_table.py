@@ -0,0 +1,122 @@
+import os
+import sys
+import heapq
+import struct
+import threading
+from array import array
+from file_lock import file_signature
+
+# Valores especiales de la tabla (como en una FAT real)
+FREE = 0
+END_OF_CHAIN = -1
+
+_ENTRY = struct.Struct('<q')
+
+
+class ClusterTable:
+    """Tabla de clusters de ancho fijo: entrada n = siguiente bloque de n.
+
+    Los bloques se numeran desde 1 (la entrada 0 está reservada). Una entrada
+    en FREE está libre, END_OF_CHAIN marca el último bloque de un archivo.
+    La lista de libres se reconstruye al cargar recorriendo la tabla, así que
+    la tabla en disco es la única fuente de verdad.
+    """
+
+    def __init__(self, table_path):
+        self.table_path = table_path
+        self._lock = threading.RLock()
+        self._handle = None
+        self._load()
+
+    def _load(self):
+        self._table = array('q')
+        try:
+            with open(self.table_path, 'rb') as f:
+                raw = f.read()
+            self._table.frombytes(raw[:len(raw) - len(raw) % _ENTRY.size])
+            if sys.byteorder == 'big':
+                self._table.byteswap()
+        except FileNotFoundError:
+            pass
+        if not self._table:
+            self._table.append(END_OF_CHAIN)  # Entrada 0 reservada
+        # Montículo: los libres de menor número se reutilizan primero
+        self._free = [n for n in range(1, len(self._table)) if self._table[n] == FREE]
+        self._signature = file_signature(self.table_path)
+
+    def _write_entries(self, numbers):
+        """Escribe en disco solo las entradas modificadas"""
+        if self._handle is None:
+            mode = 'r+b' if os.path.exists(self.table_path) else 'w+b'
+            self._handle = open(self.table_path, mode)
+            if mode == 'w+b':
+                self._handle.write(_ENTRY.pack(self._table[0]))
+        for number in sorted(numbers):
+            self._handle.seek(number * _ENTRY.size)
+            self._handle.write(_ENTRY.pack(self._table[number]))
+        self._handle.flush()
+        self._signature = file_signature(self.table_path)
+
+    def allocate_chain(self, count):
+        """Reserva count bloques y los deja enlazados entre sí en la tabla"""
+        with self._lock:
+            numbers = []
+            for _ in range(count):
+                if self._free:
+                    numbers.append(heapq.heappop(self._free))
+                else:
+                    self._table.append(FREE)
+                    numbers.append(len(self._table) - 1)
+            for current, following in zip(numbers, numbers[1:] + [END_OF_CHAIN]):
+                self._table[current] = following
+            self._write_entries(numbers)
+            return numbers
+
+    def set_next(self, number, next_number):
+        with self._lock:
+            self._table[number] = END_OF_CHAIN if next_number is None else next_number
+            self._write_entries([number])
+
+    def chain(self, start):
+        """Ids de la cadena que empieza en start, sin leer ningún bloque"""
+        numbers = []
+        current = start
+        with self._lock:
+            while 0 < current < len(self._table) and self._table[current] != FREE:
+                numbers.append(current)
+                current = self._table[current]
+                if len(numbers) > len(self._table):
+                    break  # Cadena cíclica: tabla dañada
+        return numbers
+
+    def release(self, numbers):
+        """Marca los bloques como libres para reutilizar sus números"""
+        with self._lock:
+            released = [number for number in numbers
+                        if 0 < number < len(self._table) and self._table[number] != FREE]
+            for number in released:
+                self._table[number] = FREE
+                heapq.heappush(self._free, number)
+            if released:
+                self._write_entries(released)
+
+    def refresh(self):
+        """Recarga la tabla si otro proceso la modificó"""
+        with self._lock:
+            if file_signature(self.table_path) != self._signature:
+                self.close()
+                self._load()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clusters': len(self._table) - 1,
+                'free': len(self._free),
+                'table_bytes': len(self._table) * _ENTRY.size
+            }
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
@@ -0,0 +1,178 @@
+import os
+import json
+import bisect
+import threading
+from file_lock import file_signature
+
+_HAS_PREAD = hasattr(os, 'pread')
+
+
+class ExtentStore:
+    """Guarda archivos como extents (tramos contiguos) dentro de un único archivo de datos.
+
+    El espacio libre se lleva en un mapa de tramos [offset, longitud] ordenado
+    y fusionado; liberar un extent lo devuelve al mapa y, si queda al final,
+    recorta el archivo de datos.
+    """
+
+    def __init__(self, extents_dir):
+        self.extents_dir = extents_dir
+        self.data_path = os.path.join(extents_dir, "data.bin")
+        self.free_map_path = os.path.join(extents_dir, "free_map.json")
+        self._lock = threading.RLock()
+        self._handle = None
+        os.makedirs(extents_dir, exist_ok=True)
+        self._load_free_map()
+
+    def _load_free_map(self):
+        try:
+            with open(self.free_map_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        self._signature = file_signature(self.free_map_path)
+        self._free = [tuple(run) for run in state.get('free', [])]
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        self._end = state.get('end', data_size)
+
+    def _save_free_map(self):
+        with open(self.free_map_path, 'w', encoding='utf-8') as f:
+            json.dump({'free': self._free, 'end': self._end}, f, separators=(',', ':'))
+        self._signature = file_signature(self.free_map_path)
+
+    def _get_handle(self):
+        if self._handle is None:
+            mode = 'r+b' if os.path.exists(self.data_path) else 'w+b'
+            self._handle = open(self.data_path, mode)
+        return self._handle
+
+    def _take_free(self, index, size):
+        """Toma size bytes del inicio del tramo libre index"""
+        offset, length = self._free[index]
+        if length == size:
+            del self._free[index]
+        else:
+            self._free[index] = (offset + size, length - size)
+        return [offset, size]
+
+    def allocate(self, size):
+        """Reserva un extent contiguo de size bytes (best-fit, o al final del archivo)"""
+        if size <= 0:
+            return []
+        with self._lock:
+            best = None
+            for index, (_, length) in enumerate(self._free):
+                if length >= size and (best is None or length < self._free[best][1]):
+                    best = index
+            if best is not None:
+                extent = self._take_free(best, size)
+            elif self._free and sum(self._free[-1]) == self._end:
+                # El último tramo libre toca el final: se extiende desde ahí
+                offset, length = self._free.pop()
+                self._end += size - length
+                extent = [offset, size]
+            else:
+                extent = [self._end, size]
+                self._end += size
+            self._save_free_map()
+            return [extent]
+
+    def try_extend(self, extent, size):
+        """Intenta agrandar un extent en su lugar; retorna True si fue posible"""
+        with self._lock:
+            end = extent[0] + extent[1]
+            if end == self._end:
+                self._end += size
+            else:
+                index = bisect.bisect_left(self._free, (end,))
+                if index >= len(self._free) or self._free[index][0] != end or self._free[index][1] < size:
+                    return False
+                self._take_free(index, size)
+            extent[1] += size
+            self._save_free_map()
+            return True
+
+    def write(self, extents, data, skip=0):
+        """Escribe data repartido en los extents, empezando skip bytes dentro de ellos"""
+        with self._lock:
+            handle = self._get_handle()
+            view = memoryview(data)
+            for offset, length in extents:
+                if skip >= length:
+                    skip -= length
+                    continue
+                piece = view[:length - skip]
+                handle.seek(offset + skip)
+                handle.write(piece)
+                view = view[len(piece):]
+                skip = 0
+                if not view:
+                    break
+            handle.flush()
+
+    def read(self, extents, skip=0, size=None):
+        """Lee el contenido de los extents (una lectura secuencial por extent)"""
+        pieces = []
+        remaining = sum(length for _, length in extents) - skip if size is None else size
+        with self._lock:
+            handle = self._get_handle()
+            for offset, length in extents:
+                if remaining <= 0:
+                    break
+                if skip >= length:
+                    skip -= length
+                    continue
+                count = min(length - skip, remaining)
+                if _HAS_PREAD:
+                    pieces.append(os.pread(handle.fileno(), count, offset + skip))
+                else:
+                    handle.seek(offset + skip)
+                    pieces.append(handle.read(count))
+                remaining -= count
+                skip = 0
+        return b''.join(pieces)
+
+    def free(self, extents):
+        """Devuelve los extents al mapa de espacio libre, fusionando tramos vecinos"""
+        with self._lock:
+            for offset, length in extents:
+                if length <= 0:
+                    continue
+                index = bisect.bisect_left(self._free, (offset,))
+                self._free.insert(index, (offset, length))
+                # Fusionar con el tramo siguiente y con el anterior
+                if index + 1 < len(self._free) and offset + length == self._free[index + 1][0]:
+                    length += self._free.pop(index + 1)[1]
+                    self._free[index] = (offset, length)
+                if index > 0 and sum(self._free[index - 1]) == offset:
+                    prev_offset, prev_length = self._free.pop(index - 1)
+                    index -= 1
+                    self._free[index] = (prev_offset, prev_length + length)
+
+            # Un tramo libre al final se recorta del archivo de datos
+            if self._free and sum(self._free[-1]) == self._end:
+                self._end = self._free.pop()[0]
+                self._get_handle().truncate(self._end)
+            self._save_free_map()
+
+    def refresh(self):
+        """Recarga el mapa de espacio libre si otro proceso lo modificó"""
+        with self._lock:
+            if file_signature(self.free_map_path) != self._signature:
+                self._load_free_map()
+
+    def stats(self):
+        with self._lock:
+            free_bytes = sum(length for _, length in self._free)
+            return {
+                'size': self._end,
+                'free_bytes': free_bytes,
+                'free_runs': len(self._free),
+                'largest_free_run': max((length for _, length in self._free), default=0)
+            }
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
@@ -0,0 +1,399 @@
+import json
+import struct
+from datetime import datetime, timedelta
+from collections.abc import MutableMapping, ItemsView, ValuesView
+from block_codecs import CODECS, CODEC_NAMES
+
+_MAGIC = b'FATB'
+_FORMAT_VERSION = 1
+# magic, versión, registros, cadenas, permisos, offsets de cadenas, permisos, texto y extras
+_HEADER = struct.Struct('<4sHIIIQQQQ')
+# nombre, dueño, campos presentes, banderas, códec, fechas (creación, modificación,
+# eliminación), total_chars, version, block_size, bloque inicial, permisos (inicio,
+# cantidad), extras (offset, longitud)
+_RECORD = struct.Struct('<IIHBBqqqqIIIIIQI')
+_STRING = struct.Struct('<II')
+_PERMISSION = struct.Struct('<IB')
+
+# Fechas: microsegundos desde 1970-01-01 (sin zona horaria, como las ISO guardadas)
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_DATE = -2 ** 63
+_NO_STRING = 0xFFFFFFFF
+
+# Bits de "campo presente": una entrada decodificada tiene exactamente las mismas claves
+_FIELDS = ('filename', 'owner', 'in_recycle_bin', 'is_binary', 'is_large_file', 'creation_date',
+           'modification_date', 'deletion_date', 'total_chars', 'version', 'block_size', 'codec',
+           'initial_block', 'permissions', 'is_directory')
+_PRESENT = {field: 1 << bit for bit, field in enumerate(_FIELDS)}
+_INDEXED = _PRESENT['owner'] | _PRESENT['in_recycle_bin'] | _PRESENT['permissions']
+_DATES = ('creation_date', 'modification_date', 'deletion_date')
+_INTS = ('total_chars', 'version', 'block_size')
+_INT_LIMITS = {'total_chars': (-2 ** 63, 2 ** 63), 'version': (0, 2 ** 32), 'block_size': (0, 2 ** 32)}
+
+_FLAG_RECYCLE = 0x01
+_FLAG_BINARY = 0x02
+_FLAG_LARGE = 0x04
+_FLAG_NUMERIC_BLOCK = 0x08
+_FLAG_DIRECTORY = 0x10
+_BOOL_FLAGS = {'in_recycle_bin': _FLAG_RECYCLE, 'is_binary': _FLAG_BINARY, 'is_large_file': _FLAG_LARGE,
+               'is_directory': _FLAG_DIRECTORY}
+
+# Permisos como máscara de bits
+_PERMISSION_BITS = {'read': 0x01, 'write': 0x02}
+
+
+def _encode_date(value):
+    """ISO -> microsegundos; None si la fecha no se puede representar exactamente"""
+    if value is None:
+        return _NO_DATE
+    try:
+        date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is not None or date.isoformat() != value:
+        return None
+    return (date - _EPOCH) // _MICROSECOND
+
+
+def _decode_date(value):
+    return None if value == _NO_DATE else (_EPOCH + value * _MICROSECOND).isoformat()
+
+
+def _encode_permissions(permissions):
+    """Lista de (usuario, máscara) o None si algún permiso no cabe en la máscara"""
+    encoded = []
+    for user, granted in permissions.items():
+        mask = 0
+        for permission in granted:
+            bit = _PERMISSION_BITS.get(permission)
+            if bit is None or mask & bit:
+                return None
+            mask |= bit
+        # La máscara no guarda el orden: solo se acepta el orden canónico
+        if list(granted) != [name for name, bit in _PERMISSION_BITS.items() if mask & bit]:
+            return None
+        encoded.append((user, mask))
+    return encoded
+
+
+def encode_table(fat_table):
+    """Serializa la tabla FAT al formato binario (registros ordenados por nombre)"""
+    strings = {}
+    string_list = []
+
+    def intern(text):
+        string_id = strings.get(text)
+        if string_id is None:
+            string_id = strings[text] = len(string_list)
+            string_list.append(text)
+        return string_id
+
+    records = []
+    permission_rows = []
+    extras_blob = bytearray()
+
+    for filename in sorted(fat_table):
+        entry = fat_table[filename]
+        extras = {}
+        present = 0
+        flags = 0
+        dates = [_NO_DATE] * 3
+        ints = dict.fromkeys(_INTS, 0)
+        owner_id = initial_id = _NO_STRING
+        codec_id = 0
+        permission_start = len(permission_rows)
+        permission_count = 0
+
+        for key, value in entry.items():
+            encoded = True
+            if key == 'filename':
+                encoded = value == filename
+            elif key == 'owner':
+                encoded = isinstance(value, str)
+                if encoded:
+                    owner_id = intern(value)
+            elif key in _BOOL_FLAGS:
+                encoded = isinstance(value, bool)
+                if value is True:
+                    flags |= _BOOL_FLAGS[key]
+            elif key in _DATES:
+                date = _encode_date(value)
+                encoded = date is not None
+                if encoded:
+                    dates[_DATES.index(key)] = date
+            elif key in _INTS:
+                low, high = _INT_LIMITS[key]
+                encoded = type(value) is int and low <= value < high
+                if encoded:
+                    ints[key] = value
+            elif key == 'codec':
+                encoded = value in CODECS
+                if encoded:
+                    codec_id = CODECS[value][0]
+            elif key == 'initial_block':
+                encoded = isinstance(value, str) or (type(value) is int and value >= 0)
+                if encoded:
+                    if isinstance(value, int):
+                        flags |= _FLAG_NUMERIC_BLOCK
+                    initial_id = intern(str(value))
+            elif key == 'permissions':
+                rows = _encode_permissions(value) if isinstance(value, dict) else None
+                encoded = rows is not None
+                if encoded:
+                    permission_rows.extend((intern(user), mask) for user, mask in rows)
+                    permission_count = len(rows)
+            else:
+                encoded = False
+
+            if encoded:
+                present |= _PRESENT[key]
+            else:
+                extras[key] = value
+
+        extra_offset = len(extras_blob)
+        if extras:
+            extras_blob += json.dumps(extras, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        records.append(_RECORD.pack(
+            intern(filename), owner_id, present, flags, codec_id, dates[0], dates[1], dates[2],
+            ints['total_chars'], ints['version'], ints['block_size'], initial_id,
+            permission_start, permission_count, extra_offset, len(extras_blob) - extra_offset))
+
+    text_blob = bytearray()
+    string_index = []
+    for text in string_list:
+        encoded = text.encode('utf-8')
+        string_index.append(_STRING.pack(len(text_blob), len(encoded)))
+        text_blob += encoded
+
+    strings_offset = _HEADER.size + len(records) * _RECORD.size
+    permissions_offset = strings_offset + len(string_index) * _STRING.size
+    text_offset = permissions_offset + len(permission_rows) * _PERMISSION.size
+    extras_offset = text_offset + len(text_blob)
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, len(records), len(string_list), len(permission_rows),
+                          strings_offset, permissions_offset, text_offset, extras_offset)
+    return b''.join([header, b''.join(records), b''.join(string_index),
+                     b''.join(_PERMISSION.pack(*row) for row in permission_rows),
+                     bytes(text_blob), bytes(extras_blob)])
+
+
+class BinaryFATTable(MutableMapping):
+    """Tabla FAT sobre el formato binario que decodifica cada entrada al pedirla.
+
+    Los registros tienen ancho fijo y están ordenados por nombre, así que una
+    entrada se encuentra con búsqueda binaria y se decodifica sin tocar las
+    demás. Las entradas pedidas o modificadas quedan en un diccionario en
+    memoria; las eliminadas se recuerdan aparte.
+    """
+
+    def __init__(self, raw=None):
+        if raw is None:
+            raw = encode_table({})
+        if len(raw) < _HEADER.size:
+            raise ValueError("tabla FAT binaria truncada")
+        (magic, version, self._count, self._string_count, self._permission_count, self._strings_offset,
+         self._permissions_offset, self._text_offset, self._extras_offset) = _HEADER.unpack_from(raw)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError("no es una tabla FAT binaria")
+        if self._extras_offset > len(raw):
+            raise ValueError("tabla FAT binaria truncada")
+        self._raw = raw
+        # Cadenas ya decodificadas (dueños y usuarios se repiten mucho)
+        self._strings = {}
+        self._entries = {}
+        self._deleted = set()
+        self._added = set()
+
+    # --- Acceso a los registros ---
+
+    def _string(self, string_id):
+        text = self._strings.get(string_id)
+        if text is None:
+            offset, length = _STRING.unpack_from(self._raw, self._strings_offset + string_id * _STRING.size)
+            start = self._text_offset + offset
+            text = self._strings[string_id] = self._raw[start:start + length].decode('utf-8')
+        return text
+
+    def _record(self, position):
+        return _RECORD.unpack_from(self._raw, _HEADER.size + position * _RECORD.size)
+
+    def _name(self, position):
+        return self._string(_RECORD.unpack_from(self._raw, _HEADER.size + position * _RECORD.size)[0])
+
+    def _find(self, filename):
+        """Posición del registro de filename (búsqueda binaria) o -1"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            name = self._name(middle)
+            if name < filename:
+                low = middle + 1
+            elif name > filename:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def _permissions(self, start, count):
+        permissions = {}
+        for row in range(start, start + count):
+            user_id, mask = _PERMISSION.unpack_from(self._raw, self._permissions_offset + row * _PERMISSION.size)
+            permissions[self._string(user_id)] = [name for name, bit in _PERMISSION_BITS.items() if mask & bit]
+        return permissions
+
+    def _decode(self, position):
+        (name_id, owner_id, present, flags, codec_id, creation, modification, deletion, total_chars,
+         version, block_size, initial_id, permission_start, permission_count,
+         extra_offset, extra_length) = self._record(position)
+        filename = self._string(name_id)
+        values = {
+            'filename': filename,
+            'initial_block': None,
+            'block_size': block_size,
+            'codec': CODEC_NAMES.get(codec_id, 'none'),
+            'in_recycle_bin': bool(flags & _FLAG_RECYCLE),
+            'total_chars': total_chars,
+            'creation_date': _decode_date(creation),
+            'modification_date': _decode_date(modification),
+            'deletion_date': _decode_date(deletion),
+            'owner': self._string(owner_id) if owner_id != _NO_STRING else None,
+            'is_binary': bool(flags & _FLAG_BINARY),
+            'is_large_file': bool(flags & _FLAG_LARGE),
+            'permissions': None,
+            'version': version,
+            'is_directory': bool(flags & _FLAG_DIRECTORY)
+        }
+        if present & _PRESENT['initial_block']:
+            initial_block = self._string(initial_id)
+            values['initial_block'] = int(initial_block) if flags & _FLAG_NUMERIC_BLOCK else initial_block
+        if present & _PRESENT['permissions']:
+            values['permissions'] = self._permissions(permission_start, permission_count)
+
+        entry = {key: value for key, value in values.items() if present & _PRESENT[key]}
+        if extra_length:
+            start = self._extras_offset + extra_offset
+            entry.update(json.loads(self._raw[start:start + extra_length].decode('utf-8')))
+        return filename, entry
+
+    def index_items(self):
+        """Campos indexados (dueño, papelera, permisos, directorio) sin decodificar entradas completas"""
+        for position in range(self._count):
+            record = self._record(position)
+            filename = self._string(record[0])
+            if filename in self._deleted:
+                continue
+            entry = self._entries.get(filename)
+            if entry is not None:
+                yield filename, entry
+                continue
+            present, flags = record[2], record[3]
+            if present & _INDEXED != _INDEXED:
+                # Algún campo indexado quedó en los extras: decodificar la entrada completa
+                yield filename, self._decode(position)[1]
+                continue
+            owner = self._string(record[1]) if record[1] != _NO_STRING else None
+            yield filename, {
+                'owner': owner,
+                'in_recycle_bin': bool(flags & _FLAG_RECYCLE),
+                'permissions': self._permissions(record[12], record[13]),
+                'is_directory': bool(flags & _FLAG_DIRECTORY)
+            }
+        for filename in self._added:
+            yield filename, self._entries[filename]
+
+    def _items(self):
+        """Recorre los registros en orden sin buscarlos uno por uno"""
+        for position in range(self._count):
+            filename = self._name(position)
+            if filename in self._deleted:
+                continue
+            entry = self._entries.get(filename)
+            if entry is None:
+                entry = self._entries[filename] = self._decode(position)[1]
+            yield filename, entry
+        for filename in list(self._added):
+            yield filename, self._entries[filename]
+
+    # --- Interfaz de diccionario ---
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    def __getitem__(self, filename):
+        entry = self._entries.get(filename)
+        if entry is not None:
+            return entry
+        if filename in self._deleted or not isinstance(filename, str):
+            raise KeyError(filename)
+        position = self._find(filename)
+        if position < 0:
+            raise KeyError(filename)
+        entry = self._entries[filename] = self._decode(position)[1]
+        return entry
+
+    def __setitem__(self, filename, entry):
+        if filename not in self._entries and filename not in self._deleted and self._find(filename) < 0:
+            self._added.add(filename)
+        self._deleted.discard(filename)
+        self._entries[filename] = entry
+
+    def __delitem__(self, filename):
+        if filename not in self:
+            raise KeyError(filename)
+        self._entries.pop(filename, None)
+        if filename in self._added:
+            self._added.discard(filename)
+        else:
+            self._deleted.add(filename)
+
+    def __contains__(self, filename):
+        if filename in self._entries:
+            return True
+        if filename in self._deleted or not isinstance(filename, str):
+            return False
+        return self._find(filename) >= 0
+
+    def __iter__(self):
+        for position in range(self._count):
+            filename = self._name(position)
+            if filename not in self._deleted:
+                yield filename
+        yield from list(self._added)
+
+    def __len__(self):
+        return self._count - len(self._deleted) + len(self._added)
+
+    def clear(self):
+        self.__init__()
+
+
+def json_to_binary(json_path, binary_path):
+    """Convierte fat_table.json al formato binario; retorna la cantidad de entradas"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        fat_table = json.load(f)
+    with open(binary_path, 'wb') as f:
+        f.write(encode_table(fat_table))
+    return len(fat_table)
+
+
+def binary_to_json(binary_path, json_path):
+    """Convierte una tabla binaria a fat_table.json; retorna la cantidad de entradas"""
+    with open(binary_path, 'rb') as f:
+        fat_table = dict(BinaryFATTable(f.read()))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(fat_table, f, indent=2, ensure_ascii=False)
+    return len(fat_table)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        yield from self._mapping._items()
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        for _, entry in self._mapping._items():
+            yield entry
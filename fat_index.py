@@ -0,0 +1,142 @@
+import threading
+
+
+class FATIndex:
+    """Índices secundarios de la tabla FAT.
+
+    Mantiene dueño -> archivos, usuario con permisos -> archivos, los
+    conjuntos de archivos activos y en la papelera y el árbol de directorios
+    (directorio -> hijos), para que las consultas cuesten lo que mide su
+    resultado y no lo que mide el volumen. Los directorios solo están en el
+    árbol. Los conjuntos son diccionarios con valor None para conservar el orden.
+    Reconstruir solo recuerda la tabla: los índices se arman en la primera
+    consulta o actualización, así cargar una tabla grande no los recorre.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._source = None
+            self._by_owner = {}
+            self._by_grantee = {}
+            self._active = {}
+            self._trash = {}
+            self._children = {}
+            # Claves con las que está indexado cada archivo (para poder quitarlo)
+            self._keys = {}
+
+    def rebuild(self, fat_table):
+        with self._lock:
+            self.clear()
+            self._source = fat_table
+    
+    def _ensure(self):
+        """Arma los índices pendientes de la última reconstrucción"""
+        if self._source is None:
+            return
+        fat_table, self._source = self._source, None
+        # Las tablas binarias entregan solo los campos indexados sin decodificar todo
+        items = fat_table.index_items() if hasattr(fat_table, 'index_items') else fat_table.items()
+        for filename, entry in items:
+            self._add(filename, entry)
+
+    @staticmethod
+    def _entry_keys(entry):
+        grantees = tuple(user for user, permissions in entry.get('permissions', {}).items()
+                         if permissions and user != entry.get('owner'))
+        return entry.get('owner'), bool(entry.get('in_recycle_bin')), grantees, bool(entry.get('is_directory'))
+
+    @staticmethod
+    def parent(path):
+        """Directorio que contiene la ruta ('' es la raíz)"""
+        return path.rpartition('/')[0]
+
+    def _add(self, filename, entry):
+        owner, in_trash, grantees, is_directory = keys = self._entry_keys(entry)
+        self._keys[filename] = keys
+        self._children.setdefault(self.parent(filename), {})[filename] = None
+        if is_directory:
+            return
+        self._by_owner.setdefault(owner, {})[filename] = None
+        for user in grantees:
+            self._by_grantee.setdefault(user, {})[filename] = None
+        (self._trash if in_trash else self._active)[filename] = None
+
+    def _remove(self, filename):
+        keys = self._keys.pop(filename, None)
+        if keys is None:
+            return
+        owner, in_trash, grantees, is_directory = keys
+        self._discard(self._children, self.parent(filename), filename)
+        if is_directory:
+            return
+        self._discard(self._by_owner, owner, filename)
+        for user in grantees:
+            self._discard(self._by_grantee, user, filename)
+        (self._trash if in_trash else self._active).pop(filename, None)
+
+    @staticmethod
+    def _discard(index, key, filename):
+        filenames = index.get(key)
+        if filenames is not None:
+            filenames.pop(filename, None)
+            if not filenames:
+                del index[key]
+
+    def update(self, filename, entry):
+        """Reindexa un archivo después de un cambio; entry None si se eliminó"""
+        with self._lock:
+            self._ensure()
+            if entry is not None and self._keys.get(filename) == self._entry_keys(entry):
+                return
+            self._remove(filename)
+            if entry is not None:
+                self._add(filename, entry)
+
+    def active(self):
+        with self._lock:
+            self._ensure()
+            return list(self._active)
+
+    def recycle_bin(self):
+        with self._lock:
+            self._ensure()
+            return list(self._trash)
+
+    def owned_by(self, owner):
+        with self._lock:
+            self._ensure()
+            return list(self._by_owner.get(owner, ()))
+
+    def shared_with(self, user):
+        with self._lock:
+            self._ensure()
+            return list(self._by_grantee.get(user, ()))
+
+    def children(self, directory):
+        """Rutas de los archivos y directorios contenidos directamente en directory"""
+        with self._lock:
+            self._ensure()
+            return list(self._children.get(directory, ()))
+
+    def is_directory(self, path):
+        with self._lock:
+            self._ensure()
+            keys = self._keys.get(path)
+            return keys is not None and keys[3]
+
+    def descendants(self, directory):
+        """Rutas de todo el subárbol de directory, recorriendo solo ese subárbol"""
+        with self._lock:
+            self._ensure()
+            paths = []
+            pending = [directory]
+            while pending:
+                for path in self._children.get(pending.pop(), ()):
+                    paths.append(path)
+                    if self.is_directory(path):
+                        pending.append(path)
+            return paths
@@ -0,0 +1,263 @@
+import io
+import bisect
+import codecs
+from block_manager import DEFAULT_BLOCK_SIZE
+
+
+class _CharacterStream(io.TextIOBase):
+    """Base de los manejadores de texto de solo lectura con posiciones en caracteres.
+
+    seek/tell/read/readline trabajan sobre _position y _length; cada
+    subclase solo dice en qué trozo de texto cae una posición con
+    _chunk_at(position), que retorna (primer carácter, texto) y un texto
+    vacío después del final.
+    """
+
+    def __init__(self, file_info):
+        super().__init__()
+        self._length = file_info.get('total_chars', 0)
+        self.name = file_info['filename']
+        self._position = 0
+        self._cached_data = ""
+
+    def _chunk_at(self, position):
+        raise NotImplementedError
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        self._checkClosed()
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._length + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if position < 0:
+            raise ValueError(f"Posición negativa: {position}")
+        self._position = position
+        return position
+
+    def read(self, size=-1):
+        self._checkClosed()
+        if size is None or size < 0:
+            size = max(self._length - self._position, 0)
+
+        pieces = []
+        while size > 0:
+            chunk_start, data = self._chunk_at(self._position)
+            start = self._position - chunk_start
+            if start >= len(data):
+                break
+            piece = data[start:start + size]
+            pieces.append(piece)
+            self._position += len(piece)
+            size -= len(piece)
+        return "".join(pieces)
+
+    def readline(self, size=-1):
+        self._checkClosed()
+        if size is None:
+            size = -1
+
+        pieces = []
+        read = 0
+        while size < 0 or read < size:
+            chunk_start, data = self._chunk_at(self._position)
+            start = self._position - chunk_start
+            if start >= len(data):
+                break
+            end = data.find("\n", start)
+            end = len(data) if end < 0 else end + 1
+            if size >= 0:
+                end = min(end, start + size - read)
+            piece = data[start:end]
+            pieces.append(piece)
+            self._position += len(piece)
+            read += len(piece)
+            if piece.endswith("\n"):
+                break
+        return "".join(pieces)
+
+    def close(self):
+        self._cached_data = ""
+        super().close()
+
+
+class BlockStream(_CharacterStream):
+    """Manejador de solo lectura que recorre los bloques de un archivo bajo demanda.
+
+    Solo mantiene en memoria el bloque actual y los ids ya descubiertos, así
+    que el consumo es acotado sin importar el tamaño del archivo. Las
+    posiciones de seek/tell se expresan en caracteres.
+    """
+
+    def __init__(self, block_manager, file_info):
+        super().__init__(file_info)
+        self._block_manager = block_manager
+        self._block_size = file_info.get('block_size', DEFAULT_BLOCK_SIZE)
+
+        if 'blocks' in file_info:
+            self._block_ids = list(file_info['blocks'])
+            self._next_unknown = None
+        else:
+            # Sin lista explícita se descubren los ids siguiendo next_block
+            self._block_ids = []
+            self._next_unknown = file_info['initial_block']
+
+        self._cached_index = None
+
+    def _block_id(self, index):
+        """Retorna el id del bloque index, siguiendo la cadena si hace falta"""
+        while index >= len(self._block_ids) and self._next_unknown:
+            block_id = self._next_unknown
+            block_data = self._block_manager.read_block(block_id)
+            self._block_ids.append(block_id)
+            self._next_unknown = None if block_data['eof'] else block_data['next_block']
+            self._cached_index, self._cached_data = len(self._block_ids) - 1, block_data['data']
+        return self._block_ids[index] if index < len(self._block_ids) else None
+
+    def _block(self, index):
+        """Retorna el contenido del bloque index (o None después del final)"""
+        if index == self._cached_index:
+            return self._cached_data
+        block_id = self._block_id(index)
+        if block_id is None:
+            return None
+        if index != self._cached_index:
+            self._cached_data = self._block_manager.read_block(block_id)['data']
+            self._cached_index = index
+        return self._cached_data
+
+    def _chunk_at(self, position):
+        index = position // self._block_size
+        return index * self._block_size, self._block(index) or ""
+
+    def close(self):
+        self._cached_index = None
+        super().close()
+
+
+class ExtentStream(_CharacterStream):
+    """Manejador de solo lectura de un archivo con extents, con posiciones en caracteres.
+
+    Los extents guardan UTF-8, así que un carácter no siempre ocupa un byte:
+    el contenido se decodifica por ventanas de WINDOW bytes y se recuerda en
+    qué carácter y byte empieza cada ventana ya leída, para que seek/tell se
+    expresen en caracteres como en BlockStream sin releer desde el principio.
+    En los archivos ASCII caracteres y bytes coinciden.
+    """
+
+    WINDOW = 64 * 1024
+
+    def __init__(self, block_manager, file_info):
+        super().__init__(file_info)
+        self._block_manager = block_manager
+        self._extents = file_info['extents']
+        self._total_bytes = file_info.get('total_bytes', self._length)
+        self._ascii = self._total_bytes == self._length
+        # Carácter y byte donde empieza cada ventana conocida (listas ordenadas)
+        self._window_chars = [0]
+        self._window_bytes = [0]
+        self._cached_start = 0
+
+    def _decode(self, byte):
+        """Decodifica una ventana desde byte; retorna (texto, byte donde termina)"""
+        raw = self._block_manager.read_extent_bytes(self._extents, byte, self.WINDOW)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        # Un carácter cortado al final de la ventana queda para la siguiente
+        text = decoder.decode(raw, final=byte + len(raw) >= self._total_bytes)
+        return text, byte + len(raw) - len(decoder.getstate()[0])
+
+    def _chunk_at(self, position):
+        """Retorna (primer carácter, texto) de la ventana que contiene position"""
+        if self._cached_start <= position < self._cached_start + len(self._cached_data):
+            return self._cached_start, self._cached_data
+        if self._ascii:
+            start = position - position % self.WINDOW
+            self._cached_start, self._cached_data = start, self._decode(start)[0]
+            return self._cached_start, self._cached_data
+
+        index = bisect.bisect_right(self._window_chars, position) - 1
+        while True:
+            start = self._window_chars[index]
+            text, end = self._decode(self._window_bytes[index])
+            if index == len(self._window_chars) - 1 and text:
+                self._window_chars.append(start + len(text))
+                self._window_bytes.append(end)
+            if position < start + len(text) or not text:
+                self._cached_start, self._cached_data = start, text
+                return start, text
+            index += 1
+
+
+class _RangeReader(io.RawIOBase):
+    """Lector binario sobre una función read_bytes(posición, tamaño) y la longitud total"""
+
+    def __init__(self, read_bytes, length):
+        super().__init__()
+        self._read_bytes = read_bytes
+        self._length = length
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        if offset < 0:
+            raise ValueError(f"Posición negativa: {offset}")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        size = min(len(buffer), max(self._length - self._position, 0))
+        if size == 0:
+            return 0
+        data = self._read_bytes(self._position, size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class ExtentReader(_RangeReader):
+    """Lector binario sobre los extents de un archivo"""
+
+    def __init__(self, block_manager, extents):
+        super().__init__(self._read_extents, sum(length for _, length in extents))
+        self._block_manager = block_manager
+        self._extents = extents
+
+    def _read_extents(self, position, size):
+        return self._block_manager.read_extent_bytes(self._extents, position, size)
+
+
+class ChunkReader(_RangeReader):
+    """Lector binario sobre los trozos de un archivo grande (ver ChunkStore)"""
+
+    def __init__(self, chunk_store, chunks):
+        super().__init__(self._read_chunks, sum(size for _, size in chunks))
+        self._chunk_store = chunk_store
+        self._chunks = chunks
+
+    def _read_chunks(self, position, size):
+        return self._chunk_store.read_range(self._chunks, position, size)
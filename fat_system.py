@@ -1,22 +1,179 @@
 import os
 import json
+import uuid
+import base64
+import hashlib
+import mmap
 from datetime import datetime
-from block_manager import BlockManager
+from block_manager import BlockManager, DEFAULT_BLOCK_SIZE
+from fat_table_manager import FATTableManager, DamagedTableError, deferred_commit
+from fat_binary import json_to_binary, binary_to_json
+from sqlite_fat_table import SQLiteFATTable
+from sharded_fat_table import ShardedFATTable, SHARDS_META
+from sqlite_store import remove_database
 from permission_manager import PermissionManager
+from fat_stream import BlockStream, ExtentStream, ChunkReader
+from chunk_store import ChunkStore, ChunkWriter, read_manifest, write_manifest
+from fat_transaction import FATTransaction, TransactionAborted
+from file_lock import FileLock
+from block_codecs import CODECS
+import io
 import zipfile
 import shutil
+import threading
+import functools
+from contextlib import contextmanager
+
+# Configuración por defecto del volumen (data/config.json la sobrescribe)
+DEFAULT_CONFIG = {
+    # Almacenamiento de bloques: json, segment, extent o sqlite
+    'storage_mode': 'json',
+    # Almacenamiento de la tabla FAT: json (fat_table.json + journal), sqlite o
+    # sharded (data/fat_shards/, un archivo y un journal por shard)
+    'metadata_backend': 'json',
+    # Cantidad de shards al crear la tabla sharded (después se cambia con reshard)
+    'fat_shard_count': 16,
+    # Formato de la tabla completa con el backend json: json o binary (fat_table.bin)
+    'fat_table_format': 'json',
+    # Entero o 'auto' para elegirlo según el tamaño del contenido
+    'block_size': 'auto',
+    # Guardar en la entrada FAT la lista ordenada de bloques (acceso aleatorio)
+    'store_block_list': True,
+    # Deduplicar el contenido de los bloques por hash con contadores de referencias
+    'dedup': False,
+    # Códec de compresión de bloques: none, zlib, bz2, lzma o 'auto'
+    'compression': 'none',
+    # Ids de bloque: 'uuid' o 'numeric' (números de cluster reutilizables)
+    'block_ids': 'uuid',
+    # Escritura de la tabla FAT: immediate, batched, on_close o group
+    'fat_write_policy': 'immediate',
+    'fat_batch_size': 100,
+    'fat_batch_interval': 2.0,
+    # Ventana (segundos) en la que se agrupan los cambios con la política group
+    'fat_group_window': 0.005,
+    # Journal de cambios de la tabla FAT con checkpoints periódicos
+    'fat_journal': True,
+    'fat_checkpoint_records': 1000,
+    'fat_checkpoint_bytes': 4 * 1024 * 1024,
+    # Bloqueo lector/escritor entre procesos sobre data/fat.lock; con él activo
+    # los cambios se escriben al liberar el bloqueo aunque la política sea batched
+    'fat_locking': True
+}
+
+# Los binarios de más de esta cantidad de bytes se guardan enteros en data/large_files
+LARGE_FILE_THRESHOLD = 1000000
+
+# Tamaño de las partes en que import_file copia un archivo del disco
+IMPORT_CHUNK_SIZE = 1024 * 1024
+
+# Índice de un backup de directorio (entradas FAT; el contenido va en files/<ruta>)
+DIRECTORY_BACKUP_MANIFEST = 'directory_backup.json'
+
+
+def _reads(method):
+    """Ejecuta el método con el bloqueo compartido del volumen"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._shared_lock():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _writes(method):
+    """Ejecuta el método con el bloqueo exclusivo del volumen.
+    
+    Si la tabla FAT está dañada el cambio se rechaza: se descartan los
+    cambios hechos en la caché y el método retorna False.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with self._exclusive_lock():
+                return method(self, *args, **kwargs)
+        except DamagedTableError as e:
+            self.fat_table_manager.invalidate()
+            print(e)
+            return False
+    return wrapper
 
 class FATFileSystem:
     def __init__(self):
         self.data_dir = "data"
         self.fat_table_path = os.path.join(self.data_dir, "fat_table.json")
+        self.fat_table_bin_path = os.path.join(self.data_dir, "fat_table.bin")
+        self.fat_journal_path = os.path.join(self.data_dir, "fat_journal.log")
+        self.fat_db_path = os.path.join(self.data_dir, "fat.db")
+        self.fat_shards_dir = os.path.join(self.data_dir, "fat_shards")
+        self.lock_path = os.path.join(self.data_dir, "fat.lock")
         self.blocks_dir = os.path.join(self.data_dir, "blocks")
         self.backup_dir = os.path.join(self.data_dir, "backups")
         self.large_files_dir = os.path.join(self.data_dir, "large_files")
         self.users_file = os.path.join(self.data_dir, "users.json")
-        self.block_manager = BlockManager(self.blocks_dir)
+        self.config_path = os.path.join(self.data_dir, "config.json")
+        self.config = self._load_config()
+        self.fat_lock = FileLock(self.lock_path, self.config['fat_locking'])
+        self.block_manager = self._create_block_manager()
+        self.fat_table_manager = self._create_fat_table_manager()
+        self.chunk_store = ChunkStore(os.path.join(self.large_files_dir, "chunks"))
         self.permission_manager = PermissionManager()
+        # Transacción en curso de cada hilo (ver transaction())
+        self._local = threading.local()
         
+    def _create_block_manager(self):
+        return BlockManager(self.blocks_dir, self.config['storage_mode'],
+                            self.config['dedup'], self.config['block_ids'])
+    
+    def _fat_snapshot_path(self, table_format=None):
+        """Archivo de la tabla completa según su formato (backend json)"""
+        table_format = table_format or self.config['fat_table_format']
+        return self.fat_table_bin_path if table_format == 'binary' else self.fat_table_path
+    
+    def _fat_table_file(self):
+        """Archivo que debe existir para que la tabla FAT del backend actual exista"""
+        backend = self.config['metadata_backend']
+        if backend == 'sqlite':
+            return self.fat_db_path
+        if backend == 'sharded':
+            return os.path.join(self.fat_shards_dir, SHARDS_META)
+        return self._fat_snapshot_path()
+    
+    def _create_fat_table_manager(self, backend=None, table_format=None):
+        backend = backend or self.config['metadata_backend']
+        if backend == 'sharded':
+            return ShardedFATTable(
+                self.fat_shards_dir,
+                self.config['fat_shard_count'],
+                self.config['fat_write_policy'],
+                self.config['fat_batch_size'],
+                self.config['fat_batch_interval'],
+                self.config['fat_checkpoint_records'],
+                self.config['fat_checkpoint_bytes'],
+                self.config['fat_journal'],
+                self.config['fat_group_window'],
+                table_format or self.config['fat_table_format']
+            )
+        if backend == 'sqlite':
+            os.makedirs(self.data_dir, exist_ok=True)
+            return SQLiteFATTable(
+                self.fat_db_path,
+                self.config['fat_write_policy'],
+                self.config['fat_batch_size'],
+                self.config['fat_batch_interval']
+            )
+        return FATTableManager(
+            self._fat_snapshot_path(table_format),
+            self.config['fat_write_policy'],
+            self.config['fat_batch_size'],
+            self.config['fat_batch_interval'],
+            self.fat_journal_path,
+            self.config['fat_checkpoint_records'],
+            self.config['fat_checkpoint_bytes'],
+            self.config['fat_journal'],
+            self.config['fat_group_window'],
+            table_format or self.config['fat_table_format']
+        )
+    
+    @_writes
     def initialize_system(self):
         """Inicializa el sistema creando directorios necesarios"""
         os.makedirs(self.data_dir, exist_ok=True)
@@ -24,35 +181,530 @@ class FATFileSystem:
         os.makedirs(self.backup_dir, exist_ok=True)
         os.makedirs(self.large_files_dir, exist_ok=True)
         
-        if not os.path.exists(self.fat_table_path):
+        if self.config['metadata_backend'] != 'sqlite' and not os.path.exists(self._fat_table_file()):
             self._save_fat_table({})
+            self.fat_table_manager.flush()
+        
+        # Reaplicar los cambios del journal que no llegaron a un checkpoint
+        replayed = self.fat_table_manager.recover()
+        if replayed:
+            print(f"Journal de la tabla FAT: {replayed} cambios recuperados")
     
-    def _load_fat_table(self):
-        """Carga la tabla FAT desde el archivo JSON"""
+    def _load_config(self):
+        """Carga la configuración del volumen combinada con los valores por defecto"""
+        config = dict(DEFAULT_CONFIG)
         try:
-            with open(self.fat_table_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config.update(json.load(f))
         except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            pass
+        return config
+    
+    def save_config(self, **changes):
+        """Actualiza y guarda la configuración del volumen"""
+        self.config.update(changes)
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f, indent=2, ensure_ascii=False)
+    
+    @_writes
+    def migrate_backend(self, metadata_backend=None, storage_mode=None):
+        """Pasa la tabla FAT y/o los bloques a otro backend y actualiza la configuración"""
+        if self.fat_table_manager.damaged:
+            return False, "La tabla FAT está dañada; no se puede migrar"
+        messages = []
+        if metadata_backend and metadata_backend != self.config['metadata_backend']:
+            fat_table = dict(self._load_fat_table())
+            target = self._create_fat_table_manager(metadata_backend)
+            target.save(fat_table)
+            target.close()
+            
+            # Los archivos del backend anterior se borran solo después de confirmar el nuevo
+            self.fat_table_manager.close()
+            if self.config['metadata_backend'] == 'sqlite':
+                remove_database(self.fat_db_path)
+            elif self.config['metadata_backend'] == 'sharded':
+                shutil.rmtree(self.fat_shards_dir, ignore_errors=True)
+            else:
+                snapshot_path = self._fat_snapshot_path()
+                for path in (snapshot_path, snapshot_path + '.bak', self.fat_journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            self.save_config(metadata_backend=metadata_backend)
+            self.fat_table_manager = self._create_fat_table_manager()
+            messages.append(f"Tabla FAT: {len(fat_table)} entradas migradas a {metadata_backend}")
+        
+        if storage_mode and storage_mode != self.config['storage_mode']:
+            migrated = self.block_manager.migrate_storage(storage_mode)
+            if migrated is None:
+                return False, f"No se puede migrar los bloques de {self.config['storage_mode']} a {storage_mode}"
+            self.block_manager.close()
+            self.save_config(storage_mode=storage_mode)
+            self.block_manager = self._create_block_manager()
+            messages.append(f"Bloques: {migrated} registros migrados a {storage_mode}")
+        
+        return True, "\n".join(messages) or "Nada que migrar"
+    
+    @_writes
+    def migrate_to_segments(self):
+        """Pasa los bloques JSON sueltos a segmentos y activa el modo segmento.
+        
+        Solo aplica a volúmenes json o segment (bloques JSON que quedaron de
+        antes); los demás modos se migran con migrate_backend.
+        """
+        storage_mode = self.config['storage_mode']
+        if storage_mode == 'json':
+            return self.migrate_backend(storage_mode='segment')
+        if storage_mode != 'segment':
+            return False, f"El volumen usa el modo {storage_mode}, no json: no hay bloques JSON que pasar a segmentos"
+        return True, f"Bloques: {self.block_manager.migrate_to_segments()} registros JSON migrados a segment"
+    
+    @_writes
+    def compact_segments(self):
+        """Recupera el espacio que dejan en los segmentos los bloques modificados o eliminados"""
+        if self.config['storage_mode'] != 'segment':
+            return False, f"El volumen usa el modo {self.config['storage_mode']}, no segment"
+        store = self.block_manager.record_store
+        dead_bytes = store.stats()['dead_bytes']
+        blocks = store.compact()
+        stats = store.stats()
+        return True, (f"Segmentos compactados: {blocks} registros vivos en {stats['segments']} segmentos "
+                      f"• {dead_bytes} bytes recuperados")
+    
+    @_writes
+    def convert_table_format(self, table_format):
+        """Convierte la tabla FAT entre fat_table.json y el formato binario fat_table.bin"""
+        if table_format not in ('json', 'binary'):
+            return False, f"Formato de tabla desconocido: {table_format}"
+        if self.config['metadata_backend'] == 'sqlite':
+            return False, "El formato de tabla no aplica al backend sqlite"
+        if table_format == self.config['fat_table_format']:
+            return True, "Nada que convertir"
+        
+        if self.config['metadata_backend'] == 'sharded':
+            # Los shards se reescriben en el formato nuevo conservando su cantidad
+            entries = self.fat_table_manager.reshard(self.fat_table_manager.shard_count, table_format)
+            self.save_config(fat_table_format=table_format)
+            return True, f"Tabla FAT: {entries} entradas convertidas a {table_format}"
+        
+        if self.fat_table_manager.damaged:
+            return False, "La tabla FAT está dañada; no se puede convertir"
+        
+        # El checkpoint deja toda la tabla en el archivo completo y el journal vacío
+        self.fat_table_manager.checkpoint()
+        self.fat_table_manager.close()
+        
+        source_path = self._fat_snapshot_path()
+        target_path = self._fat_snapshot_path(table_format)
+        convert = json_to_binary if table_format == 'binary' else binary_to_json
+        entries = convert(source_path, target_path)
+        
+        # El archivo anterior se borra solo después de escribir el nuevo
+        for path in (source_path, source_path + '.bak'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.save_config(fat_table_format=table_format)
+        self.fat_table_manager = self._create_fat_table_manager()
+        return True, f"Tabla FAT: {entries} entradas convertidas a {table_format}"
+    
+    @_writes
+    def reshard(self, shard_count):
+        """Reparte la tabla FAT en otra cantidad de shards sin cerrar el volumen.
+        
+        Se hace con el bloqueo exclusivo: los demás procesos esperan y al
+        retomar detectan los shards nuevos por su shards.json.
+        """
+        if self.config['metadata_backend'] != 'sharded':
+            return False, "La tabla FAT no está repartida en shards (metadata_backend 'sharded')"
+        if not isinstance(shard_count, int) or shard_count < 1:
+            return False, "La cantidad de shards debe ser un entero positivo"
+        if self.fat_table_manager.damaged:
+            return False, "La tabla FAT está dañada; no se puede repartir"
+        
+        previous = self.fat_table_manager.shard_count
+        entries = self.fat_table_manager.reshard(shard_count)
+        self.save_config(fat_shard_count=shard_count)
+        return True, f"Tabla FAT: {entries} entradas repartidas de {previous} a {shard_count} shards"
+    
+    @_writes
+    def migrate_binaries(self):
+        """Pasa a blobs los binarios pequeños guardados como texto base64 en los bloques"""
+        fat_table = self._load_fat_table()
+        pending = [filename for filename, entry in fat_table.items()
+                   if entry.get('is_binary', False) and not entry.get('is_large_file', False)
+                   and 'blob' not in entry]
+        saved_bytes = 0
+        try:
+            with self.transaction():
+                fat_table = self._load_fat_table()
+                for filename in pending:
+                    file_info = fat_table[filename]
+                    content = self._read_binary(file_info)
+                    saved_bytes += -(-len(content) // 3) * 4 - len(content)
+                    self._rewrite_blob_file(file_info, content)
+                    self._save_fat_table(fat_table, filename)
+        except Exception as e:
+            return False, f"Error migrando binarios: {e}"
+        return True, f"Binarios migrados a blobs: {len(pending)} ({saved_bytes} bytes de base64 ahorrados)"
+    
+    @_writes
+    def migrate_large_files(self):
+        """Corta en trozos los archivos grandes guardados como un único archivo"""
+        fat_table = self._load_fat_table()
+        pending = [filename for filename, entry in fat_table.items()
+                   if entry.get('is_large_file', False) and 'chunk_manifest' not in entry]
+        try:
+            with self.transaction():
+                fat_table = self._load_fat_table()
+                for filename in pending:
+                    self._large_file_chunks(fat_table[filename])
+                    self._save_fat_table(fat_table, filename)
+        except Exception as e:
+            return False, f"Error migrando archivos grandes: {e}"
+        stats = self.chunk_store.stats()
+        return True, (f"Archivos grandes cortados en trozos: {len(pending)} "
+                      f"({stats['unique_chunks']} trozos únicos, {stats['bytes_saved']} bytes compartidos)")
+    
+    def chunk_stats(self):
+        """Reutilización de los trozos de archivos grandes (ver ChunkStore.stats)"""
+        return self.chunk_store.stats()
+    
+    def _load_fat_table(self):
+        """Retorna la tabla FAT (en memoria, recargada si cambió en disco)"""
+        transaction = self._current_transaction()
+        if transaction is not None:
+            return transaction.table
+        return self.fat_table_manager.load()
+    
+    def _save_fat_table(self, fat_table, filename=None):
+        """Guarda la tabla FAT; con filename solo se registra el cambio de esa entrada"""
+        # Versión por entrada para detectar escrituras concurrentes (ver modify_file)
+        if filename is not None and filename in fat_table:
+            file_info = fat_table[filename]
+            file_info['version'] = file_info.get('version', 0) + 1
+        
+        transaction = self._current_transaction()
+        if transaction is not None:
+            transaction.record_change(filename)
+            return
+        self.fat_table_manager.save(fat_table, filename)
+    
+    @contextmanager
+    def _shared_lock(self):
+        with self.fat_lock.shared():
+            if self.fat_lock.depth == 1:
+                self.block_manager.refresh()
+            yield
+    
+    @contextmanager
+    def _exclusive_lock(self):
+        """Bloqueo exclusivo; al liberarlo los cambios quedan en disco para otros procesos.
+        
+        Con la política group el commit se espera después de soltar el bloqueo
+        entre hilos, para que los demás hilos sumen sus cambios a la misma
+        escritura; el bloqueo entre procesos se conserva (pin) hasta entonces.
+        """
+        pinned = False
+        try:
+            with deferred_commit(), self.fat_lock.exclusive():
+                if self.fat_lock.depth == 1:
+                    self.block_manager.refresh()
+                try:
+                    yield
+                finally:
+                    if self.fat_lock.depth == 1 and self.fat_lock.enabled:
+                        if self.config['fat_write_policy'] == 'group':
+                            self.fat_lock.pin()
+                            pinned = True
+                        else:
+                            self.fat_table_manager.flush()
+        finally:
+            if pinned:
+                self.fat_lock.unpin()
+    
+    def _current_transaction(self):
+        return getattr(self._local, 'transaction', None)
+    
+    @contextmanager
+    def transaction(self):
+        """Agrupa cambios con una sola carga de la tabla FAT y un solo commit.
+        
+        Todo o nada: si el bloque lanza una excepción no se aplica ningún
+        cambio y se liberan los datos que se hayan creado. Las transacciones
+        anidadas se unen a la externa.
+        """
+        if self._current_transaction() is not None:
+            yield self._current_transaction()
+            return
+        
+        with self._exclusive_lock():
+            transaction = FATTransaction(self.fat_table_manager.load())
+            self._local.transaction = transaction
+            try:
+                yield transaction
+            except BaseException:
+                self._local.transaction = None
+                self._rollback(transaction)
+                raise
+            self._local.transaction = None
+            try:
+                self._commit(transaction)
+            except DamagedTableError:
+                # La tabla no se escribió: se descartan la caché y los datos nuevos
+                self.fat_table_manager.invalidate()
+                self._rollback(transaction)
+                raise
+    
+    def _commit(self, transaction):
+        fat_table = self.fat_table_manager.load()
+        final = transaction.final_entries()
+        if transaction.full_rewrite:
+            # La tabla de trabajo lee las entradas sin tocar de fat_table: copiarla antes de vaciarla
+            new_table = dict(transaction.table.items())
+            fat_table.clear()
+            fat_table.update(new_table)
+            self.fat_table_manager.save(fat_table)
+        elif final:
+            for filename, entry in final.items():
+                if entry is None:
+                    fat_table.pop(filename, None)
+                else:
+                    fat_table[filename] = entry
+            self.fat_table_manager.save_many(fat_table, list(final))
+        
+        # Los datos viejos se liberan solo una vez confirmada la tabla
+        transaction.run_deferred({self._storage_key(entry) for entry in final.values() if entry})
+    
+    def _rollback(self, transaction):
+        original = {self._storage_key(transaction.base[filename])
+                    for filename in transaction.changed if filename in transaction.base}
+        # Liberar lo pospuesto que no pertenece a la tabla original...
+        transaction.run_deferred(original)
+        # ...y los datos nuevos que quedaron referenciados por las entradas descartadas
+        for entry in transaction.final_entries().values():
+            if entry is not None and self._storage_key(entry) not in original:
+                self._free_storage(entry)
+    
+    @staticmethod
+    def _storage_key(file_info):
+        """Identifica los datos de un archivo (cadena, extents, blob o archivo grande)"""
+        if file_info.get('is_directory', False):
+            return ('directory', file_info['filename'])
+        if 'blob' in file_info:
+            blob = file_info['blob']
+            return ('blob', blob if isinstance(blob, str) else tuple(tuple(extent) for extent in blob))
+        if 'extents' in file_info:
+            return ('extents', tuple(tuple(extent) for extent in file_info['extents']))
+        if file_info.get('is_large_file', False):
+            return ('file', file_info.get('chunk_manifest') or file_info['file_path'])
+        return ('blocks', file_info['initial_block'])
+    
+    def _free_storage(self, file_info):
+        """Libera los datos de un archivo: extents, blob, cadena de bloques o archivo grande"""
+        if file_info.get('is_directory', False):
+            return
+        if 'blob' in file_info:
+            self.block_manager.delete_blob(file_info['blob'])
+        elif 'extents' in file_info:
+            self.block_manager.delete_extents(file_info['extents'])
+        elif not file_info.get('is_large_file', False):
+            self.block_manager.delete_blocks(file_info['initial_block'])
+        else:
+            try:
+                if 'chunk_manifest' in file_info:
+                    self.chunk_store.release_many(read_manifest(file_info['chunk_manifest']))
+                    os.remove(file_info['chunk_manifest'])
+                elif os.path.exists(file_info['file_path']):
+                    os.remove(file_info['file_path'])
+            except Exception:
+                pass
+    
+    def _release_storage(self, file_info):
+        """Libera los datos de un archivo; dentro de una transacción se pospone al commit"""
+        transaction = self._current_transaction()
+        if transaction is not None:
+            transaction.defer(self._storage_key(file_info), self._free_storage, file_info)
+        else:
+            self._free_storage(file_info)
+    
+    @staticmethod
+    def _normalize_path(path):
+        """Ruta canónica 'dir/sub/archivo' ('' es la raíz); None si no es válida"""
+        if not isinstance(path, str):
+            return None
+        parts = [part for part in path.strip().replace('\\', '/').split('/') if part not in ('', '.')]
+        if '..' in parts:
+            return None
+        return '/'.join(parts)
+    
+    @staticmethod
+    def _parent_directory(path):
+        return path.rpartition('/')[0]
+    
+    @staticmethod
+    def _is_file(fat_table, filename):
+        file_info = fat_table.get(filename) if filename else None
+        return file_info is not None and not file_info.get('is_directory', False)
+    
+    @staticmethod
+    def _is_directory(fat_table, path):
+        """La raíz siempre existe; el resto de directorios son entradas con is_directory"""
+        if path == '':
+            return True
+        file_info = fat_table.get(path)
+        return file_info is not None and file_info.get('is_directory', False)
+    
+    def _directory_writable(self, fat_table, directory, user):
+        """Se puede crear dentro de la raíz o de un directorio con permiso de escritura"""
+        if not self._is_directory(fat_table, directory):
+            print(f"El directorio no existe: {directory}")
+            return False
+        return directory == '' or self.permission_manager.can_write(fat_table[directory], user)
+    
+    def _child_paths(self, fat_table, directory, recursive=False):
+        """Rutas dentro de un directorio (solo hijos o todo el subárbol) usando el índice"""
+        if self._current_transaction() is not None:
+            # El índice refleja la tabla confirmada: en una transacción se recorre la copia de trabajo
+            prefix = directory + '/' if directory else ''
+            return [path for path in fat_table if path.startswith(prefix) and path != directory
+                    and (recursive or '/' not in path[len(prefix):])]
+        index = self.fat_table_manager.index
+        return index.descendants(directory) if recursive else index.children(directory)
+    
+    def _indexed_files(self, fat_table, filenames, matches):
+        """Entradas de los archivos que da el índice, con los cambios de la transacción en curso.
+        
+        El índice refleja la tabla confirmada: en una transacción los archivos
+        que cambió se vuelven a evaluar con matches sobre la copia de trabajo.
+        """
+        transaction = self._current_transaction()
+        if transaction is None:
+            return [fat_table[filename] for filename in filenames]
+        if transaction.full_rewrite:
+            changed = list(fat_table)
+            files = []
+        else:
+            changed = transaction.changed
+            files = [fat_table[filename] for filename in filenames if filename not in changed]
+        for filename in changed:
+            entry = fat_table.current(filename)
+            if entry is not None and not entry.get('is_directory', False) and matches(entry):
+                files.append(entry)
+        return files
+    
+    def create_files(self, files, owner, is_binary=False):
+        """Crea varios archivos (pares nombre, contenido) en una transacción: todos o ninguno"""
+        count = 0
+        try:
+            with self.transaction():
+                for filename, content in files:
+                    if not self.create_file(filename, content, owner, is_binary):
+                        raise TransactionAborted(f"No se pudo crear el archivo: {filename}")
+                    count += 1
+        except (TransactionAborted, DamagedTableError) as e:
+            return False, str(e)
+        return True, f"{count} archivos creados"
+    
+    def delete_files(self, filenames, user):
+        """Mueve varios archivos a la papelera en una transacción: todos o ninguno"""
+        return self._batch(filenames, lambda filename: self.delete_file(filename, user),
+                           "No se pudo eliminar el archivo", "archivos movidos a la papelera")
+    
+    def recover_files(self, filenames, user):
+        """Recupera varios archivos de la papelera en una transacción: todos o ninguno"""
+        return self._batch(filenames, lambda filename: self.recover_file(filename, user),
+                           "No se pudo recuperar el archivo", "archivos recuperados")
+    
+    def grant_permissions(self, grants, owner):
+        """Otorga varios permisos (tuplas archivo, usuario, permiso) en una transacción"""
+        return self._batch(grants, lambda grant: self.grant_permission(grant[0], owner, grant[1], grant[2]),
+                           "No se pudo otorgar el permiso", "permisos otorgados")
     
-    def _save_fat_table(self, fat_table):
-        """Guarda la tabla FAT en el archivo JSON"""
-        with open(self.fat_table_path, 'w', encoding='utf-8') as f:
-            json.dump(fat_table, f, indent=2, ensure_ascii=False)
+    def _batch(self, items, operation, error_message, done_message):
+        count = 0
+        try:
+            with self.transaction():
+                for item in items:
+                    if not operation(item):
+                        raise TransactionAborted(f"{error_message}: {item}")
+                    count += 1
+        except (TransactionAborted, DamagedTableError) as e:
+            return False, str(e)
+        return True, f"{count} {done_message}"
+    
+    def flush(self):
+        """Escribe a disco los cambios pendientes de la tabla FAT"""
+        self.fat_table_manager.flush()
+    
+    def close(self):
+        """Vacía los cambios pendientes y cierra el almacenamiento"""
+        # El cierre de la tabla hace un checkpoint: que ningún otro proceso escriba mientras tanto
+        with self.fat_lock.exclusive():
+            self.fat_table_manager.close()
+        self.block_manager.close()
+        self.chunk_store.close()
+        self.fat_lock.close()
+    
+    def _resolve_block_size(self, content, block_size=None):
+        """Determina el tamaño de bloque: explícito, el del volumen o automático"""
+        if block_size is None:
+            block_size = self.config.get('block_size', 'auto')
+        if block_size == 'auto':
+            return self.block_manager.choose_block_size(len(content))
+        block_size = int(block_size)
+        return block_size if block_size > 0 else None
+    
+    def _resolve_codec(self, content, block_size, codec=None):
+        """Determina el códec: explícito, el del volumen o elegido por muestreo"""
+        if codec is None:
+            codec = self.config.get('compression', 'none')
+        if codec == 'auto':
+            return self.block_manager.choose_codec(content, block_size)
+        return codec if codec in CODECS else None
+    
+    @staticmethod
+    def _binary_bytes(content):
+        """Contenido binario como bytes o memoryview; un str es base64 (API anterior)"""
+        if isinstance(content, str):
+            return base64.b64decode(content)
+        if isinstance(content, (bytes, bytearray)):
+            return content
+        return memoryview(content).cast('B')
     
-    def create_file(self, filename, content, owner, is_binary=False):
-        """Crea un nuevo archivo en el sistema"""
+    @_writes
+    def create_file(self, filename, content, owner, is_binary=False, block_size=None, codec=None):
+        """Crea un nuevo archivo en el sistema (filename puede ser una ruta 'dir/archivo').
+        
+        Los binarios se reciben como bytes o memoryview; un str se toma como base64.
+        """
         fat_table = self._load_fat_table()
         
-        if filename in fat_table:
+        filename = self._normalize_path(filename)
+        if not filename or filename in fat_table:
             return False  # Archivo ya existe
         
-        # Para archivos binarios grandes, usar almacenamiento directo
-        if is_binary and len(content) > 1000000:  # Más de 1MB
-            return self._create_large_binary_file(filename, content, owner, fat_table)
+        if not self._directory_writable(fat_table, self._parent_directory(filename), owner):
+            return False
+        
+        if is_binary:
+            content = self._binary_bytes(content)
+            # Para archivos binarios grandes, usar almacenamiento directo
+            if len(content) > LARGE_FILE_THRESHOLD:
+                return self._create_large_binary_file(filename, content, owner, fat_table)
+            return self._create_blob_file(filename, content, owner, fat_table)
+        
+        # En modo extent el contenido se guarda en tramos contiguos, sin cadena de bloques
+        if self.block_manager.extent_store is not None:
+            return self._create_extent_file(filename, content, owner, is_binary, fat_table)
         
         # Crear bloques de datos
-        block_chain = self.block_manager.create_blocks(content)
+        block_size = self._resolve_block_size(content, block_size)
+        if not block_size:
+            return False
+        codec = self._resolve_codec(content, block_size, codec)
+        if not codec:
+            return False
+        block_chain = self.block_manager.create_blocks_bulk(content, block_size, codec)
         if not block_chain:
             return False
         
@@ -61,6 +713,8 @@ class FATFileSystem:
         fat_table[filename] = {
             'filename': filename,
             'initial_block': block_chain[0],
+            'block_size': block_size,
+            'codec': codec,
             'in_recycle_bin': False,
             'total_chars': len(content),
             'creation_date': current_time,
@@ -71,48 +725,253 @@ class FATFileSystem:
             'is_large_file': False,
             'permissions': {owner: ['read', 'write']}
         }
+        self._set_block_list(fat_table[filename], block_chain)
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
+    def _create_extent_file(self, filename, content, owner, is_binary, fat_table):
+        """Crea un archivo descrito por extents en lugar de una cadena de bloques"""
+        extents = self.block_manager.create_extents(content)
+        
+        current_time = datetime.now().isoformat()
+        fat_table[filename] = {
+            'filename': filename,
+            'extents': extents,
+            'total_bytes': sum(length for _, length in extents),
+            'in_recycle_bin': False,
+            'total_chars': len(content),
+            'creation_date': current_time,
+            'modification_date': current_time,
+            'deletion_date': None,
+            'owner': owner,
+            'is_binary': is_binary,
+            'is_large_file': False,
+            'permissions': {owner: ['read', 'write']}
+        }
+        
+        self._save_fat_table(fat_table, filename)
+        return True
+    
+    def _create_blob_file(self, filename, content, owner, fat_table):
+        """Crea un binario pequeño guardado como bytes en un único blob"""
+        current_time = datetime.now().isoformat()
+        fat_table[filename] = {
+            'filename': filename,
+            'blob': self.block_manager.create_blob(content),
+            'in_recycle_bin': False,
+            'total_chars': len(content),
+            'creation_date': current_time,
+            'modification_date': current_time,
+            'deletion_date': None,
+            'owner': owner,
+            'is_binary': True,
+            'is_large_file': False,
+            'permissions': {owner: ['read', 'write']}
+        }
+        
+        self._save_fat_table(fat_table, filename)
+        return True
+    
+    def _read_stored(self, file_info):
+        """Contenido tal como quedó en los bloques o extents"""
+        if 'extents' in file_info:
+            return self.block_manager.read_extents(file_info['extents'])
+        if 'blocks' in file_info:
+            return self.block_manager.read_block_list(file_info['blocks'])
+        return self.block_manager.read_blocks(file_info['initial_block'])
+    
+    def _read_binary(self, file_info, offset=0, length=None):
+        """Bytes de un binario pequeño: del blob o, si es anterior a los blobs, de los bloques en base64"""
+        if 'blob' in file_info:
+            return self.block_manager.read_blob(file_info['blob'], offset, length)
+        content = base64.b64decode(self._read_stored(file_info))
+        return content[offset:] if length is None else content[offset:offset + length]
+    
+    def _rewrite_extent_file(self, file_info, new_content):
+        """Reubica el contenido completo de un archivo en extents nuevos"""
+        extents = self.block_manager.create_extents(new_content)
+        self._release_storage({'extents': file_info['extents']})
+        file_info['extents'] = extents
+        file_info['total_bytes'] = sum(length for _, length in extents)
+        file_info['total_chars'] = len(new_content)
+    
+    def _rewrite_blob_file(self, file_info, content):
+        """Guarda el contenido de un binario pequeño en un blob nuevo y libera el anterior"""
+        blob = self.block_manager.create_blob(content)
+        # Las entradas anteriores a los blobs tienen bloques o extents en base64
+        self._release_storage(dict(file_info))
+        for key in ('initial_block', 'blocks', 'block_size', 'codec', 'extents', 'total_bytes'):
+            file_info.pop(key, None)
+        file_info['blob'] = blob
+        file_info['total_chars'] = len(content)
+        # El SHA-256 de la importación ya no corresponde al contenido
+        file_info.pop('sha256', None)
+    
+    def _set_block_list(self, file_info, block_chain):
+        """Mantiene la lista explícita de bloques sincronizada con la cadena"""
+        if self.config.get('store_block_list', True):
+            file_info['blocks'] = block_chain
+        else:
+            file_info.pop('blocks', None)
+    
+    def _large_file_path(self, filename, extension='.bin'):
+        # Nombre único: la ruta del archivo puede cambiar con move()
+        return os.path.join(self.large_files_dir, f"{uuid.uuid4().hex[:8]}_{filename.rpartition('/')[2]}{extension}")
+    
+    def _write_chunk_manifest(self, filename, chunks):
+        """Guarda la lista de trozos de una versión de un archivo grande en un manifiesto nuevo"""
+        manifest_path = self._large_file_path(filename, '.chunks')
+        write_manifest(manifest_path, chunks)
+        return manifest_path
+    
+    def _large_file_chunks(self, file_info):
+        """Trozos de un archivo grande; los archivos de versiones anteriores se pasan a trozos"""
+        if 'chunk_manifest' not in file_info:
+            writer = ChunkWriter(self.chunk_store)
+            with open(file_info['file_path'], 'rb') as f:
+                for data in iter(lambda: f.read(IMPORT_CHUNK_SIZE), b""):
+                    writer.write(data)
+            self._replace_chunks(file_info, writer.close())
+        return read_manifest(file_info['chunk_manifest'])
+    
+    def _replace_chunks(self, file_info, chunks, kept=()):
+        """Apunta la entrada a una nueva versión en trozos y libera la anterior.
+        
+        kept son los trozos de la versión anterior que se conservan sin
+        reescribirlos; el manifiesto nuevo les suma una referencia.
+        """
+        self.chunk_store.retain_many(list(kept))
+        manifest_path = self._write_chunk_manifest(file_info['filename'], chunks)
+        self._release_storage(dict(file_info))
+        file_info.pop('file_path', None)
+        file_info['chunk_manifest'] = manifest_path
+        file_info['total_chars'] = sum(size for _, size in chunks)
+    
     def _create_large_binary_file(self, filename, content, owner, fat_table):
-        """Crea archivos binarios grandes con almacenamiento directo"""
+        """Crea archivos binarios grandes cortados en trozos por contenido"""
         try:
-            # Guardar archivo directamente
-            file_path = os.path.join(self.large_files_dir, f"{filename}.bin")
-            with open(file_path, 'wb') as f:
-                if isinstance(content, str):
-                    # Si es base64 string, decodificar primero
-                    import base64
-                    content = base64.b64decode(content)
-                f.write(content)
+            writer = ChunkWriter(self.chunk_store)
+            writer.write(content)
+            manifest_path = self._write_chunk_manifest(filename, writer.close())
             
-            current_time = datetime.now().isoformat()
-            fat_table[filename] = {
-                'filename': filename,
-                'file_path': file_path,
-                'in_recycle_bin': False,
-                'total_chars': len(content),
-                'creation_date': current_time,
-                'modification_date': current_time,
-                'deletion_date': None,
-                'owner': owner,
-                'is_binary': True,
-                'is_large_file': True,
-                'permissions': {owner: ['read', 'write']}
-            }
-            
-            self._save_fat_table(fat_table)
+            self._add_large_file_entry(fat_table, filename, manifest_path, len(content), owner)
             return True
         except Exception as e:
             print(f"Error creando archivo grande: {e}")
             return False
     
+    def _add_large_file_entry(self, fat_table, filename, manifest_path, size, owner):
+        current_time = datetime.now().isoformat()
+        fat_table[filename] = {
+            'filename': filename,
+            'chunk_manifest': manifest_path,
+            'in_recycle_bin': False,
+            'total_chars': size,
+            'creation_date': current_time,
+            'modification_date': current_time,
+            'deletion_date': None,
+            'owner': owner,
+            'is_binary': True,
+            'is_large_file': True,
+            'permissions': {owner: ['read', 'write']}
+        }
+        
+        self._save_fat_table(fat_table, filename)
+    
+    def import_file(self, source_path, owner, filename=None, chunk_size=IMPORT_CHUNK_SIZE,
+                    progress=None, cancel_event=None):
+        """Importa un archivo del disco como binario copiándolo por partes de chunk_size bytes.
+        
+        La memoria usada no depende del tamaño: los archivos grandes se cortan
+        en trozos a medida que se leen, fuera del bloqueo del volumen, y la
+        entrada FAT se registra al terminar. El tamaño y el SHA-256 (campo 'sha256') se
+        calculan durante la copia. progress(copiados, total) se llama después
+        de cada parte y cancel_event (threading.Event) detiene la importación.
+        Retorna (éxito, mensaje).
+        """
+        filename = self._normalize_path(filename if filename is not None else os.path.basename(source_path))
+        if not filename:
+            return False, "Nombre de archivo inválido"
+        try:
+            total = os.path.getsize(source_path)
+        except OSError as e:
+            return False, f"No se pudo leer el archivo: {e}"
+        # Se comprueba antes de copiar para no hacerlo en vano; al registrar se vuelve a comprobar
+        if not self._can_create(filename, owner):
+            return False, f"No se puede crear '{filename}' (ya existe o no hay permiso en el directorio)"
+        
+        large = total > LARGE_FILE_THRESHOLD
+        target = ChunkWriter(self.chunk_store) if large else io.BytesIO()
+        digest = hashlib.sha256()
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        copied = 0
+        cancelled = False
+        try:
+            with open(source_path, 'rb') as source:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        cancelled = True
+                        break
+                    count = source.readinto(buffer)
+                    if not count:
+                        break
+                    digest.update(view[:count])
+                    target.write(view[:count])
+                    copied += count
+                    if progress is not None:
+                        progress(copied, total)
+            if not cancelled:
+                content = target.close() if large else target.getvalue()
+        except OSError as e:
+            self._discard_import(target)
+            return False, f"Error importando archivo: {e}"
+        
+        if cancelled:
+            self._discard_import(target)
+            return False, "Importación cancelada"
+        
+        if not self._register_import(filename, owner, content, copied, digest.hexdigest()):
+            self._discard_import(target)
+            return False, f"No se puede crear '{filename}' (ya existe o no hay permiso en el directorio)"
+        return True, f"Archivo '{filename}' importado ({copied} bytes, sha256 {digest.hexdigest()[:12]}…)"
+    
+    @_reads
+    def _can_create(self, filename, owner):
+        fat_table = self._load_fat_table()
+        return filename not in fat_table and self._directory_writable(fat_table, self._parent_directory(filename), owner)
+    
+    def _register_import(self, filename, owner, content, size, checksum):
+        """Agrega la entrada FAT de un archivo importado con import_file (un solo commit).
+        
+        content son los bytes de un archivo pequeño o la lista de trozos de uno grande.
+        """
+        with self.transaction():
+            if not self._can_create(filename, owner):
+                return False
+            fat_table = self._load_fat_table()
+            if isinstance(content, list):
+                self._add_large_file_entry(fat_table, filename, self._write_chunk_manifest(filename, content),
+                                           size, owner)
+            else:
+                self._create_blob_file(filename, content, owner, fat_table)
+            fat_table[filename]['sha256'] = checksum
+            self._save_fat_table(fat_table, filename)
+        return True
+    
+    @staticmethod
+    def _discard_import(target):
+        if isinstance(target, ChunkWriter):
+            target.abort()
+    
+    @_reads
     def open_file(self, filename, user):
-        """Abre un archivo y retorna su contenido"""
+        """Abre un archivo y retorna su contenido (bytes si es binario)"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not self._is_file(fat_table, filename):
             return None, "Archivo no encontrado"
         
         file_info = fat_table[filename]
@@ -124,37 +983,296 @@ class FATFileSystem:
         # Para archivos grandes, leer directamente del archivo
         if file_info.get('is_large_file', False):
             try:
-                file_path = file_info['file_path']
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-                # Convertir a base64 para consistencia
-                import base64
-                content = base64.b64encode(content).decode('utf-8')
-                return file_info, content
+                if 'chunk_manifest' not in file_info:
+                    with open(file_info['file_path'], 'rb') as f:
+                        return file_info, f.read()
+                chunks = read_manifest(file_info['chunk_manifest'])
+                return file_info, b''.join(self.chunk_store.read(chunk_hash) for chunk_hash, _ in chunks)
             except Exception as e:
                 return None, f"Error leyendo archivo grande: {str(e)}"
         
         # Leer contenido de los bloques
-        content = self.block_manager.read_blocks(file_info['initial_block'])
+        try:
+            if file_info.get('is_binary', False):
+                return file_info, self._read_binary(file_info)
+            return file_info, self._read_stored(file_info)
+        except (OSError, ValueError) as e:
+            return None, f"Error leyendo los bloques del archivo: {str(e)}"
+    
+    def open_file_base64(self, filename, user):
+        """Compatibilidad con la API anterior: los binarios se entregan en base64"""
+        file_info, content = self.open_file(filename, user)
+        if file_info is not None and file_info.get('is_binary', False):
+            content = base64.b64encode(content).decode('ascii')
         return file_info, content
     
-    def list_files(self):
-        """Lista todos los archivos que no están en la papelera"""
+    @_reads
+    def open_stream(self, filename, user):
+        """Abre un archivo como objeto tipo archivo que lee los bloques bajo demanda"""
         fat_table = self._load_fat_table()
-        return [file_info for file_info in fat_table.values() 
-                if not file_info['in_recycle_bin']]
+        filename = self._normalize_path(filename)
+        
+        if not self._is_file(fat_table, filename):
+            return None, "Archivo no encontrado"
+        
+        file_info = fat_table[filename]
+        
+        if not self.permission_manager.can_read(file_info, user):
+            return None, "Permiso denegado"
+        
+        # Los archivos grandes se exponen como flujo binario directo
+        if file_info.get('is_large_file', False):
+            try:
+                if 'chunk_manifest' not in file_info:
+                    return file_info, open(file_info['file_path'], 'rb')
+                reader = ChunkReader(self.chunk_store, read_manifest(file_info['chunk_manifest']))
+                return file_info, io.BufferedReader(reader)
+            except OSError as e:
+                return None, f"Error leyendo archivo grande: {str(e)}"
+        
+        # Los binarios pequeños (menos de 1MB) se decodifican completos
+        if file_info.get('is_binary', False):
+            try:
+                return file_info, io.BytesIO(self._read_binary(file_info))
+            except (OSError, ValueError) as e:
+                return None, f"Error leyendo los bloques del archivo: {str(e)}"
+        
+        if 'extents' in file_info:
+            return file_info, ExtentStream(self.block_manager, file_info)
+        
+        return file_info, BlockStream(self.block_manager, file_info)
     
+    @_reads
+    def read_range(self, filename, offset, length, user):
+        """Lee solo los caracteres [offset, offset + length) de un archivo (bytes si es binario).
+        
+        En los archivos grandes retorna un memoryview sobre el trozo mapeado
+        en memoria: no copia nada si el rango cae en un solo trozo y solo se
+        leen del disco las páginas usadas.
+        """
+        fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
+        
+        if not self._is_file(fat_table, filename):
+            return None, "Archivo no encontrado"
+        
+        file_info = fat_table[filename]
+        
+        if not self.permission_manager.can_read(file_info, user):
+            return None, "Permiso denegado"
+        
+        if file_info.get('is_large_file', False):
+            try:
+                if 'chunk_manifest' not in file_info:
+                    return file_info, self._map_range(file_info['file_path'], offset, length)
+                chunks = read_manifest(file_info['chunk_manifest'])
+                return file_info, self.chunk_store.read_range(chunks, offset, length)
+            except (OSError, ValueError) as e:
+                return None, f"Error leyendo archivo grande: {str(e)}"
+        
+        try:
+            return file_info, self._read_stored_range(file_info, offset, length)
+        except (OSError, ValueError) as e:
+            return None, f"Error leyendo los bloques del archivo: {str(e)}"
+    
+    def _read_stored_range(self, file_info, offset, length):
+        """Caracteres [offset, offset + length) de un archivo en bloques, extents o blob"""
+        if file_info.get('is_binary', False):
+            return self._read_binary(file_info, offset, length) if offset >= 0 and length > 0 else b""
+        
+        if 'extents' in file_info:
+            if offset < 0 or length <= 0:
+                return ""
+            if file_info['total_bytes'] == file_info['total_chars']:
+                # Contenido ASCII: los offsets en caracteres coinciden con los bytes
+                return self.block_manager.read_extent_bytes(file_info['extents'], offset, length).decode('utf-8')
+            return self.block_manager.read_extents(file_info['extents'])[offset:offset + length]
+        if 'blocks' in file_info:
+            block_size = file_info.get('block_size', DEFAULT_BLOCK_SIZE)
+            return self.block_manager.read_block_range(file_info['blocks'], block_size, offset, length)
+        # Entradas sin lista de bloques: recorrer la cadena completa
+        content = self.block_manager.read_blocks(file_info['initial_block'])
+        return content[offset:offset + length] if offset >= 0 and length > 0 else ""
+    
+    @staticmethod
+    def _map_range(file_path, offset, length):
+        """Vista sin copia de [offset, offset + length) de un archivo mapeado en memoria"""
+        if offset < 0 or length <= 0:
+            return memoryview(b"")
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"")  # mmap no admite archivos vacíos
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # La vista mantiene vivo el mapeo aunque el archivo ya esté cerrado
+        return memoryview(mapped)[offset:offset + length]
+    
+    @_reads
+    def list_files(self, directory=None, recursive=False):
+        """Lista los archivos que no están en la papelera: todos o los de un directorio"""
+        fat_table = self._load_fat_table()
+        if directory is None:
+            return self._indexed_files(fat_table, self.fat_table_manager.index.active(),
+                                       lambda file_info: not file_info['in_recycle_bin'])
+        
+        directory = self._normalize_path(directory)
+        if directory is None or not self._is_directory(fat_table, directory):
+            return []
+        files = [fat_table[path] for path in self._child_paths(fat_table, directory, recursive)]
+        return [file_info for file_info in files
+                if not file_info.get('is_directory', False) and not file_info['in_recycle_bin']]
+    
+    @_reads
+    def list_directory(self, directory=''):
+        """Contenido de un directorio: subdirectorios y luego archivos fuera de la papelera.
+        
+        Retorna None si el directorio no existe.
+        """
+        fat_table = self._load_fat_table()
+        directory = self._normalize_path(directory)
+        if directory is None or not self._is_directory(fat_table, directory):
+            return None
+        
+        entries = sorted((fat_table[path] for path in self._child_paths(fat_table, directory)),
+                         key=lambda file_info: file_info['filename'])
+        directories = [file_info for file_info in entries if file_info.get('is_directory', False)]
+        files = [file_info for file_info in entries
+                 if not file_info.get('is_directory', False) and not file_info['in_recycle_bin']]
+        return directories + files
+    
+    @_reads
     def list_recycle_bin(self):
         """Lista todos los archivos en la papelera"""
         fat_table = self._load_fat_table()
-        return [file_info for file_info in fat_table.values() 
-                if file_info['in_recycle_bin']]
+        return self._indexed_files(fat_table, self.fat_table_manager.index.recycle_bin(),
+                                   lambda file_info: file_info['in_recycle_bin'])
     
-    def modify_file(self, filename, new_content, user):
-        """Modifica el contenido de un archivo"""
+    @_reads
+    def list_files_by_owner(self, owner, include_recycle_bin=False):
+        """Lista los archivos de un dueño (por defecto sin los de la papelera)"""
+        fat_table = self._load_fat_table()
+        files = self._indexed_files(fat_table, self.fat_table_manager.index.owned_by(owner),
+                                    lambda file_info: file_info['owner'] == owner)
+        if include_recycle_bin:
+            return files
+        return [file_info for file_info in files if not file_info['in_recycle_bin']]
+    
+    @_reads
+    def list_files_shared_with(self, user):
+        """Lista los archivos de otros dueños sobre los que el usuario tiene permisos"""
+        fat_table = self._load_fat_table()
+        files = self._indexed_files(fat_table, self.fat_table_manager.index.shared_with(user),
+                                    lambda file_info: file_info['owner'] != user
+                                    and file_info.get('permissions', {}).get(user))
+        return [file_info for file_info in files if not file_info['in_recycle_bin']]
+    
+    @_writes
+    def mkdir(self, path, owner):
+        """Crea un directorio dentro de uno existente"""
+        fat_table = self._load_fat_table()
+        
+        path = self._normalize_path(path)
+        if not path or path in fat_table:
+            return False
+        
+        if not self._directory_writable(fat_table, self._parent_directory(path), owner):
+            return False
+        
+        current_time = datetime.now().isoformat()
+        fat_table[path] = {
+            'filename': path,
+            'is_directory': True,
+            'in_recycle_bin': False,
+            'total_chars': 0,
+            'creation_date': current_time,
+            'modification_date': current_time,
+            'deletion_date': None,
+            'owner': owner,
+            'permissions': {owner: ['read', 'write']}
+        }
+        
+        self._save_fat_table(fat_table, path)
+        return True
+    
+    @_writes
+    def rmdir(self, path, user):
+        """Elimina un directorio vacío (tampoco debe tener archivos en la papelera)"""
+        fat_table = self._load_fat_table()
+        
+        path = self._normalize_path(path)
+        if not path or not self._is_directory(fat_table, path):
+            return False
+        
+        # Solo el propietario puede eliminar
+        if fat_table[path]['owner'] != user:
+            return False
+        
+        if self._child_paths(fat_table, path):
+            print(f"El directorio no está vacío: {path}")
+            return False
+        
+        del fat_table[path]
+        self._save_fat_table(fat_table, path)
+        return True
+    
+    @_writes
+    def move(self, source, destination, user):
+        """Mueve o renombra un archivo o un directorio con todo su contenido.
+        
+        Si destination es un directorio existente, source se mueve dentro de
+        él con el mismo nombre; si no, destination es la nueva ruta completa.
+        """
+        fat_table = self._load_fat_table()
+        
+        source = self._normalize_path(source)
+        destination = self._normalize_path(destination)
+        if not source or destination is None or source not in fat_table:
+            return False
+        
+        # Solo el propietario puede mover
+        if fat_table[source]['owner'] != user:
+            return False
+        
+        if self._is_directory(fat_table, destination):
+            target = f"{destination}/{source.rpartition('/')[2]}" if destination else source.rpartition('/')[2]
+        else:
+            target = destination
+        
+        if target == source or target in fat_table:
+            return False
+        if target.startswith(source + '/'):
+            print("No se puede mover un directorio dentro de sí mismo")
+            return False
+        if not self._directory_writable(fat_table, self._parent_directory(target), user):
+            return False
+        
+        # El subárbol se toma del índice antes de abrir la transacción
+        paths = [source]
+        if fat_table[source].get('is_directory', False):
+            paths += self._child_paths(fat_table, source, recursive=True)
+        
+        with self.transaction():
+            fat_table = self._load_fat_table()
+            for path in paths:
+                new_path = target + path[len(source):]
+                file_info = fat_table[path]
+                del fat_table[path]
+                file_info['filename'] = new_path
+                fat_table[new_path] = file_info
+                self._save_fat_table(fat_table, path)
+                self._save_fat_table(fat_table, new_path)
+        return True
+    
+    @_writes
+    def modify_file(self, filename, new_content, user, expected_version=None):
+        """Modifica el contenido de un archivo.
+        
+        Con expected_version (la 'version' de la entrada cuando se leyó) la
+        escritura se rechaza si otro usuario o proceso la modificó desde entonces.
+        """
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not self._is_file(fat_table, filename):
             return False
         
         file_info = fat_table[filename]
@@ -163,45 +1281,244 @@ class FATFileSystem:
         if not self.permission_manager.can_write(file_info, user):
             return False
         
+        if expected_version is not None and file_info.get('version', 0) != expected_version:
+            print(f"Conflicto: {filename} cambió desde que se leyó "
+                  f"(versión {file_info.get('version', 0)}, se esperaba {expected_version})")
+            return False
+        
+        if file_info.get('is_binary', False):
+            new_content = self._binary_bytes(new_content)
+        
         # Para archivos grandes
         if file_info.get('is_large_file', False):
             try:
-                file_path = file_info['file_path']
-                with open(file_path, 'wb') as f:
-                    if isinstance(new_content, str):
-                        import base64
-                        new_content = base64.b64decode(new_content)
-                    f.write(new_content)
-                
-                file_info['total_chars'] = len(new_content)
+                # Los cortes dependen del contenido: los trozos que no cambiaron
+                # vuelven a salir iguales y no se escriben de nuevo
+                writer = ChunkWriter(self.chunk_store)
+                writer.write(new_content)
+                self._replace_chunks(file_info, writer.close())
+                file_info.pop('sha256', None)
                 file_info['modification_date'] = datetime.now().isoformat()
-                self._save_fat_table(fat_table)
+                self._save_fat_table(fat_table, filename)
                 return True
             except Exception as e:
                 print(f"Error modificando archivo grande: {e}")
                 return False
         
-        # Eliminar bloques antiguos
-        self.block_manager.delete_blocks(file_info['initial_block'])
+        if file_info.get('is_binary', False):
+            self._rewrite_blob_file(file_info, new_content)
+            file_info['modification_date'] = datetime.now().isoformat()
+            self._save_fat_table(fat_table, filename)
+            return True
         
-        # Crear nuevos bloques
-        new_block_chain = self.block_manager.create_blocks(new_content)
+        if 'extents' in file_info:
+            self._rewrite_extent_file(file_info, new_content)
+            file_info['modification_date'] = datetime.now().isoformat()
+            self._save_fat_table(fat_table, filename)
+            return True
+        
+        # Crear los bloques nuevos antes de liberar los antiguos, así el contenido
+        # que no cambió sigue referenciado cuando la deduplicación está activa
+        block_size = file_info.get('block_size', DEFAULT_BLOCK_SIZE)
+        codec = file_info.get('codec', 'none')
+        new_block_chain = self.block_manager.create_blocks_bulk(new_content, block_size, codec)
         if not new_block_chain:
             return False
         
+        # Eliminar bloques antiguos
+        self._release_storage({'initial_block': file_info['initial_block']})
+        
         # Actualizar tabla FAT
         file_info['initial_block'] = new_block_chain[0]
+        self._set_block_list(file_info, new_block_chain)
         file_info['total_chars'] = len(new_content)
         file_info['modification_date'] = datetime.now().isoformat()
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
+        return True
+    
+    def _file_block_ids(self, file_info):
+        """Lista ordenada de bloques de un archivo, reconstruyéndola si no está en la entrada"""
+        if 'blocks' in file_info:
+            return file_info['blocks']
+        block_ids = self.block_manager.chain_ids(file_info['initial_block'])
+        self._set_block_list(file_info, block_ids)
+        return block_ids
+    
+    @_writes
+    def append_file(self, filename, data, user):
+        """Agrega datos al final de un archivo tocando solo el último bloque"""
+        fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
+        
+        if not self._is_file(fat_table, filename):
+            return False
+        
+        file_info = fat_table[filename]
+        
+        if not self.permission_manager.can_write(file_info, user):
+            return False
+        
+        if file_info.get('is_large_file', False):
+            try:
+                # Solo se vuelve a cortar el último trozo junto con los datos nuevos
+                chunks = self._large_file_chunks(file_info)
+                kept, last = (chunks[:-1], chunks[-1:]) if chunks else ([], [])
+                writer = ChunkWriter(self.chunk_store)
+                for chunk_hash, _ in last:
+                    writer.write(self.chunk_store.read(chunk_hash))
+                writer.write(self._binary_bytes(data))
+                self._replace_chunks(file_info, kept + writer.close(), kept)
+                file_info.pop('sha256', None)
+                file_info['modification_date'] = datetime.now().isoformat()
+                self._save_fat_table(fat_table, filename)
+                return True
+            except Exception as e:
+                print(f"Error agregando a archivo grande: {e}")
+                return False
+        
+        # Los binarios pequeños están en un único blob: se reescriben completos
+        if file_info.get('is_binary', False):
+            content = self._read_binary(file_info)
+            return self.modify_file(filename, content + self._binary_bytes(data), user)
+        
+        if self._current_transaction() is not None:
+            # En una transacción no se tocan bloques en su lugar: se reescribe el archivo
+            current_info, content = self.open_file(filename, user)
+            if current_info is None:
+                print(content)
+                return False
+            return self.modify_file(filename, content + data, user)
+        
+        if data and 'extents' in file_info:
+            encoded = data.encode('utf-8')
+            file_info['extents'] = self.block_manager.append_extents(file_info['extents'], encoded)
+            file_info['total_bytes'] += len(encoded)
+            file_info['total_chars'] += len(data)
+        elif data:
+            block_ids = self._file_block_ids(file_info)
+            block_size = file_info.get('block_size', DEFAULT_BLOCK_SIZE)
+            new_blocks = self.block_manager.append_to_chain(block_ids[-1], data, block_size)
+            self._set_block_list(file_info, block_ids + new_blocks)
+            file_info['total_chars'] += len(data)
+        
+        file_info['modification_date'] = datetime.now().isoformat()
+        self._save_fat_table(fat_table, filename)
+        return True
+    
+    @_writes
+    def write_range(self, filename, offset, data, user):
+        """Sobrescribe datos a partir de offset reescribiendo solo los bloques afectados"""
+        fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
+        
+        if not self._is_file(fat_table, filename):
+            return False
+        
+        file_info = fat_table[filename]
+        
+        if not self.permission_manager.can_write(file_info, user):
+            return False
+        
+        # No se permiten huecos: se puede escribir hasta el final del archivo
+        if offset < 0 or offset > file_info['total_chars']:
+            return False
+        
+        if file_info.get('is_large_file', False):
+            try:
+                self._write_chunk_range(file_info, offset, self._binary_bytes(data))
+                file_info.pop('sha256', None)
+                file_info['modification_date'] = datetime.now().isoformat()
+                self._save_fat_table(fat_table, filename)
+                return True
+            except Exception as e:
+                print(f"Error escribiendo en archivo grande: {e}")
+                return False
+        
+        if file_info.get('is_binary', False):
+            content = self._read_binary(file_info)
+            data = self._binary_bytes(data)
+            return self.modify_file(filename, content[:offset] + data + content[offset + len(data):], user)
+        
+        if self._current_transaction() is not None:
+            # En una transacción no se tocan bloques en su lugar: se reescribe el archivo
+            current_info, content = self.open_file(filename, user)
+            if current_info is None:
+                print(content)
+                return False
+            return self.modify_file(filename, content[:offset] + data + content[offset + len(data):], user)
+        
+        if 'extents' in file_info:
+            self._write_extent_range(file_info, offset, data)
+            file_info['modification_date'] = datetime.now().isoformat()
+            self._save_fat_table(fat_table, filename)
+            return True
+        
+        block_ids = self._file_block_ids(file_info)
+        block_size = file_info.get('block_size', DEFAULT_BLOCK_SIZE)
+        
+        # La parte que cae dentro del archivo se sobrescribe; el resto se agrega
+        inside = data[:file_info['total_chars'] - offset]
+        self.block_manager.overwrite_range(block_ids, block_size, offset, inside)
+        
+        extra = data[len(inside):]
+        if extra:
+            new_blocks = self.block_manager.append_to_chain(block_ids[-1], extra, block_size)
+            self._set_block_list(file_info, block_ids + new_blocks)
+            file_info['total_chars'] += len(extra)
+        
+        file_info['modification_date'] = datetime.now().isoformat()
+        self._save_fat_table(fat_table, filename)
         return True
     
+    def _write_chunk_range(self, file_info, offset, data):
+        """Escritura parcial en un archivo grande: solo se vuelven a cortar los trozos que toca"""
+        chunks = self._large_file_chunks(file_info)
+        if not data:
+            return
+        # Trozos [first, last) que cubren [offset, offset + len(data)); region_start es donde empieza first
+        first = last = len(chunks)
+        start = region_start = 0
+        for index, (_, size) in enumerate(chunks):
+            if first == len(chunks) and start + size > offset:
+                first, region_start = index, start
+            start += size
+            if start >= offset + len(data):
+                last = index + 1
+                break
+        if first == len(chunks):
+            region_start = start
+        region = b''.join(self.chunk_store.read(chunk_hash) for chunk_hash, _ in chunks[first:last])
+        relative = offset - region_start
+        writer = ChunkWriter(self.chunk_store)
+        writer.write(region[:relative] + data + region[relative + len(data):])
+        kept = chunks[:first] + chunks[last:]
+        self._replace_chunks(file_info, chunks[:first] + writer.close() + chunks[last:], kept)
+    
+    def _write_extent_range(self, file_info, offset, data):
+        """Escritura parcial en un archivo con extents"""
+        encoded = data.encode('utf-8')
+        if file_info['total_bytes'] != file_info['total_chars'] or len(encoded) != len(data):
+            # Con caracteres multibyte los offsets no coinciden con los bytes: reescribir
+            content = self.block_manager.read_extents(file_info['extents'])
+            self._rewrite_extent_file(file_info, content[:offset] + data + content[offset + len(data):])
+            return
+        
+        inside = encoded[:file_info['total_bytes'] - offset]
+        self.block_manager.write_extents(file_info['extents'], offset, inside)
+        extra = encoded[len(inside):]
+        if extra:
+            file_info['extents'] = self.block_manager.append_extents(file_info['extents'], extra)
+            file_info['total_bytes'] += len(extra)
+            file_info['total_chars'] += len(extra)
+    
+    @_writes
     def delete_file(self, filename, user):
         """Mueve un archivo a la papelera"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not self._is_file(fat_table, filename):
             return False
         
         file_info = fat_table[filename]
@@ -213,14 +1530,16 @@ class FATFileSystem:
         file_info['in_recycle_bin'] = True
         file_info['deletion_date'] = datetime.now().isoformat()
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
+    @_writes
     def delete_file_permanently(self, filename, user):
         """Elimina un archivo permanentemente del sistema"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not self._is_file(fat_table, filename):
             return False
         
         file_info = fat_table[filename]
@@ -229,27 +1548,21 @@ class FATFileSystem:
         if file_info['owner'] != user:
             return False
         
-        # Eliminar bloques de datos
-        if not file_info.get('is_large_file', False):
-            self.block_manager.delete_blocks(file_info['initial_block'])
-        else:
-            # Eliminar archivo grande
-            try:
-                if os.path.exists(file_info['file_path']):
-                    os.remove(file_info['file_path'])
-            except Exception:
-                pass
+        # Eliminar los datos (bloques, extents o archivo grande)
+        self._release_storage(file_info)
         
         # Eliminar de la tabla FAT
         del fat_table[filename]
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
+    @_writes
     def recover_file(self, filename, user):
         """Recupera un archivo de la papelera"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not self._is_file(fat_table, filename):
             return False
         
         file_info = fat_table[filename]
@@ -261,19 +1574,23 @@ class FATFileSystem:
         file_info['in_recycle_bin'] = False
         file_info['deletion_date'] = None
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
+    @_reads
     def get_file_info(self, filename):
         """Obtiene información de un archivo"""
         fat_table = self._load_fat_table()
-        return fat_table.get(filename)
+        filename = self._normalize_path(filename)
+        return fat_table.get(filename) if filename else None
     
+    @_writes
     def grant_permission(self, filename, owner, user, permission):
         """Concede un permiso a un usuario"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not filename or filename not in fat_table:
             return False
         
         file_info = fat_table[filename]
@@ -291,14 +1608,16 @@ class FATFileSystem:
         if permission not in file_info['permissions'][user]:
             file_info['permissions'][user].append(permission)
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
+    @_writes
     def revoke_permission(self, filename, owner, user, permission):
         """Revoca un permiso de un usuario"""
         fat_table = self._load_fat_table()
+        filename = self._normalize_path(filename)
         
-        if filename not in fat_table:
+        if not filename or filename not in fat_table:
             return False
         
         file_info = fat_table[filename]
@@ -313,35 +1632,66 @@ class FATFileSystem:
             if not file_info['permissions'][user]:
                 del file_info['permissions'][user]
         
-        self._save_fat_table(fat_table)
+        self._save_fat_table(fat_table, filename)
         return True
     
-    def create_backup(self, backup_name=None):
-        """Crea un backup completo del sistema"""
+    @_writes
+    def create_backup(self, backup_name=None, directory=None):
+        """Crea un backup completo del sistema o, con directory, solo de ese directorio"""
         try:
+            if directory is not None:
+                directory = self._normalize_path(directory)
+                if directory is None or not self._is_directory(self._load_fat_table(), directory):
+                    return False, "El directorio no existe"
+            
             if backup_name is None:
-                backup_name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                prefix = f"backup_{directory.replace('/', '_')}" if directory else "backup"
+                backup_name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
             backup_path = os.path.join(self.backup_dir, f"{backup_name}.zip")
             
+            if directory is not None:
+                os.makedirs(self.backup_dir, exist_ok=True)
+                return self._create_directory_backup(backup_path, backup_name, directory)
+            
+            # El backup debe incluir los cambios en memoria y en el journal
+            self.fat_table_manager.checkpoint()
+            
             # Asegurarse de que el directorio de backups existe
             os.makedirs(self.backup_dir, exist_ok=True)
             
+            # Cerrar el almacenamiento vuelca el WAL de SQLite a la base
+            self.block_manager.close()
+            
             with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 # Backup de la tabla FAT
-                if os.path.exists(self.fat_table_path):
-                    zipf.write(self.fat_table_path, 'fat_table.json')
-                    print(f"Backup de tabla FAT: {self.fat_table_path}")
+                if self.config['metadata_backend'] == 'sqlite' and os.path.exists(self.fat_db_path):
+                    zipf.write(self.fat_db_path, 'fat.db')
+                    print(f"Backup de tabla FAT: {self.fat_db_path}")
+                elif self.config['metadata_backend'] == 'sharded':
+                    for file in sorted(os.listdir(self.fat_shards_dir)) if os.path.isdir(self.fat_shards_dir) else []:
+                        zipf.write(os.path.join(self.fat_shards_dir, file), f"fat_shards/{file}")
+                    print(f"Backup de tabla FAT: {self.fat_shards_dir}")
+                elif os.path.exists(self._fat_snapshot_path()):
+                    snapshot_path = self._fat_snapshot_path()
+                    zipf.write(snapshot_path, os.path.basename(snapshot_path))
+                    print(f"Backup de tabla FAT: {snapshot_path}")
                 
                 # Backup de usuarios
                 if os.path.exists(self.users_file):
                     zipf.write(self.users_file, 'users.json')
                     print(f"Backup de usuarios: {self.users_file}")
                 
+                # Backup de la configuración del volumen
+                if os.path.exists(self.config_path):
+                    zipf.write(self.config_path, 'config.json')
+                
                 # Backup de los bloques
                 if os.path.exists(self.blocks_dir):
                     for root, dirs, files in os.walk(self.blocks_dir):
                         for file in files:
+                            if file.endswith(('-wal', '-shm')):
+                                continue
                             file_path = os.path.join(root, file)
                             arcname = os.path.relpath(file_path, self.data_dir)
                             zipf.write(file_path, arcname)
@@ -351,6 +1701,8 @@ class FATFileSystem:
                 if os.path.exists(self.large_files_dir):
                     for root, dirs, files in os.walk(self.large_files_dir):
                         for file in files:
+                            if file.endswith(('.lock', '.tmp')):
+                                continue
                             file_path = os.path.join(root, file)
                             arcname = os.path.relpath(file_path, self.data_dir)
                             zipf.write(file_path, arcname)
@@ -366,13 +1718,86 @@ class FATFileSystem:
         except Exception as e:
             return False, f"Error creando backup: {str(e)}"
     
+    def _create_directory_backup(self, backup_path, backup_name, directory):
+        """Guarda las entradas FAT del subárbol y el contenido de sus archivos"""
+        fat_table = self._load_fat_table()
+        paths = ([directory] if directory else []) + self._child_paths(fat_table, directory, recursive=True)
+        entries = []
+        with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for path in paths:
+                file_info = fat_table[path]
+                entries.append(file_info)
+                if file_info.get('is_large_file', False):
+                    # Los archivos grandes se copian por rangos, sin cargarlos enteros
+                    with zipf.open(f"files/{path}", 'w', force_zip64=True) as target:
+                        for offset in range(0, file_info['total_chars'], IMPORT_CHUNK_SIZE):
+                            target.write(self.read_range(path, offset, IMPORT_CHUNK_SIZE, file_info['owner'])[1])
+                elif not file_info.get('is_directory', False):
+                    # El dueño siempre puede leer; los binarios se guardan tal cual
+                    _, content = self.open_file(path, file_info['owner'])
+                    zipf.writestr(f"files/{path}", content if isinstance(content, bytes) else content.encode('utf-8'))
+            zipf.writestr(DIRECTORY_BACKUP_MANIFEST,
+                          json.dumps({'directory': directory, 'binary_content': 'raw', 'entries': entries}, indent=2, ensure_ascii=False))
+        
+        file_size = os.path.getsize(backup_path)
+        return True, (f"Backup del directorio '{directory or '/'}' creado: {backup_name}.zip "
+                      f"({len(entries)} entradas, {file_size / 1024 / 1024:.2f} MB)")
+    
+    def _restore_directory_backup(self, zipf):
+        """Recrea el subárbol de un backup de directorio; reemplaza los archivos que ya existan"""
+        manifest = json.loads(zipf.read(DIRECTORY_BACKUP_MANIFEST).decode('utf-8'))
+        directory = manifest['directory']
+        # Los backups anteriores guardaban los binarios en base64
+        raw_binaries = manifest.get('binary_content') == 'raw'
+        if self._is_directory(self._load_fat_table(), directory):
+            self.create_backup("pre_restore_backup", directory)
+        
+        # Los directorios padre van antes que su contenido
+        entries = sorted(manifest['entries'], key=lambda entry: entry['filename'].count('/'))
+        try:
+            with self.transaction():
+                fat_table = self._load_fat_table()
+                for entry in entries:
+                    path = entry['filename']
+                    current = fat_table.get(path)
+                    if entry.get('is_directory', False):
+                        if current is None:
+                            restored = self.mkdir(path, entry['owner'])
+                        else:
+                            restored = current.get('is_directory', False)
+                    else:
+                        if current is not None and not self.delete_file_permanently(path, current['owner']):
+                            raise TransactionAborted(f"No se pudo reemplazar: {path}")
+                        content = zipf.read(f"files/{path}")
+                        is_binary = entry.get('is_binary', False)
+                        if not is_binary or not raw_binaries:
+                            content = content.decode('utf-8')
+                        restored = self.create_file(path, content, entry['owner'], is_binary)
+                    if not restored:
+                        raise TransactionAborted(f"No se pudo restaurar: {path}")
+                    
+                    # Permisos, fechas y papelera como estaban al hacer el backup
+                    file_info = fat_table[path]
+                    for key in ('permissions', 'in_recycle_bin', 'creation_date', 'deletion_date'):
+                        if key in entry:
+                            file_info[key] = entry[key]
+                    self._save_fat_table(fat_table, path)
+        except TransactionAborted as e:
+            return False, str(e)
+        return True, f"Directorio '{directory or '/'}' restaurado: {len(entries)} entradas"
+    
+    @_writes
     def restore_backup(self, backup_path):
-        """Restaura el sistema desde un backup"""
+        """Restaura el sistema (o un directorio) desde un backup"""
         try:
             # Verificar que el archivo de backup existe
             if not os.path.exists(backup_path):
                 return False, "El archivo de backup no existe"
             
+            with zipfile.ZipFile(backup_path, 'r') as zipf:
+                if DIRECTORY_BACKUP_MANIFEST in zipf.namelist():
+                    return self._restore_directory_backup(zipf)
+            
             # Crear backup actual antes de restaurar
             self.create_backup("pre_restore_backup")
             
@@ -383,8 +1808,14 @@ class FATFileSystem:
             with zipfile.ZipFile(backup_path, 'r') as zipf:
                 zipf.extractall(self.data_dir)
             
+            # El backup puede traer otra configuración de almacenamiento
+            self.config = self._load_config()
+            self.block_manager = self._create_block_manager()
+            self.fat_table_manager = self._create_fat_table_manager()
+            self.chunk_store = ChunkStore(os.path.join(self.large_files_dir, "chunks"))
+            
             # Verificar que los archivos esenciales existen
-            essential_files = [self.fat_table_path, self.users_file]
+            essential_files = [self._fat_table_file(), self.users_file]
             for file_path in essential_files:
                 if not os.path.exists(file_path):
                     return False, f"Archivo esencial faltante en backup: {os.path.basename(file_path)}"
@@ -398,17 +1829,33 @@ class FATFileSystem:
         """Limpia los datos del sistema actual"""
         try:
             # Eliminar bloques
+            self.block_manager.close()
             if os.path.exists(self.blocks_dir):
                 shutil.rmtree(self.blocks_dir)
                 os.makedirs(self.blocks_dir)
             
             # Eliminar archivos grandes
+            self.chunk_store.close()
             if os.path.exists(self.large_files_dir):
                 shutil.rmtree(self.large_files_dir)
                 os.makedirs(self.large_files_dir)
             
-            # Reiniciar tabla FAT
-            self._save_fat_table({})
+            # Reiniciar tabla FAT (la base SQLite se cierra para poder reemplazarla)
+            if self.fat_table_manager.damaged:
+                # La tabla dañada no se puede escribir: se descarta y el backup la reemplaza
+                self.fat_table_manager.invalidate()
+                if self.config['metadata_backend'] == 'json':
+                    snapshot_path = self._fat_snapshot_path()
+                    for path in (snapshot_path, snapshot_path + '.bak', self.fat_journal_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+            else:
+                self._save_fat_table({})
+            self.fat_table_manager.close()
+            if self.config['metadata_backend'] == 'sqlite':
+                remove_database(self.fat_db_path)
+            elif self.config['metadata_backend'] == 'sharded':
+                shutil.rmtree(self.fat_shards_dir, ignore_errors=True)
             
         except Exception as e:
             print(f"Error limpiando datos del sistema: {e}")
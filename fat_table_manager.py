@@ -0,0 +1,417 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from fat_index import FATIndex
+from file_lock import file_signature
+from fat_binary import BinaryFATTable, encode_table
+
+WRITE_POLICIES = ('immediate', 'batched', 'on_close', 'group')
+TABLE_FORMATS = ('json', 'binary')
+
+# Commits en grupo que cada hilo espera al salir de deferred_commit(): tabla -> ticket
+_deferred = threading.local()
+
+
+class DamagedTableError(Exception):
+    """Se lanza al intentar escribir una tabla FAT que no se pudo leer de disco"""
+
+    def __init__(self, path):
+        super().__init__(f"La tabla FAT está dañada ({path}); restaure un backup o la copia .bak "
+                         "antes de hacer cambios")
+
+
+@contextmanager
+def deferred_commit():
+    """Los save() con la política group dentro del bloque no esperan a que su cambio esté en disco.
+
+    La espera se hace al salir, cuando quien llama ya soltó sus propios
+    bloqueos (el del volumen en FATFileSystem): así los hilos que esperaban
+    ese bloqueo alcanzan a sumar sus cambios a la misma escritura.
+    """
+    if getattr(_deferred, 'tickets', None) is not None:
+        yield
+        return
+    _deferred.tickets = {}
+    try:
+        yield
+    finally:
+        tickets, _deferred.tickets = _deferred.tickets, None
+        for manager, ticket in tickets.items():
+            manager.wait_committed(ticket)
+
+
+class FATTableManager:
+    """Mantiene la tabla FAT en memoria y decide cuándo escribirla a disco.
+
+    Las lecturas son búsquedas en el diccionario cacheado; si otro proceso
+    modifica fat_table.json o el journal (cambia su mtime o tamaño) la caché
+    se recarga.
+    Políticas de escritura:
+      - immediate: cada cambio se escribe en el momento (comportamiento original)
+      - batched: se escribe cada batch_size cambios o tras batch_interval segundos
+      - on_close: solo se escribe en flush()/close()
+      - group: los cambios que llegan dentro de group_window segundos se
+        escriben juntos; cada save() espera a que su cambio esté en disco
+
+    Con journal activo, un cambio sobre una entrada se guarda como un registro
+    pequeño agregado al journal en lugar de reescribir toda la tabla. El
+    checkpoint vuelca la tabla completa y vacía el journal cuando este supera
+    checkpoint_records registros o checkpoint_bytes bytes.
+
+    La tabla completa se escribe en un archivo temporal con fsync y luego
+    reemplaza a la anterior de forma atómica; la versión previa queda en
+    fat_table.json.bak. Si la tabla en disco está dañada se usa esa copia y,
+    si tampoco sirve, la tabla queda en solo lectura en lugar de tomarse
+    como un volumen vacío: save(), flush() y checkpoint() lanzan
+    DamagedTableError hasta que se restaure.
+
+    Con table_format='binary' la tabla completa se guarda en el formato
+    compacto de fat_binary y las entradas se decodifican al pedirlas; el
+    journal es el mismo en ambos formatos.
+    """
+
+    def __init__(self, fat_table_path, write_policy='immediate', batch_size=100, batch_interval=2.0,
+                 journal_path=None, checkpoint_records=1000, checkpoint_bytes=4 * 1024 * 1024,
+                 use_journal=True, group_window=0.005, table_format='json'):
+        if write_policy not in WRITE_POLICIES:
+            print(f"Política de escritura inválida: {write_policy}; se usa 'immediate'")
+            write_policy = 'immediate'
+        if table_format not in TABLE_FORMATS:
+            print(f"Formato de tabla inválido: {table_format}; se usa 'json'")
+            table_format = 'json'
+        self.fat_table_path = fat_table_path
+        self.write_policy = write_policy
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.journal_path = journal_path
+        # Aun sin usar el journal se reaplica el que haya quedado en disco
+        self.use_journal = use_journal and journal_path is not None
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_bytes = checkpoint_bytes
+        self.group_window = group_window
+        self.table_format = table_format
+        self.backup_path = fat_table_path + '.bak'
+        # True si no se pudo leer ninguna copia válida de la tabla
+        self.damaged = False
+        # Aumenta con cada cambio; permite a otros invalidar sus propias cachés
+        self.generation = 0
+        # Escrituras a disco hechas por flush() (mide cuánto agrupa la política group)
+        self.disk_writes = 0
+        # Índices secundarios (dueño, papelera, permisos) al día con la caché
+        self.index = FATIndex()
+        self._lock = threading.RLock()
+        self._table = None
+        self._signature = None
+        self._pending = 0
+        self._pending_records = []
+        self._snapshot_pending = False
+        self._journal_records = 0
+        self._journal_bytes = 0
+        self._timer = None
+        # Commit en grupo: número de cambios registrados y ya escritos a disco
+        self._commit_cond = threading.Condition(self._lock)
+        self._ticket = 0
+        self._committed = 0
+        self._leader = False
+
+    def _disk_signature(self):
+        return file_signature(self.fat_table_path), file_signature(self.journal_path)
+
+    def _read_snapshot(self, path):
+        if self.table_format == 'binary':
+            with open(path, 'rb') as f:
+                return BinaryFATTable(f.read())
+        with open(path, 'r', encoding='utf-8') as f:
+            fat_table = json.load(f)
+        if not isinstance(fat_table, dict):
+            raise ValueError("la tabla FAT no es un objeto JSON")
+        return fat_table
+
+    def _read(self):
+        """Lee la última tabla completa y le aplica los registros del journal"""
+        self.damaged = False
+        try:
+            fat_table = self._read_snapshot(self.fat_table_path)
+        except FileNotFoundError:
+            fat_table = {}
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"Tabla FAT dañada ({self.fat_table_path}): {e}")
+            try:
+                fat_table = self._read_snapshot(self.backup_path)
+                print(f"Se usa la copia anterior {self.backup_path}")
+            except (OSError, ValueError, UnicodeDecodeError):
+                print("No hay una copia válida de la tabla FAT; queda en solo lectura")
+                self.damaged = True
+                fat_table = {}
+
+        self._journal_records = 0
+        self._journal_bytes = 0
+        if self.journal_path is None:
+            return fat_table
+
+        try:
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        break  # Registro incompleto al final (escritura interrumpida)
+                    self._apply_record(fat_table, record)
+                    self._journal_records += 1
+                    self._journal_bytes += len(line)
+        except FileNotFoundError:
+            pass
+        return fat_table
+
+    @classmethod
+    def _apply_record(cls, fat_table, record):
+        if record['op'] == 'batch':
+            for change in record['records']:
+                cls._apply_record(fat_table, change)
+        elif record['op'] == 'put':
+            fat_table[record['filename']] = record['entry']
+        elif record['op'] == 'del':
+            fat_table.pop(record['filename'], None)
+
+    def _write(self, fat_table):
+        """Escribe la tabla completa: temporal + fsync + reemplazo atómico"""
+        directory = os.path.dirname(self.fat_table_path) or '.'
+        temp_path = self.fat_table_path + '.tmp'
+        if self.table_format == 'binary':
+            with open(temp_path, 'wb') as f:
+                f.write(encode_table(fat_table))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(fat_table, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+
+        # Conservar la versión anterior como respaldo (enlace, sin copiar datos)
+        if os.path.exists(self.fat_table_path):
+            try:
+                if os.path.exists(self.backup_path):
+                    os.remove(self.backup_path)
+                os.link(self.fat_table_path, self.backup_path)
+            except OSError:
+                pass
+        os.replace(temp_path, self.fat_table_path)
+        self._fsync_directory(directory)
+
+    @staticmethod
+    def _fsync_directory(directory):
+        """Hace durable el cambio de nombre (no disponible en Windows)"""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _append_journal(self, lines):
+        with open(self.journal_path, 'ab') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records += len(lines)
+        self._journal_bytes += sum(len(line) for line in lines)
+
+    def _truncate_journal(self):
+        if self.journal_path is not None and os.path.exists(self.journal_path):
+            open(self.journal_path, 'wb').close()
+        self._journal_records = 0
+        self._journal_bytes = 0
+
+    def load(self):
+        """Retorna la tabla en memoria, recargándola si cambió en disco"""
+        with self._lock:
+            signature = self._disk_signature()
+            if self._table is None or (signature != self._signature and not self._pending):
+                self._table = self._read()
+                self.index.rebuild(self._table)
+                self._signature = signature
+                self.generation += 1
+            return self._table
+
+    def save(self, fat_table, filename=None):
+        """Registra un cambio en la tabla y lo escribe según la política.
+
+        Si se indica filename, solo esa entrada cambió (o se eliminó) y basta
+        con un registro en el journal; sin filename se reescribe la tabla.
+        """
+        self.save_many(fat_table, None if filename is None else [filename])
+
+    def save_many(self, fat_table, filenames=None):
+        """Registra juntos los cambios de varias entradas.
+
+        En el journal quedan como un único registro 'batch', así que tras una
+        caída se aplican todos o ninguno.
+        """
+        with self._lock:
+            if self.damaged:
+                raise DamagedTableError(self.fat_table_path)
+            self._table = fat_table
+            if filenames is not None:
+                for filename in filenames:
+                    self.index.update(filename, fat_table.get(filename))
+            else:
+                self.index.rebuild(fat_table)
+            self._pending += 1
+            self._ticket += 1
+            ticket = self._ticket
+            self.generation += 1
+
+            if self.use_journal and filenames is not None and not self._snapshot_pending:
+                records = [self._change_record(fat_table, filename) for filename in filenames]
+                record = records[0] if len(records) == 1 else {'op': 'batch', 'records': records}
+                line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+                self._pending_records.append(line.encode('utf-8'))
+            else:
+                # Una reescritura completa deja obsoletos los registros pendientes
+                self._snapshot_pending = True
+                self._pending_records = []
+
+            if self.write_policy == 'immediate' or (
+                    self.write_policy == 'batched' and self._pending >= self.batch_size):
+                self.flush()
+            elif self.write_policy == 'batched' and self._timer is None:
+                self._timer = threading.Timer(self.batch_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            elif self.write_policy == 'group':
+                tickets = getattr(_deferred, 'tickets', None)
+                if tickets is not None:
+                    tickets[self] = ticket
+                else:
+                    self._group_commit(ticket)
+
+    @staticmethod
+    def _change_record(fat_table, filename):
+        if filename in fat_table:
+            return {'op': 'put', 'filename': filename, 'entry': fat_table[filename]}
+        return {'op': 'del', 'filename': filename}
+
+    def _group_commit(self, ticket):
+        """Espera a que el cambio ticket esté en disco.
+
+        El primero en llegar hace de líder: deja pasar group_window segundos
+        (sin el lock, para que otros hilos agreguen sus cambios) y escribe
+        todo lo pendiente de una vez; los demás solo esperan esa escritura.
+        """
+        if not self._leader:
+            self._leader = True
+            try:
+                deadline = time.monotonic() + self.group_window
+                while self._committed < ticket and time.monotonic() < deadline:
+                    self._commit_cond.wait(deadline - time.monotonic())
+            finally:
+                self._leader = False
+                if self._committed < ticket:
+                    self.flush()
+        while self._committed < ticket:
+            if not self._leader:
+                self.flush()  # El líder terminó sin escribir este cambio
+            else:
+                self._commit_cond.wait()
+
+    def wait_committed(self, ticket):
+        """Espera (o hace como líder) la escritura del cambio ticket con la política group"""
+        with self._lock:
+            self._group_commit(ticket)
+
+    def _mark_committed(self):
+        self._committed = self._ticket
+        self._commit_cond.notify_all()
+
+    def flush(self):
+        """Escribe los cambios pendientes a disco"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending or self._table is None:
+                return
+            if self.damaged:
+                # No sobrescribir la tabla dañada con una vacía
+                self._pending = 0
+                self._pending_records = []
+                self._snapshot_pending = False
+                self._mark_committed()
+                raise DamagedTableError(self.fat_table_path)
+
+            if self._snapshot_pending:
+                self._write(self._table)
+                self._truncate_journal()
+            else:
+                self._append_journal(self._pending_records)
+            self.disk_writes += 1
+
+            self._pending = 0
+            self._pending_records = []
+            self._snapshot_pending = False
+            self._mark_committed()
+
+            if (self._journal_records >= self.checkpoint_records
+                    or self._journal_bytes >= self.checkpoint_bytes):
+                self.checkpoint()
+            self._signature = self._disk_signature()
+
+    def checkpoint(self):
+        """Vuelca la tabla completa y vacía el journal"""
+        with self._lock:
+            fat_table = self.load() if self._table is None else self._table
+            if self.damaged:
+                raise DamagedTableError(self.fat_table_path)
+            self._write(fat_table)
+            self._truncate_journal()
+            self._pending = 0
+            self._pending_records = []
+            self._snapshot_pending = False
+            self._mark_committed()
+            self._signature = self._disk_signature()
+
+    def recover(self):
+        """Reaplica el journal sobre la última tabla completa y hace un checkpoint"""
+        with self._lock:
+            self.invalidate()
+            self.load()
+            replayed = self._journal_records
+            if replayed:
+                self.checkpoint()
+            return replayed
+
+    def invalidate(self):
+        """Descarta la caché (por ejemplo después de restaurar un backup)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._table = None
+            self.index.clear()
+            self._signature = None
+            self._pending = 0
+            self._pending_records = []
+            self._snapshot_pending = False
+            self._mark_committed()
+            self.generation += 1
+
+    def close(self):
+        """Escribe lo pendiente y, si el journal tiene registros, hace un checkpoint.
+
+        Así al abrir el volumen el journal solo trae cambios cuando el proceso
+        anterior terminó sin cerrarlo. Quien llama debe tener el bloqueo
+        exclusivo del volumen: el checkpoint reescribe la tabla completa.
+        """
+        with self._lock:
+            self.flush()
+            # Recargar por si otro proceso agregó registros al journal
+            self.load()
+            if self._journal_records and not self.damaged:
+                self.checkpoint()
@@ -0,0 +1,96 @@
+import copy
+from collections.abc import MutableMapping
+
+
+class TransactionAborted(Exception):
+    """Se lanza dentro de una transacción para descartar todos sus cambios"""
+
+
+class _WorkingTable(MutableMapping):
+    """Copia de trabajo de la tabla FAT: cada entrada se copia al accederla.
+
+    Así los métodos pueden modificar las entradas en su lugar sin tocar la
+    tabla confirmada hasta el commit. Solo se copian las entradas usadas:
+    el resto se sigue leyendo de la tabla base.
+    """
+
+    def __init__(self, fat_table):
+        self._base = fat_table
+        self._entries = {}
+        self._removed = set()
+
+    def __getitem__(self, filename):
+        if filename in self._removed:
+            raise KeyError(filename)
+        entry = self._entries.get(filename)
+        if entry is None:
+            entry = self._entries[filename] = copy.deepcopy(self._base[filename])
+        return entry
+
+    def __setitem__(self, filename, entry):
+        self._entries[filename] = entry
+        self._removed.discard(filename)
+
+    def __delitem__(self, filename):
+        if filename not in self:
+            raise KeyError(filename)
+        self._entries.pop(filename, None)
+        self._removed.add(filename)
+
+    def __contains__(self, filename):
+        return filename not in self._removed and (filename in self._entries or filename in self._base)
+
+    def __iter__(self):
+        for filename in self._base:
+            if filename not in self._removed:
+                yield filename
+        for filename in list(self._entries):
+            if filename not in self._base:
+                yield filename
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def current(self, filename):
+        """Entrada actual sin copiarla (None si no existe)"""
+        if filename in self._removed:
+            return None
+        entry = self._entries.get(filename)
+        return entry if entry is not None else self._base.get(filename)
+
+
+class FATTransaction:
+    """Cambios de la tabla FAT acumulados hasta un único commit.
+
+    La liberación de datos (bloques, extents, archivos grandes) se pospone
+    hasta el commit para que un rollback pueda dejar todo como estaba.
+    """
+
+    def __init__(self, fat_table):
+        self.base = fat_table
+        self.table = _WorkingTable(fat_table)
+        # Archivos modificados, en orden (diccionario usado como conjunto)
+        self.changed = {}
+        self.full_rewrite = False
+        self._deferred = []
+
+    def record_change(self, filename=None):
+        if filename is None:
+            self.full_rewrite = True
+        else:
+            self.changed[filename] = None
+
+    def defer(self, key, func, *args):
+        """Pospone una liberación de datos identificada por key"""
+        self._deferred.append((key, func, args))
+
+    def run_deferred(self, keep_keys=()):
+        """Ejecuta las liberaciones pospuestas salvo las de datos que siguen en uso"""
+        for key, func, args in self._deferred:
+            if key not in keep_keys:
+                func(*args)
+        self._deferred = []
+
+    def final_entries(self):
+        """Estado final de cada archivo modificado (None si se eliminó)"""
+        return {filename: self.table.current(filename) for filename in self.changed}
@@ -0,0 +1,126 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+SHARED = 'shared'
+EXCLUSIVE = 'exclusive'
+
+
+def file_signature(path):
+    """Firma (mtime, tamaño, inodo) de un archivo para detectar cambios de otros procesos"""
+    try:
+        stats = os.stat(path)
+        return stats.st_mtime_ns, stats.st_size, stats.st_ino
+    except (FileNotFoundError, TypeError):
+        return None
+
+
+class FileLock:
+    """Bloqueo lector/escritor entre procesos sobre un archivo de bloqueo.
+
+    Varios procesos pueden tener el bloqueo compartido a la vez; el exclusivo
+    es único. Dentro del proceso los hilos se turnan con un RLock, así que el
+    bloqueo es reentrante: un bloqueo exclusivo pedido dentro de uno
+    compartido lo convierte en exclusivo hasta que se libera. En Windows
+    (msvcrt) solo hay bloqueos exclusivos y los lectores también se turnan.
+    Con pin() el proceso conserva el bloqueo exclusivo aunque sus hilos lo
+    suelten, hasta el unpin() correspondiente.
+    """
+
+    def __init__(self, lock_path, enabled=True):
+        self.lock_path = lock_path
+        self.enabled = enabled
+        self._thread_lock = threading.RLock()
+        self._handle = None
+        self._modes = []
+        # Modo que tiene el bloqueo del sistema operativo y pin() pendientes
+        self._os_mode = None
+        self._pins = 0
+
+    @property
+    def depth(self):
+        """Nivel de anidamiento del bloqueo en el hilo que lo tiene"""
+        return len(self._modes)
+
+    def _os_lock(self, mode):
+        if self._handle is None:
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            self._handle = open(self.lock_path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_EX if mode == EXCLUSIVE else fcntl.LOCK_SH)
+        elif self._os_mode is None:
+            self._handle.seek(0)
+            msvcrt.locking(self._handle.fileno(), msvcrt.LK_LOCK, 1)
+        self._os_mode = mode
+
+    def _os_unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self._handle.seek(0)
+            msvcrt.locking(self._handle.fileno(), msvcrt.LK_UNLCK, 1)
+        self._os_mode = None
+
+    def _sync_os_lock(self):
+        """Ajusta el bloqueo del sistema operativo al modo más fuerte que se necesita"""
+        if self._pins:
+            wanted = EXCLUSIVE
+        else:
+            wanted = self._modes[-1] if self._modes else None
+        if not self.enabled or wanted == self._os_mode:
+            return
+        if wanted is None:
+            self._os_unlock()
+        else:
+            self._os_lock(wanted)
+
+    @contextmanager
+    def _hold(self, mode):
+        with self._thread_lock:
+            current = self._modes[-1] if self._modes else None
+            if current == EXCLUSIVE:
+                mode = EXCLUSIVE
+            self._modes.append(mode)
+            try:
+                self._sync_os_lock()
+            except BaseException:
+                self._modes.pop()
+                raise
+            try:
+                yield
+            finally:
+                self._modes.pop()
+                self._sync_os_lock()
+
+    def shared(self):
+        return self._hold(SHARED)
+
+    def exclusive(self):
+        return self._hold(EXCLUSIVE)
+
+    def pin(self):
+        """Conserva el bloqueo exclusivo entre procesos al soltarlo, hasta unpin().
+
+        Se llama con el bloqueo exclusivo tomado. Los hilos del proceso pueden
+        seguir tomándolo y soltándolo; los demás procesos esperan.
+        """
+        with self._thread_lock:
+            self._pins += 1
+            self._sync_os_lock()
+
+    def unpin(self):
+        with self._thread_lock:
+            self._pins -= 1
+            self._sync_os_lock()
+
+    def close(self):
+        with self._thread_lock:
+            if self._handle is not None and not self._modes and not self._pins:
+                self._handle.close()
+                self._handle = None
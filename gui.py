@@ -5,13 +5,30 @@ import os
 import pygame
 import pandas as pd
 import tempfile
-import base64
 from datetime import datetime
 import threading
 from fat_system import FATFileSystem
 
 pygame.mixer.init()
 
+# Bytes que se leen de un archivo grande para reconocer su tipo sin cargarlo
+PREVIEW_HEADER_BYTES = 64
+# Tamaño de las lecturas por rangos al copiar un archivo grande para la vista previa
+PREVIEW_CHUNK_SIZE = 1024 * 1024
+# Firmas de los tipos de archivo más comunes
+FILE_SIGNATURES = [
+    (b'\x89PNG', "Imagen PNG"),
+    (b'\xff\xd8\xff', "Imagen JPEG"),
+    (b'GIF8', "Imagen GIF"),
+    (b'%PDF', "Documento PDF"),
+    (b'PK\x03\x04', "Archivo ZIP / Office"),
+    (b'ID3', "Audio MP3"),
+    (b'OggS', "Audio OGG"),
+    (b'fLaC', "Audio FLAC"),
+    (b'RIFF', "Audio / video RIFF"),
+    (b'\x1aE\xdf\xa3', "Video MKV / WebM")
+]
+
 class FATFileSystemGUI(ctk.CTk):
     def __init__(self, current_user, user_role):
         super().__init__()
@@ -35,6 +52,8 @@ class FATFileSystemGUI(ctk.CTk):
         ctk.set_default_color_theme("blue")
         
         self.current_file = None
+        # Directorio que muestra la lista de archivos ('' es la raíz)
+        self.current_directory = ""
         
         self.create_widgets()
         self.update_file_list()
@@ -43,6 +62,7 @@ class FATFileSystemGUI(ctk.CTk):
     
     def on_closing(self):
         self.cleanup_temp_files()
+        self.system.close()
         self.destroy()
     
     def cleanup_temp_files(self):
@@ -221,6 +241,34 @@ class FATFileSystemGUI(ctk.CTk):
         self.search_entry.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
         self.search_entry.bind("<KeyRelease>", self.filter_files)
         
+        ctk.CTkButton(
+            search_frame,
+            text="⬆️ Subir nivel",
+            width=110,
+            height=35,
+            command=self.go_up_directory,
+            fg_color="#607D8B",
+            hover_color="#546E7A"
+        ).grid(row=0, column=1, padx=3, pady=5)
+        
+        ctk.CTkButton(
+            search_frame,
+            text="📁 Nueva carpeta",
+            width=130,
+            height=35,
+            command=self.create_directory_dialog,
+            fg_color="#FF9800",
+            hover_color="#F57C00"
+        ).grid(row=0, column=2, padx=3, pady=5)
+        
+        self.path_label = ctk.CTkLabel(
+            search_frame,
+            text="📂 /",
+            font=ctk.CTkFont(size=12, weight="bold"),
+            anchor="w"
+        )
+        self.path_label.grid(row=1, column=0, columnspan=3, padx=8, pady=(0, 5), sticky="w")
+        
         list_frame = ctk.CTkFrame(tab)
         list_frame.grid(row=1, column=0, sticky="nsew", padx=8, pady=8)
         list_frame.grid_columnconfigure(0, weight=1)
@@ -289,6 +337,7 @@ class FATFileSystemGUI(ctk.CTk):
     
     def logout(self):
         self.cleanup_temp_files()
+        self.system.close()
         self.destroy()
     
     def upload_file_dialog(self):
@@ -304,34 +353,57 @@ class FATFileSystemGUI(ctk.CTk):
         )
         
         if file_path:
+            file_size = os.path.getsize(file_path)
+            filename = self.path_in_current_directory(os.path.basename(file_path))
+            
+            dialog = ctk.CTkToplevel(self)
+            dialog.title("⬆️ Subiendo archivo")
+            dialog.geometry("420x170")
+            dialog.transient(self)
+            dialog.resizable(False, False)
+            self.center_dialog(dialog, 420, 170)
+            
+            ctk.CTkLabel(dialog, text=f"📦 {filename}", font=ctk.CTkFont(weight="bold")).pack(pady=(15, 5))
+            progress_label = ctk.CTkLabel(dialog, text=f"0.0 / {file_size / 1024 / 1024:.1f} MB",
+                                          font=ctk.CTkFont(size=11))
+            progress_label.pack(pady=3)
+            progress_bar = ctk.CTkProgressBar(dialog)
+            progress_bar.pack(fill="x", padx=20, pady=5)
+            progress_bar.set(0)
+            
+            # La copia se hace por partes en un hilo; el diálogo solo muestra el avance
+            cancel_event = threading.Event()
+            cancel_button = ctk.CTkButton(dialog, text="❌ Cancelar", command=cancel_event.set,
+                                          fg_color="#f44336", hover_color="#da190b")
+            cancel_button.pack(pady=8)
+            dialog.protocol("WM_DELETE_WINDOW", cancel_event.set)
+            
             self.show_loading("Subiendo archivo...")
+            shown = [-1]
+            
+            def update_progress(copied, total):
+                percent = int(copied * 100 / total) if total else 100
+                if percent != shown[0]:
+                    shown[0] = percent
+                    self.after(0, lambda: progress_bar.set(percent / 100))
+                    self.after(0, lambda: progress_label.configure(
+                        text=f"{copied / 1024 / 1024:.1f} / {total / 1024 / 1024:.1f} MB ({percent}%)"))
             
             def upload_thread():
                 try:
-                    file_size = os.path.getsize(file_path)
-                    
-                    # Límite de archivo: 10MB
-                    max_file_size = 10 * 1024 * 1024  # 10 MB
-                    if file_size > max_file_size:
-                        self.after(0, lambda: messagebox.showerror("Error", 
-                            f"El archivo es demasiado grande. Tamaño máximo: 10MB. Tu archivo: {file_size/1024/1024:.1f}MB"))
-                        return
-                    
-                    with open(file_path, 'rb') as file:
-                        file_content = file.read()
-                    
-                    encoded_content = base64.b64encode(file_content).decode('utf-8')
-                    filename = os.path.basename(file_path)
-                    
-                    if self.system.create_file(filename, encoded_content, self.current_user, is_binary=True):
+                    success, message = self.system.import_file(file_path, self.current_user, filename,
+                                                               progress=update_progress, cancel_event=cancel_event)
+                    if success:
                         self.after(0, lambda: messagebox.showinfo("Éxito", f"Archivo '{filename}' subido correctamente"))
                         self.after(0, self.update_file_list)
-                    else:
-                        self.after(0, lambda: messagebox.showerror("Error", "No se pudo subir el archivo (¿ya existe?)"))
-                        
+                    elif not cancel_event.is_set():
+                        self.after(0, lambda: messagebox.showerror("Error", f"No se pudo subir el archivo: {message}"))
                 except Exception as e:
-                    messagebox.showerror("Error", f"No se pudo subir el archivo: {str(e)}")
+                    # e deja de existir al terminar el except: el mensaje se pasa al callback
+                    msg = str(e)
+                    self.after(0, lambda msg=msg: messagebox.showerror("Error", f"No se pudo subir el archivo: {msg}"))
                 finally:
+                    self.after(0, dialog.destroy)
                     self.after(0, self.hide_loading)
             
             threading.Thread(target=upload_thread, daemon=True).start()
@@ -357,7 +429,8 @@ class FATFileSystemGUI(ctk.CTk):
         )
         label.pack(expand=True)
     
-    def display_content(self, filename, content, is_binary=False):
+    def display_content(self, filename, content, is_binary=False, total_size=None):
+        """Muestra el contenido; con total_size, content es solo el inicio de un archivo grande"""
         for widget in self.preview_content.winfo_children():
             widget.destroy()
         
@@ -369,25 +442,31 @@ class FATFileSystemGUI(ctk.CTk):
             
             def process_binary():
                 try:
-                    binary_content = base64.b64decode(content)
+                    ext = os.path.splitext(filename)[1].lower()
+                    size = len(content) if total_size is None else total_size
+                    if ext == '.pdf':
+                        self.after(0, lambda: self.display_pdf_message(filename))
+                        return
+                    if ext not in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.mp3', '.wav', '.ogg',
+                                   '.flac', '.xlsx', '.xls']:
+                        # Para el resto alcanza con el tamaño y la firma del inicio
+                        self.after(0, lambda: self.display_binary_info(filename, size, self.detect_file_type(content)))
+                        return
                     
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1])
-                    temp_file.write(binary_content)
+                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
+                    if total_size is None:
+                        temp_file.write(content)
+                    else:
+                        self.copy_by_ranges(filename, temp_file, total_size)
                     temp_file.close()
                     self.temp_files.append(temp_file.name)
                     
-                    ext = os.path.splitext(filename)[1].lower()
-                    
                     if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff']:
                         self.after(0, lambda: self.display_image(temp_file.name))
                     elif ext in ['.mp3', '.wav', '.ogg', '.flac']:
                         self.after(0, lambda: self.display_audio(temp_file.name, filename))
                     elif ext in ['.xlsx', '.xls']:
                         self.after(0, lambda: self.display_excel(temp_file.name, filename))
-                    elif ext == '.pdf':
-                        self.after(0, lambda: self.display_pdf_message(filename))
-                    else:
-                        self.after(0, lambda: self.display_binary_info(filename, len(binary_content)))
                         
                 except Exception: 
                     self.after(0, lambda: self.show_preview_message("❌ No se pudo cargar el archivo o no tiene permisos de lectura"))
@@ -510,13 +589,29 @@ class FATFileSystemGUI(ctk.CTk):
         )
         message.pack(pady=15)
     
-    def display_binary_info(self, filename, size):
+    def detect_file_type(self, header):
+        """Tipo de archivo según los primeros bytes"""
+        header = bytes(header[:PREVIEW_HEADER_BYTES])
+        for signature, description in FILE_SIGNATURES:
+            if header.startswith(signature):
+                return description
+        return "Archivo binario"
+    
+    def copy_by_ranges(self, filename, target, total_size):
+        """Copia un archivo grande leyéndolo por rangos (sin tenerlo entero en memoria)"""
+        for offset in range(0, total_size, PREVIEW_CHUNK_SIZE):
+            file_info, chunk = self.system.read_range(filename, offset, PREVIEW_CHUNK_SIZE, self.current_user)
+            if file_info is None:
+                raise OSError(chunk)
+            target.write(chunk)
+    
+    def display_binary_info(self, filename, size, file_type="Archivo binario"):
         info_frame = ctk.CTkFrame(self.preview_content)
         info_frame.pack(expand=True, padx=15, pady=15)
         
         message = ctk.CTkLabel(
             info_frame,
-            text=f"📦 {filename}\n\nTipo: Archivo binario\nTamaño: {size} bytes\n\nEste tipo de archivo puede ser descargado\npara su uso externo.",
+            text=f"📦 {filename}\n\nTipo: {file_type}\nTamaño: {size} bytes\n\nEste tipo de archivo puede ser descargado\npara su uso externo.",
             font=ctk.CTkFont(size=12),
             justify="center"
         )
@@ -540,9 +635,27 @@ class FATFileSystemGUI(ctk.CTk):
         text_widget.insert(1.0, content)
         text_widget.config(state="disabled")
     
+    def path_in_current_directory(self, name):
+        return f"{self.current_directory}/{name}" if self.current_directory else name
+    
+    def enter_directory(self, path):
+        self.current_directory = path
+        self.search_entry.delete(0, "end")
+        self.update_file_list()
+    
+    def go_up_directory(self):
+        if self.current_directory:
+            self.enter_directory(self.current_directory.rpartition('/')[0])
+    
     def update_file_list(self, files=None):
         if files is None:
-            files = self.system.list_files()
+            files = self.system.list_directory(self.current_directory)
+            if files is None:
+                # El directorio ya no existe (otro usuario lo movió o eliminó)
+                self.current_directory = ""
+                files = self.system.list_directory("")
+        
+        self.path_label.configure(text=f"📂 /{self.current_directory}")
         
         for widget in self.file_listbox.winfo_children():
             widget.destroy()
@@ -570,8 +683,13 @@ class FATFileSystemGUI(ctk.CTk):
         
         filename = file_info['filename']
         ext = os.path.splitext(filename)[1].lower()
+        # Dentro del directorio actual basta el nombre; los resultados de búsqueda muestran la ruta
+        prefix = f"{self.current_directory}/" if self.current_directory else ""
+        display_name = filename[len(prefix):] if filename.startswith(prefix) else filename
         
-        if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
+        if file_info.get('is_directory', False):
+            icon = "📁"
+        elif ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
             icon = "🖼️"
         elif ext in ['.mp3', '.wav', '.ogg']:
             icon = "🎵"
@@ -584,7 +702,11 @@ class FATFileSystemGUI(ctk.CTk):
         else:
             icon = "📦"
         
-        info_text = f"{icon} {filename}\n   📏 {file_info['total_chars']} chars • 👤 {file_info['owner']}"
+        if file_info.get('is_directory', False):
+            info_text = f"{icon} {display_name}\n   📂 Carpeta • 👤 {file_info['owner']}"
+        else:
+            unit = "bytes" if file_info.get('is_binary', False) else "chars"
+            info_text = f"{icon} {display_name}\n   📏 {file_info['total_chars']} {unit} • 👤 {file_info['owner']}"
         
         file_label = ctk.CTkLabel(
             file_frame,
@@ -598,24 +720,42 @@ class FATFileSystemGUI(ctk.CTk):
         btn_frame = ctk.CTkFrame(file_frame, fg_color="transparent")
         btn_frame.pack(side="right", padx=4, pady=4)
         
+        if file_info.get('is_directory', False):
+            open_command = lambda f=filename: self.enter_directory(f)
+            delete_command = lambda f=filename: self.remove_directory_dialog(f)
+        else:
+            open_command = lambda f=filename: self.select_file(f)
+            delete_command = lambda f=filename: self.delete_file_dialog(f)
+        
         select_btn = ctk.CTkButton(
             btn_frame,
             text="Abrir",
             width=70,
             height=30,
-            command=lambda f=file_info['filename']: self.select_file(f),
+            command=open_command,
             fg_color="#2196F3",
             hover_color="#1976D2"
         )
         select_btn.pack(side="left", padx=1)
         
         if file_info['owner'] == self.current_user:
+            move_btn = ctk.CTkButton(
+                btn_frame,
+                text="↔️",
+                width=35,
+                height=30,
+                command=lambda f=filename: self.move_dialog(f),
+                fg_color="#607D8B",
+                hover_color="#546E7A"
+            )
+            move_btn.pack(side="left", padx=1)
+            
             delete_btn = ctk.CTkButton(
                 btn_frame,
                 text="🗑️",
                 width=35,
                 height=30,
-                command=lambda f=file_info['filename']: self.delete_file_dialog(f),
+                command=delete_command,
                 fg_color="#757575",
                 hover_color="#616161"
             )
@@ -630,11 +770,18 @@ class FATFileSystemGUI(ctk.CTk):
         self.show_loading("Cargando archivo...")
         
         def load_file_thread():
-            file_info, content = self.system.open_file(filename, self.current_user)
+            file_info = self.system.get_file_info(filename)
+            total_size = None
+            if file_info and file_info.get('is_large_file', False):
+                # Los archivos grandes no se cargan enteros: solo el inicio para reconocer el tipo
+                total_size = file_info['total_chars']
+                file_info, content = self.system.read_range(filename, 0, PREVIEW_HEADER_BYTES, self.current_user)
+            else:
+                file_info, content = self.system.open_file(filename, self.current_user)
             
             if file_info and content is not None:
                 is_binary = file_info.get('is_binary', False)
-                self.after(0, lambda: self.display_content(filename, content, is_binary))
+                self.after(0, lambda: self.display_content(filename, content, is_binary, total_size))
                 self.after(0, lambda: self.show_metadata(file_info))
             else:
                 self.after(0, lambda: self.show_preview_message("❌ No se pudo cargar el archivo o no tiene permisos de lectura"))
@@ -659,12 +806,14 @@ class FATFileSystemGUI(ctk.CTk):
         labels = [
             ("📝 Nombre:", file_info['filename']),
             ("👤 Propietario:", file_info['owner']),
-            ("📏 Tamaño:", f"{file_info['total_chars']} caracteres"),
+            ("📏 Tamaño:", f"{file_info['total_chars']} {'bytes' if file_info.get('is_binary', False) else 'caracteres'}"),
             ("📅 Creación:", file_info['creation_date'][:19]),
             ("✏️ Modificación:", file_info['modification_date'][:19]),
             ("🗑️ En Papelera:", "✅ Sí" if file_info['in_recycle_bin'] else "❌ No"),
             ("🔧 Tipo:", "📦 Binario" if file_info.get('is_binary', False) else "📝 Texto")
         ]
+        if 'sha256' in file_info:
+            labels.append(("🔑 SHA-256:", file_info['sha256'][:16] + "…"))
         
         for i, (label, value) in enumerate(labels, 1):
             lbl = ctk.CTkLabel(
@@ -707,18 +856,60 @@ class FATFileSystemGUI(ctk.CTk):
     
     def filter_files(self, event=None):
         search_term = self.search_entry.get().lower()
-        all_files = self.system.list_files()
         
         if not search_term:
-            filtered_files = all_files
-        else:
-            filtered_files = [
-                f for f in all_files 
-                if search_term in f['filename'].lower() or search_term in f['owner'].lower()
-            ]
+            self.update_file_list()
+            return
+        
+        # La búsqueda recorre solo el subárbol del directorio actual
+        all_files = self.system.list_files(self.current_directory, recursive=True)
+        filtered_files = [
+            f for f in all_files 
+            if search_term in f['filename'].lower() or search_term in f['owner'].lower()
+        ]
         
         self.update_file_list(filtered_files)
     
+    def create_directory_dialog(self):
+        dialog = ctk.CTkInputDialog(text=f"Nombre de la carpeta en /{self.current_directory}:",
+                                    title="📁 Nueva Carpeta")
+        name = dialog.get_input()
+        if not name or not name.strip():
+            return
+        
+        if self.system.mkdir(self.path_in_current_directory(name.strip()), self.current_user):
+            self.update_file_list()
+        else:
+            messagebox.showerror("Error", "❌ No se pudo crear la carpeta (¿ya existe o no tiene permisos?)")
+    
+    def remove_directory_dialog(self, path):
+        result = messagebox.askyesno("Eliminar Carpeta", f"¿Eliminar la carpeta '{path}'?")
+        if not result:
+            return
+        
+        if self.system.rmdir(path, self.current_user):
+            messagebox.showinfo("Éxito", "🗑️ Carpeta eliminada")
+            self.update_file_list()
+        else:
+            messagebox.showerror("Error", "❌ Solo se pueden eliminar carpetas vacías "
+                                 "(sin archivos tampoco en la papelera)")
+    
+    def move_dialog(self, path):
+        dialog = ctk.CTkInputDialog(
+            text=f"Mover '{path}' a (carpeta existente o nueva ruta; vacío = raíz):",
+            title="↔️ Mover / Renombrar")
+        destination = dialog.get_input()
+        if destination is None:
+            return
+        
+        if self.system.move(path, destination.strip(), self.current_user):
+            if self.current_file == path:
+                self.current_file = None
+            messagebox.showinfo("Éxito", "✅ Movido correctamente")
+            self.update_file_list()
+        else:
+            messagebox.showerror("Error", "❌ No se pudo mover (¿el destino ya existe o la carpeta no existe?)")
+    
     def create_file_dialog(self):
         dialog = ctk.CTkToplevel(self)
         dialog.title("📄 Crear Nuevo Archivo")
@@ -745,7 +936,7 @@ class FATFileSystemGUI(ctk.CTk):
                 messagebox.showerror("Error", "❌ El nombre del archivo es requerido")
                 return
             
-            if self.system.create_file(filename, content, self.current_user):
+            if self.system.create_file(self.path_in_current_directory(filename), content, self.current_user):
                 messagebox.showinfo("Éxito", "✅ Archivo creado correctamente")
                 self.update_file_list()
                 dialog.destroy()
@@ -938,6 +1129,10 @@ class FATFileSystemGUI(ctk.CTk):
             messagebox.showerror("Error", "No tiene permisos de escritura para este archivo")
             return
         
+        if file_info.get('is_binary', False):
+            messagebox.showwarning("Advertencia", "Los archivos binarios no se pueden editar como texto")
+            return
+        
         dialog = ctk.CTkToplevel(self)
         dialog.title(f"✏️ Modificar Archivo: {self.current_file}")
         dialog.geometry("550x450")
@@ -948,6 +1143,8 @@ class FATFileSystemGUI(ctk.CTk):
         self.center_dialog(dialog, 550, 450)
         
         file_info, current_content = self.system.open_file(self.current_file, self.current_user)
+        # Versión leída: si otro usuario o proceso guarda antes, se detecta el conflicto
+        expected_version = file_info.get('version', 0) if file_info else None
         
         ctk.CTkLabel(dialog, text="Contenido actual:", font=ctk.CTkFont(weight="bold")).pack(pady=8)
         content_text = scrolledtext.ScrolledText(dialog, height=12, width=60)
@@ -957,13 +1154,18 @@ class FATFileSystemGUI(ctk.CTk):
         def modify_file():
             new_content = content_text.get(1.0, "end").strip()
             
-            if self.system.modify_file(self.current_file, new_content, self.current_user):
+            if self.system.modify_file(self.current_file, new_content, self.current_user, expected_version):
                 messagebox.showinfo("Éxito", "✅ Archivo modificado correctamente")
                 self.update_file_list()
                 self.select_file(self.current_file)
                 dialog.destroy()
             else:
-                messagebox.showerror("Error", "❌ No se pudo modificar el archivo")
+                latest = self.system.get_file_info(self.current_file)
+                if latest and latest.get('version', 0) != expected_version:
+                    messagebox.showerror("Conflicto", "❌ Otro usuario modificó el archivo mientras lo editaba.\n"
+                                         "Cierre este diálogo y vuelva a abrirlo para ver la versión actual.")
+                else:
+                    messagebox.showerror("Error", "❌ No se pudo modificar el archivo")
         
         ctk.CTkButton(
             dialog, 
@@ -1134,6 +1336,14 @@ class FATFileSystemGUI(ctk.CTk):
         backup_name_entry = ctk.CTkEntry(main_frame, placeholder_text="Dejar vacío para nombre automático")
         backup_name_entry.pack(fill="x", pady=3)
         
+        directory_only = ctk.BooleanVar(value=False)
+        if self.current_directory:
+            ctk.CTkCheckBox(
+                main_frame,
+                text=f"Solo la carpeta actual (/{self.current_directory})",
+                variable=directory_only
+            ).pack(anchor="w", pady=(8, 3))
+        
         status_frame = ctk.CTkFrame(main_frame)
         status_frame.pack(fill="x", pady=15)
         
@@ -1157,7 +1367,8 @@ class FATFileSystemGUI(ctk.CTk):
             
             def backup_thread():
                 try:
-                    success, message = self.system.create_backup(backup_name)
+                    directory = self.current_directory if directory_only.get() else None
+                    success, message = self.system.create_backup(backup_name, directory)
                     
                     if success:
                         self.after(0, lambda: progress_bar.set(1.0))
@@ -1230,6 +1441,7 @@ class FATFileSystemGUI(ctk.CTk):
             "⚠️ ADVERTENCIA: Al restaurar un backup:\n"
             "• Todos los datos actuales serán reemplazados\n"
             "• Se creará un backup automático antes de restaurar\n"
+            "• Un backup de carpeta solo reemplaza esa carpeta\n"
             "• Esta acción no se puede deshacer"
         )
         
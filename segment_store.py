@@ -0,0 +1,266 @@
+import os
+import shutil
+import struct
+import threading
+from file_lock import file_signature
+
+# Registro en el segmento: longitud del id, longitud del contenido, id, contenido
+_RECORD_HEADER = struct.Struct('<BI')
+# Entrada del índice: operación, longitud del id, id, [segmento, offset, longitud]
+_INDEX_HEADER = struct.Struct('<BB')
+_INDEX_LOCATION = struct.Struct('<IQI')
+
+_HAS_PREAD = hasattr(os, 'pread')
+
+_OP_DELETE = 0
+_OP_PUT = 1
+
+
+class SegmentStore:
+    """Almacena bloques concatenados en pocos archivos de segmento grandes.
+
+    Cada bloque se agrega al final del segmento activo y un índice compacto
+    (id -> segmento, offset, longitud) permite leerlo con un solo seek.
+    El índice es un registro de solo-agregado que se carga en memoria.
+    """
+
+    def __init__(self, segments_dir, max_segment_size=64 * 1024 * 1024):
+        self.segments_dir = segments_dir
+        self.max_segment_size = max_segment_size
+        self.index_path = os.path.join(segments_dir, "index.bin")
+        self._lock = threading.RLock()
+        self._index = {}
+        self._dead_bytes = {}
+        self._readers = {}
+        self._writer = None
+        self._active_segment = 0
+        self._signature = None
+        os.makedirs(segments_dir, exist_ok=True)
+        self._load_index()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.segments_dir, f"seg_{segment:05d}.dat")
+
+    def _load_index(self):
+        """Carga el índice de solo-agregado en memoria"""
+        self._index = {}
+        self._dead_bytes = {}
+        segments = [int(name[4:-4]) for name in self._segment_files()]
+        self._active_segment = max(segments) if segments else 0
+        self._signature = file_signature(self.index_path)
+
+        try:
+            with open(self.index_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+
+        pos = 0
+        while pos + _INDEX_HEADER.size <= len(raw):
+            op, id_len = _INDEX_HEADER.unpack_from(raw, pos)
+            pos += _INDEX_HEADER.size
+            block_id = raw[pos:pos + id_len].decode('ascii')
+            pos += id_len
+            if op == _OP_PUT:
+                if pos + _INDEX_LOCATION.size > len(raw):
+                    break  # Entrada incompleta al final (escritura interrumpida)
+                location = _INDEX_LOCATION.unpack_from(raw, pos)
+                pos += _INDEX_LOCATION.size
+                self._forget(block_id)
+                self._index[block_id] = location
+            else:
+                self._forget(block_id)
+
+    def _forget(self, block_id):
+        """Quita un bloque del índice en memoria y contabiliza el espacio muerto"""
+        location = self._index.pop(block_id, None)
+        if location:
+            segment, _, length = location
+            self._dead_bytes[segment] = self._dead_bytes.get(segment, 0) + length
+
+    def _append_index(self, entries):
+        with open(self.index_path, 'ab') as f:
+            f.write(b''.join(entries))
+        self._signature = file_signature(self.index_path)
+
+    @staticmethod
+    def _index_entry(op, block_id, location=None):
+        encoded_id = block_id.encode('ascii')
+        entry = _INDEX_HEADER.pack(op, len(encoded_id)) + encoded_id
+        if location is not None:
+            entry += _INDEX_LOCATION.pack(*location)
+        return entry
+
+    def _get_writer(self):
+        """Retorna el manejador del segmento activo, rotando si está lleno"""
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._active_segment), 'ab')
+        elif self._writer.tell() >= self.max_segment_size:
+            self._writer.close()
+            self._active_segment += 1
+            self._writer = open(self._segment_path(self._active_segment), 'ab')
+        return self._writer
+
+    def put_many(self, items):
+        """Agrega varios bloques (id, bytes) con un único manejador y una escritura de índice"""
+        with self._lock:
+            entries = []
+            for block_id, payload in items:
+                block_id = str(block_id)
+                writer = self._get_writer()
+                encoded_id = block_id.encode('ascii')
+                offset = writer.tell() + _RECORD_HEADER.size + len(encoded_id)
+                writer.write(_RECORD_HEADER.pack(len(encoded_id), len(payload)))
+                writer.write(encoded_id)
+                writer.write(payload)
+                location = (self._active_segment, offset, len(payload))
+                self._forget(block_id)
+                self._index[block_id] = location
+                entries.append(self._index_entry(_OP_PUT, block_id, location))
+            if self._writer is not None:
+                self._writer.flush()
+            if entries:
+                self._append_index(entries)
+
+    def put(self, block_id, payload):
+        """Agrega un bloque al segmento activo"""
+        self.put_many([(block_id, payload)])
+
+    def get(self, block_id):
+        """Retorna el contenido de un bloque o None si no existe"""
+        with self._lock:
+            location = self._index.get(str(block_id))
+            if location is None:
+                return None
+            segment, offset, length = location
+            reader = self._readers.get(segment)
+            if reader is None:
+                reader = open(self._segment_path(segment), 'rb')
+                self._readers[segment] = reader
+            if not _HAS_PREAD:
+                reader.seek(offset)
+                return reader.read(length)
+            fd = reader.fileno()
+
+        # pread no depende de la posición del manejador: varios hilos leen en paralelo
+        return os.pread(fd, length, offset)
+
+    def contains(self, block_id):
+        return str(block_id) in self._index
+
+    def delete_many(self, block_ids):
+        """Marca bloques como eliminados; el espacio se recupera al compactar"""
+        with self._lock:
+            entries = []
+            for block_id in map(str, block_ids):
+                if block_id in self._index:
+                    self._forget(block_id)
+                    entries.append(self._index_entry(_OP_DELETE, block_id))
+            if entries:
+                self._append_index(entries)
+
+    def delete(self, block_id):
+        self.delete_many([block_id])
+
+    def ids(self):
+        """Ids de todos los bloques vivos"""
+        with self._lock:
+            return list(self._index)
+
+    def stats(self):
+        """Estadísticas de ocupación de los segmentos"""
+        with self._lock:
+            live_bytes = sum(length for _, _, length in self._index.values())
+            return {
+                'blocks': len(self._index),
+                'segments': len(self._segment_files()),
+                'live_bytes': live_bytes,
+                'dead_bytes': sum(self._dead_bytes.values())
+            }
+
+    def compact(self):
+        """Reescribe los bloques vivos en segmentos nuevos y descarta el espacio muerto.
+
+        Los segmentos nuevos se numeran después de los actuales y el índice
+        nuevo se escribe en index.bin.tmp y reemplaza al anterior con
+        os.replace; los segmentos viejos se borran solo después. Si el
+        proceso cae a mitad de camino sigue valiendo el índice anterior y los
+        segmentos que sobren se borran en la próxima compactación.
+        """
+        with self._lock:
+            old_segments = self._segment_files()
+            segment = self._active_segment + 1
+            writer = None
+            index = {}
+            entries = []
+            for block_id in list(self._index):
+                payload = self.get(block_id)
+                if writer is None or writer.tell() >= self.max_segment_size:
+                    if writer is not None:
+                        self._sync_close(writer)
+                        segment += 1
+                    writer = open(self._segment_path(segment), 'wb')
+                encoded_id = block_id.encode('ascii')
+                offset = writer.tell() + _RECORD_HEADER.size + len(encoded_id)
+                writer.write(_RECORD_HEADER.pack(len(encoded_id), len(payload)))
+                writer.write(encoded_id)
+                writer.write(payload)
+                index[block_id] = (segment, offset, len(payload))
+                entries.append(self._index_entry(_OP_PUT, block_id, index[block_id]))
+            if writer is not None:
+                self._sync_close(writer)
+
+            temp_path = self.index_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(b''.join(entries))
+                self._sync_close(f)
+            os.replace(temp_path, self.index_path)
+
+            self.close()
+            for name in old_segments:
+                os.remove(os.path.join(self.segments_dir, name))
+            self._index = index
+            self._dead_bytes = {}
+            self._active_segment = segment
+            self._signature = file_signature(self.index_path)
+            return len(index)
+
+    def _segment_files(self):
+        return [name for name in os.listdir(self.segments_dir) if name.startswith("seg_") and name.endswith(".dat")]
+
+    @staticmethod
+    def _sync_close(handle):
+        handle.flush()
+        os.fsync(handle.fileno())
+        handle.close()
+
+    def close(self):
+        """Cierra los manejadores abiertos"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+
+    def destroy(self):
+        """Cierra el almacenamiento y borra sus archivos"""
+        with self._lock:
+            self.close()
+            shutil.rmtree(self.segments_dir, ignore_errors=True)
+            self._index = {}
+            self._dead_bytes = {}
+
+    def refresh(self):
+        """Recarga el índice si otro proceso lo modificó"""
+        with self._lock:
+            if file_signature(self.index_path) != self._signature:
+                self.reload()
+
+    def reload(self):
+        """Vuelve a leer el índice desde disco (por ejemplo tras restaurar un backup)"""
+        with self._lock:
+            self.close()
+            os.makedirs(self.segments_dir, exist_ok=True)
+            self._load_index()
@@ -0,0 +1,345 @@
+import os
+import json
+import zlib
+import shutil
+import threading
+from collections.abc import MutableMapping, ItemsView, ValuesView
+from fat_table_manager import FATTableManager, DamagedTableError
+from file_lock import file_signature
+
+# Describe los shards de un directorio (cantidad y formato); manda sobre la configuración
+SHARDS_META = 'shards.json'
+
+
+class ShardedFATTable:
+    """Tabla FAT repartida en shards por hash del nombre; misma interfaz que FATTableManager.
+
+    Cada shard es un FATTableManager con su propio archivo, journal y lock,
+    así que un cambio reescribe solo el shard de ese archivo y los flush de
+    shards distintos no se esperan entre sí. load() retorna una vista que une
+    los shards y carga cada uno recién cuando se usa.
+
+    Un cambio que toca varios shards se escribe antes en intent.log; si el
+    proceso cae a mitad de camino, el registro se vuelve a aplicar al abrir
+    la tabla, de modo que los lotes siguen siendo todo o nada.
+    """
+
+    def __init__(self, shards_dir, shard_count=16, write_policy='immediate', batch_size=100,
+                 batch_interval=2.0, checkpoint_records=1000, checkpoint_bytes=4 * 1024 * 1024,
+                 use_journal=True, group_window=0.005, table_format='json'):
+        self.shards_dir = shards_dir
+        self.meta_path = os.path.join(shards_dir, SHARDS_META)
+        self.intent_path = os.path.join(shards_dir, 'intent.log')
+        self._options = {
+            'write_policy': write_policy,
+            'batch_size': batch_size,
+            'batch_interval': batch_interval,
+            'checkpoint_records': checkpoint_records,
+            'checkpoint_bytes': checkpoint_bytes,
+            'use_journal': use_journal,
+            'group_window': group_window
+        }
+        self._lock = threading.RLock()
+        self.index = _ShardedIndex(self)
+        self._view = _ShardedView(self)
+        self._open_shards(shard_count, table_format)
+
+    # --- Shards ---
+
+    def _open_shards(self, shard_count=None, table_format=None):
+        """Abre los shards descritos por shards.json (o los indicados si aún no existe)"""
+        self._finish_reshard()
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            shard_count, table_format = meta['shard_count'], meta['table_format']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            shard_count = shard_count or getattr(self, 'shard_count', 16)
+            table_format = table_format or getattr(self, 'table_format', 'json')
+        self.shard_count = shard_count
+        self.table_format = table_format
+        self._meta_signature = file_signature(self.meta_path)
+
+        extension = 'bin' if table_format == 'binary' else 'json'
+        self.shards = [
+            FATTableManager(os.path.join(self.shards_dir, f"shard_{number:03d}.{extension}"),
+                            journal_path=os.path.join(self.shards_dir, f"shard_{number:03d}.journal"),
+                            table_format=table_format, **self._options)
+            for number in range(shard_count)
+        ]
+
+    def _finish_reshard(self):
+        """Completa o descarta un reshard interrumpido (ver reshard())"""
+        new_dir, old_dir = self.shards_dir + '.new', self.shards_dir + '.old'
+        if os.path.isdir(new_dir):
+            if os.path.isdir(self.shards_dir):
+                shutil.rmtree(new_dir)  # Se cayó antes de terminar de escribir los shards nuevos
+            else:
+                os.replace(new_dir, self.shards_dir)
+        if os.path.isdir(old_dir) and os.path.isdir(self.shards_dir):
+            shutil.rmtree(old_dir)
+
+    def _write_meta(self):
+        if os.path.exists(self.meta_path):
+            return
+        os.makedirs(self.shards_dir, exist_ok=True)
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'shard_count': self.shard_count, 'table_format': self.table_format}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.meta_path)
+        self._meta_signature = file_signature(self.meta_path)
+
+    def shard_number(self, filename):
+        """Shard de un archivo: crc32 del nombre (estable entre procesos y ejecuciones)"""
+        return zlib.crc32(filename.encode('utf-8')) % self.shard_count
+
+    def _shard(self, filename):
+        return self.shards[self.shard_number(filename)]
+
+    # --- Interfaz de FATTableManager ---
+
+    @property
+    def damaged(self):
+        return any(shard.damaged for shard in self.shards)
+
+    @property
+    def generation(self):
+        return sum(shard.generation for shard in self.shards)
+
+    def load(self):
+        """Retorna la vista de todos los shards (cada shard se recarga al usarlo)"""
+        with self._lock:
+            if file_signature(self.meta_path) != self._meta_signature:
+                # Otro proceso cambió la cantidad de shards
+                self._open_shards()
+            if os.path.exists(self.intent_path) and os.path.getsize(self.intent_path):
+                self._replay_intent()
+            return self._view
+
+    def save(self, fat_table, filename=None):
+        self.save_many(fat_table, None if filename is None else [filename])
+
+    def save_many(self, fat_table, filenames=None):
+        """Registra los cambios en los shards que corresponden a cada archivo"""
+        with self._lock:
+            # Con un shard dañado no se escribe ninguno: un lote no puede quedar a medias
+            if self.damaged:
+                raise DamagedTableError(self.shards_dir)
+            self._write_meta()
+            if filenames is None:
+                # Reescritura completa: cada shard recibe su parte de la tabla
+                parts = [{} for _ in self.shards]
+                for filename, entry in fat_table.items():
+                    parts[self.shard_number(filename)][filename] = entry
+                for shard, part in zip(self.shards, parts):
+                    shard.save_many(part, None)
+                return
+
+            groups = {}
+            for filename in filenames:
+                groups.setdefault(self.shard_number(filename), []).append(filename)
+            if fat_table is not self._view:
+                for filename in filenames:
+                    shard_table = self._shard(filename).load()
+                    if filename in fat_table:
+                        shard_table[filename] = fat_table[filename]
+                    else:
+                        shard_table.pop(filename, None)
+
+            if len(groups) == 1:
+                number, names = groups.popitem()
+                self.shards[number].save_many(self.shards[number].load(), names)
+                return
+
+            self._write_intent([FATTableManager._change_record(fat_table, filename) for filename in filenames])
+            for number, names in groups.items():
+                self.shards[number].save_many(self.shards[number].load(), names)
+                self.shards[number].flush()
+            self._clear_intent()
+
+    def _write_intent(self, records):
+        line = json.dumps({'op': 'batch', 'records': records}, ensure_ascii=False, separators=(',', ':'))
+        with open(self.intent_path, 'wb') as f:
+            f.write(line.encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _clear_intent(self):
+        open(self.intent_path, 'wb').close()
+
+    def _replay_intent(self):
+        """Vuelve a aplicar un lote entre shards que quedó a medio escribir"""
+        try:
+            with open(self.intent_path, 'rb') as f:
+                record = json.loads(f.readline())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            record = None  # El lote no llegó a registrarse completo: no se aplicó nada
+        if record is not None:
+            groups = {}
+            for change in record['records']:
+                number = self.shard_number(change['filename'])
+                FATTableManager._apply_record(self.shards[number].load(), change)
+                groups.setdefault(number, []).append(change['filename'])
+            for number, names in groups.items():
+                self.shards[number].save_many(self.shards[number].load(), names)
+                self.shards[number].flush()
+            print(f"Tabla FAT: lote de {len(record['records'])} cambios entre shards recuperado")
+        self._clear_intent()
+
+    def flush(self):
+        with self._lock:
+            for shard in self.shards:
+                shard.flush()
+
+    def checkpoint(self):
+        with self._lock:
+            for shard in self.shards:
+                shard.checkpoint()
+
+    def recover(self):
+        with self._lock:
+            self.load()
+            return sum(shard.recover() for shard in self.shards)
+
+    def invalidate(self):
+        with self._lock:
+            for shard in self.shards:
+                shard.invalidate()
+
+    def close(self):
+        with self._lock:
+            for shard in self.shards:
+                shard.close()
+
+    def reshard(self, shard_count, table_format=None):
+        """Reparte la tabla en shard_count shards; retorna la cantidad de entradas.
+
+        Los shards nuevos se escriben completos en <dir>.new y recién después
+        reemplazan a los actuales, así una caída deja una de las dos versiones
+        entera (_finish_reshard completa el cambio al abrir).
+        """
+        with self._lock:
+            fat_table = dict(self.load().items())
+            self.close()
+
+            new_dir = self.shards_dir + '.new'
+            if os.path.isdir(new_dir):
+                shutil.rmtree(new_dir)
+            target = ShardedFATTable(new_dir, shard_count, table_format=table_format or self.table_format,
+                                     **self._options)
+            target.save(fat_table)
+            target.checkpoint()
+            target.close()
+
+            old_dir = self.shards_dir + '.old'
+            if os.path.isdir(self.shards_dir):
+                os.replace(self.shards_dir, old_dir)
+            os.replace(new_dir, self.shards_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+            self._open_shards()
+            return len(fat_table)
+
+    def stats(self):
+        """Entradas y bytes en disco de cada shard"""
+        return [{'shard': number,
+                 'entries': len(shard.load()),
+                 'bytes': sum(os.path.getsize(path) for path in (shard.fat_table_path, shard.journal_path)
+                              if os.path.exists(path))}
+                for number, shard in enumerate(self.shards)]
+
+
+class _ShardedView(MutableMapping):
+    """Tabla FAT completa vista a través de los shards"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, filename):
+        if not isinstance(filename, str):
+            raise KeyError(filename)
+        return self._table._shard(filename).load()[filename]
+
+    def __setitem__(self, filename, entry):
+        self._table._shard(filename).load()[filename] = entry
+
+    def __delitem__(self, filename):
+        del self._table._shard(filename).load()[filename]
+
+    def __contains__(self, filename):
+        return isinstance(filename, str) and filename in self._table._shard(filename).load()
+
+    def __iter__(self):
+        for shard in self._table.shards:
+            yield from list(shard.load())
+
+    def __len__(self):
+        return sum(len(shard.load()) for shard in self._table.shards)
+
+    def clear(self):
+        for shard in self._table.shards:
+            shard.load().clear()
+
+    def _items(self):
+        for shard in self._table.shards:
+            yield from list(shard.load().items())
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        yield from self._mapping._items()
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        for _, entry in self._mapping._items():
+            yield entry
+
+
+class _ShardedIndex:
+    """Une los índices secundarios de los shards (cada uno al día con su shard)"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def _indexes(self):
+        for shard in self._table.shards:
+            shard.load()
+            yield shard.index
+
+    def active(self):
+        return [filename for index in self._indexes() for filename in index.active()]
+
+    def recycle_bin(self):
+        return [filename for index in self._indexes() for filename in index.recycle_bin()]
+
+    def owned_by(self, owner):
+        return [filename for index in self._indexes() for filename in index.owned_by(owner)]
+
+    def shared_with(self, user):
+        return [filename for index in self._indexes() for filename in index.shared_with(user)]
+
+    def children(self, directory):
+        return [path for index in self._indexes() for path in index.children(directory)]
+
+    def is_directory(self, path):
+        shard = self._table._shard(path)
+        shard.load()
+        return shard.index.is_directory(path)
+
+    def descendants(self, directory):
+        paths = []
+        pending = [directory]
+        while pending:
+            for path in self.children(pending.pop()):
+                paths.append(path)
+                if self.is_directory(path):
+                    pending.append(path)
+        return paths
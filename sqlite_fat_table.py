@@ -0,0 +1,196 @@
+import json
+import threading
+from fat_index import FATIndex
+from fat_table_manager import WRITE_POLICIES
+from sqlite_store import connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    filename TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    in_recycle_bin INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_owner ON entries (owner);
+CREATE INDEX IF NOT EXISTS idx_entries_recycle ON entries (in_recycle_bin);
+CREATE TABLE IF NOT EXISTS permissions (
+    filename TEXT NOT NULL,
+    username TEXT NOT NULL,
+    permission TEXT NOT NULL,
+    UNIQUE (filename, username, permission)
+);
+CREATE INDEX IF NOT EXISTS idx_permissions_user ON permissions (username);
+"""
+
+
+class SQLiteFATTable:
+    """Tabla FAT guardada en SQLite; misma interfaz que FATTableManager.
+
+    Cada entrada es una fila de entries (el resto de sus campos va como JSON
+    en data) y sus permisos son filas de permissions. Guardar un cambio con
+    filename solo reescribe las filas de esa entrada. La caché en memoria se
+    recarga cuando otra conexión confirma cambios (PRAGMA data_version).
+    Las políticas de escritura son las de FATTableManager; 'group' confirma
+    cada cambio de inmediato porque el WAL de SQLite ya agrupa las escrituras.
+    """
+
+    def __init__(self, db_path, write_policy='immediate', batch_size=100, batch_interval=2.0):
+        if write_policy not in WRITE_POLICIES:
+            print(f"Política de escritura inválida: {write_policy}; se usa 'immediate'")
+            write_policy = 'immediate'
+        self.db_path = db_path
+        self.write_policy = write_policy
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.generation = 0
+        # Igual que FATTableManager.damaged; SQLite valida la base al abrirla
+        self.damaged = False
+        # Índices secundarios (dueño, papelera, permisos) al día con la caché
+        self.index = FATIndex()
+        self._lock = threading.RLock()
+        self._connection = None
+        self._table = None
+        self._version = None
+        self._pending = set()
+        self._rewrite_pending = False
+        self._timer = None
+
+    def _get_connection(self):
+        if self._connection is None:
+            self._connection = connect(self.db_path)
+            self._connection.executescript(_SCHEMA)
+        return self._connection
+
+    def _data_version(self):
+        return self._get_connection().execute("PRAGMA data_version").fetchone()[0]
+
+    def _read(self):
+        connection = self._get_connection()
+        fat_table = {}
+        for filename, data in connection.execute("SELECT filename, data FROM entries"):
+            entry = json.loads(data)
+            entry['permissions'] = {}
+            fat_table[filename] = entry
+        for filename, username, permission in connection.execute(
+                "SELECT filename, username, permission FROM permissions ORDER BY rowid"):
+            if filename in fat_table:
+                fat_table[filename]['permissions'].setdefault(username, []).append(permission)
+        return fat_table
+
+    @staticmethod
+    def _write_entry(connection, filename, entry):
+        data = {key: value for key, value in entry.items() if key != 'permissions'}
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (filename, owner, in_recycle_bin, data) VALUES (?, ?, ?, ?)",
+            (filename, entry.get('owner', ''), int(bool(entry.get('in_recycle_bin'))),
+             json.dumps(data, ensure_ascii=False)))
+        connection.execute("DELETE FROM permissions WHERE filename = ?", (filename,))
+        connection.executemany(
+            "INSERT OR IGNORE INTO permissions (filename, username, permission) VALUES (?, ?, ?)",
+            [(filename, username, permission)
+             for username, permissions in entry.get('permissions', {}).items()
+             for permission in permissions])
+
+    def load(self):
+        """Retorna la tabla en memoria, recargándola si otra conexión la modificó"""
+        with self._lock:
+            version = self._data_version()
+            if self._table is None or (version != self._version and not self._pending
+                                       and not self._rewrite_pending):
+                self._table = self._read()
+                self.index.rebuild(self._table)
+                self._version = version
+                self.generation += 1
+            return self._table
+
+    def save(self, fat_table, filename=None):
+        """Registra un cambio; con filename solo se reescriben las filas de esa entrada"""
+        self.save_many(fat_table, None if filename is None else [filename])
+
+    def save_many(self, fat_table, filenames=None):
+        """Registra juntos los cambios de varias entradas (se confirman en una transacción)"""
+        with self._lock:
+            self._table = fat_table
+            if filenames is not None:
+                for filename in filenames:
+                    self.index.update(filename, fat_table.get(filename))
+            else:
+                self.index.rebuild(fat_table)
+            self.generation += 1
+            if filenames is None:
+                self._rewrite_pending = True
+                self._pending = set()
+            elif not self._rewrite_pending:
+                self._pending.update(filenames)
+
+            changes = len(self._pending) + self._rewrite_pending
+            if self.write_policy in ('immediate', 'group') or (
+                    self.write_policy == 'batched' and changes >= self.batch_size):
+                self.flush()
+            elif self.write_policy == 'batched' and self._timer is None:
+                self._timer = threading.Timer(self.batch_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Confirma los cambios pendientes en una sola transacción"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if (not self._pending and not self._rewrite_pending) or self._table is None:
+                return
+
+            connection = self._get_connection()
+            with connection:
+                if self._rewrite_pending:
+                    connection.execute("DELETE FROM entries")
+                    connection.execute("DELETE FROM permissions")
+                    filenames = list(self._table)
+                else:
+                    filenames = self._pending
+                for filename in filenames:
+                    if filename in self._table:
+                        self._write_entry(connection, filename, self._table[filename])
+                    else:
+                        connection.execute("DELETE FROM entries WHERE filename = ?", (filename,))
+                        connection.execute("DELETE FROM permissions WHERE filename = ?", (filename,))
+
+            self._pending = set()
+            self._rewrite_pending = False
+            self._version = self._data_version()
+
+    def checkpoint(self):
+        """Confirma lo pendiente y vuelca el WAL a la base (por ejemplo antes de un backup)"""
+        with self._lock:
+            self.flush()
+            self._get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def recover(self):
+        """SQLite recupera su propio WAL al abrir la base; solo se recarga la caché"""
+        with self._lock:
+            self.invalidate()
+            self.load()
+            return 0
+
+    def invalidate(self):
+        """Descarta la caché (por ejemplo después de restaurar un backup)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._table = None
+            self.index.clear()
+            self._version = None
+            self._pending = set()
+            self._rewrite_pending = False
+            self.generation += 1
+
+    def close(self):
+        """Confirma lo pendiente y cierra la conexión (se reabre al usarla)"""
+        with self._lock:
+            self.flush()
+            if self._connection is not None:
+                self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+
+
+def connect(db_path):
+    """Abre una conexión SQLite en modo WAL que pueden compartir varios hilos"""
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # En WAL, NORMAL solo sincroniza en los checkpoints y sigue siendo consistente
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def remove_database(db_path):
+    """Borra la base y sus archivos auxiliares de WAL"""
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class SQLiteBlockStore:
+    """Guarda los registros binarios de los bloques en una tabla SQLite.
+
+    Tiene la misma interfaz que SegmentStore (put_many, get, contains,
+    delete_many...), así que BlockManager los usa indistintamente. La base
+    trabaja en modo WAL para que los lectores no bloqueen a los escritores.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._connection = None
+        self._get_connection()
+
+    def _get_connection(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            self._connection = connect(self.db_path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS blocks (id TEXT PRIMARY KEY, payload BLOB NOT NULL) WITHOUT ROWID")
+            self._connection.commit()
+        return self._connection
+
+    def put_many(self, items):
+        """Guarda varios registros en una sola transacción"""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO blocks (id, payload) VALUES (?, ?)",
+                    [(str(block_id), bytes(payload)) for block_id, payload in items])
+
+    def put(self, block_id, payload):
+        self.put_many([(block_id, payload)])
+
+    def get(self, block_id):
+        """Retorna el registro del bloque o None si no existe"""
+        with self._lock:
+            row = self._get_connection().execute(
+                "SELECT payload FROM blocks WHERE id = ?", (str(block_id),)).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def contains(self, block_id):
+        with self._lock:
+            return self._get_connection().execute(
+                "SELECT 1 FROM blocks WHERE id = ?", (str(block_id),)).fetchone() is not None
+
+    def delete_many(self, block_ids):
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.executemany("DELETE FROM blocks WHERE id = ?",
+                                       [(str(block_id),) for block_id in block_ids])
+
+    def delete(self, block_id):
+        self.delete_many([block_id])
+
+    def ids(self):
+        """Ids de todos los registros guardados"""
+        with self._lock:
+            return [row[0] for row in self._get_connection().execute("SELECT id FROM blocks")]
+
+    def stats(self):
+        with self._lock:
+            blocks, live_bytes = self._get_connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM blocks").fetchone()
+        return {
+            'blocks': blocks,
+            'live_bytes': live_bytes,
+            'db_bytes': sum(os.path.getsize(path) for path in (self.db_path, self.db_path + "-wal")
+                            if os.path.exists(path))
+        }
+
+    def refresh(self):
+        """SQLite ya ve los cambios de otros procesos: no hay estado que recargar"""
+
+    def close(self):
+        """Vuelca el WAL a la base y cierra la conexión (se reabre al usarla)"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._connection.close()
+                self._connection = None
+
+    def reload(self):
+        self.close()
+
+    def destroy(self):
+        """Cierra el almacenamiento y borra sus archivos"""
+        with self._lock:
+            self.close()
+            remove_database(self.db_path)
@@ -0,0 +1,170 @@
+"""Herramientas de mantenimiento del volumen FAT.
+
+Uso:
+    python tools.py migrate-segments
+    python tools.py compact-segments
+    python tools.py dedup-stats
+    python tools.py migrate-backend [--metadata json|sqlite|sharded] [--blocks json|segment|sqlite]
+    python tools.py convert-table --to json|binary
+    python tools.py reshard --shards N
+    python tools.py shard-stats
+    python tools.py migrate-binaries
+    python tools.py migrate-large-files
+    python tools.py chunk-stats
+"""
+import argparse
+from fat_system import FATFileSystem
+
+
+def migrate_segments(args):
+    """Convierte data/blocks/*.json en segmentos y activa el modo segmento"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.migrate_to_segments()
+    if success:
+        stats = system.block_manager.record_store.stats()
+        message += f"\nSegmentos: {stats['segments']} • Bytes: {stats['live_bytes']}"
+    system.close()
+    print(message)
+
+
+def compact_segments(args):
+    """Reescribe los segmentos sin el espacio de los bloques modificados o eliminados"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.compact_segments()
+    system.close()
+    print(message)
+
+
+def dedup_stats(args):
+    """Muestra cuánto espacio ahorra la deduplicación de bloques"""
+    system = FATFileSystem()
+    stats = system.block_manager.dedup_stats()
+    system.block_manager.close()
+
+    print(f"Bloques únicos: {stats['unique_blocks']} • Referencias: {stats['references']}")
+    print(f"Caracteres lógicos: {stats['logical_chars']} • Guardados: {stats['stored_chars']}")
+    print(f"Ratio de deduplicación: {stats['dedup_ratio']:.2f}x • Ahorro: {stats['chars_saved']} caracteres")
+    print(f"Escrituras evitadas: {stats['writes_skipped']} de {stats['writes_skipped'] + stats['objects_written']}")
+
+
+def migrate_backend(args):
+    """Pasa la tabla FAT y/o los bloques a otro backend de almacenamiento"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.migrate_backend(args.metadata, args.blocks)
+    system.close()
+    print(message)
+
+
+def convert_table(args):
+    """Convierte la tabla FAT entre JSON y el formato binario compacto"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.convert_table_format(args.to)
+    system.close()
+    print(message)
+
+
+def reshard(args):
+    """Cambia la cantidad de shards de la tabla FAT (el volumen puede seguir en uso)"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.reshard(args.shards)
+    system.close()
+    print(message)
+
+
+def shard_stats(args):
+    """Muestra cuántas entradas y bytes tiene cada shard de la tabla FAT"""
+    system = FATFileSystem()
+    if system.config['metadata_backend'] != 'sharded':
+        print("La tabla FAT no está repartida en shards")
+        return
+    stats = system.fat_table_manager.stats()
+    system.close()
+
+    for shard in stats:
+        print(f"Shard {shard['shard']:>3}: {shard['entries']:>8} entradas • {shard['bytes']:>10} bytes")
+    entries = [shard['entries'] for shard in stats]
+    print(f"Total: {sum(entries)} entradas en {len(stats)} shards (mín {min(entries)}, máx {max(entries)})")
+
+
+def migrate_binaries(args):
+    """Reescribe como blobs de bytes los binarios pequeños guardados en base64"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.migrate_binaries()
+    system.close()
+    print(message)
+
+
+def migrate_large_files(args):
+    """Corta en trozos por contenido los archivos grandes guardados enteros"""
+    system = FATFileSystem()
+    system.initialize_system()
+    success, message = system.migrate_large_files()
+    system.close()
+    print(message)
+
+
+def chunk_stats(args):
+    """Muestra cuántos trozos de archivos grandes se comparten entre versiones y archivos"""
+    system = FATFileSystem()
+    stats = system.chunk_stats()
+    system.close()
+
+    print(f"Trozos únicos: {stats['unique_chunks']} • Referencias: {stats['references']}")
+    print(f"Bytes lógicos: {stats['logical_bytes']} • Guardados: {stats['stored_bytes']} • Compartidos: {stats['bytes_saved']}")
+    print(f"Trozos escritos: {stats['chunks_written']} ({stats['bytes_written']} bytes) • "
+          f"Reutilizados: {stats['chunks_reused']} ({stats['bytes_reused']} bytes)")
+    print(f"Reutilización en escrituras: {stats['write_reuse_ratio']:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Herramientas del sistema de archivos FAT")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate-segments",
+                          help="Convierte los bloques JSON en archivos de segmento").set_defaults(func=migrate_segments)
+
+    subparsers.add_parser("compact-segments",
+                          help="Recupera el espacio muerto de los segmentos").set_defaults(func=compact_segments)
+
+    subparsers.add_parser("dedup-stats",
+                          help="Estadísticas de deduplicación de bloques").set_defaults(func=dedup_stats)
+
+    migrate = subparsers.add_parser("migrate-backend",
+                                    help="Cambia el backend de la tabla FAT y/o de los bloques")
+    migrate.add_argument("--metadata", choices=["json", "sqlite", "sharded"])
+    migrate.add_argument("--blocks", choices=["json", "segment", "sqlite"])
+    migrate.set_defaults(func=migrate_backend)
+
+    convert = subparsers.add_parser("convert-table",
+                                    help="Convierte la tabla FAT entre JSON y binario")
+    convert.add_argument("--to", choices=["json", "binary"], required=True)
+    convert.set_defaults(func=convert_table)
+
+    reshard_parser = subparsers.add_parser("reshard", help="Cambia la cantidad de shards de la tabla FAT")
+    reshard_parser.add_argument("--shards", type=int, required=True)
+    reshard_parser.set_defaults(func=reshard)
+
+    subparsers.add_parser("shard-stats",
+                          help="Entradas y bytes por shard de la tabla FAT").set_defaults(func=shard_stats)
+
+    subparsers.add_parser("migrate-binaries",
+                          help="Pasa los binarios en base64 a blobs de bytes").set_defaults(func=migrate_binaries)
+
+    subparsers.add_parser("migrate-large-files",
+                          help="Corta en trozos los archivos grandes").set_defaults(func=migrate_large_files)
+
+    subparsers.add_parser("chunk-stats",
+                          help="Reutilización de trozos de archivos grandes").set_defaults(func=chunk_stats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()